@@ -1,32 +1,82 @@
-def role_required(required_roles):
-    def decorator(fn):
-        @jwt_required()
-        def wrapper(*args, **kwargs):
-            claims = get_jwt()
-            user_roles = claims.get('roles', [])
-            if any(role in user_roles for role in required_roles):
-                return fn(*args, **kwargs)
-            return jsonify({"msg": "Accès refusé : rôle requis"}), 403
-        wrapper.__name__ = fn.__name__
-        return wrapper
-    return decorator
-
-
-from flask import Flask, request, jsonify, g, url_for
+from flask import Flask, request, jsonify, g, url_for, Response, stream_with_context
 from flask_swagger_ui import get_swaggerui_blueprint
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
-from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update, func, case
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import selectinload
 import os
+import sys
 import inspect
+import json
+import tempfile
+import secrets
+import shutil
+from datetime import datetime, timedelta, timezone
+
+# Modules voisins (store, ...) importables que l'app soit lancée depuis genseqdid/ ou importée comme genseqdid.app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from store import Collection, SqlBackend, sync_collections
+from audit import AuditLog
+# Décodage unique du JWT par requête (claims sur g, cache des tokens vérifiés) et décorateurs de rôles
+from auth import jwt_required, role_required, get_jwt, optional_claims
+from search_index import InvertedIndex, tokenize
+from stats import CorpusStats
+from response_cache import ResponseCache
+from pagination import page_size_arg, paginate, SortedKeys, sort_arg, sort_key, fields_arg, project, decode_cursor, encode_cursor, MAX_PAGE_SIZE
+from live import SessionHub
+from jobs import JobQueue, JobQueueFull
+from passwords import PasswordHasher, PasswordHasherBusy
+from metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from pdf_export import PdfExporter
+from summarize import Summarizer, DEFAULT_SENTENCES as SUMMARY_SENTENCES, MAX_SENTENCES as MAX_SUMMARY_SENTENCES
+from quiz import QuizGenerator, default_dictionary_paths, MAX_QUESTIONS
+from recommend import SuggestionEngine
+from similarity import TermMatrix, MinHashIndex, record_tokens, METRICS as SIMILARITY_METRICS
+from translation import Translator, http_backend, mock_backend, SOURCES as TRANSLATION_SOURCES
+from middleware import Pipeline, negotiate_language
+from webhooks import WebhookDispatcher, OUTCOMES as WEBHOOK_OUTCOMES, DEAD as WEBHOOK_DEAD
+from snapshot import SnapshotReader, SnapshotError, write_snapshot, diff_records, COMPRESSIONS as SNAPSHOT_COMPRESSIONS
+from csv_io import fieldnames, iter_csv, read_batches, MAX_REPORTED_ERRORS
 
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'dev_secret_key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///genseqdid.db'
+# Jetons d'accès courts, renouvelés via /api/auth/refresh sans nouvelle vérification du mot de passe
+app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=int(os.environ.get('JWT_ACCESS_MINUTES', 15)))
+app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(hours=int(os.environ.get('JWT_REFRESH_HOURS', 8)))
+# DATABASE_URL permet de partager la base entre plusieurs workers/nœuds (ex. PostgreSQL)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///genseqdid.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 jwt = JWTManager(app)
-bcrypt = Bcrypt(app)
+# bcrypt dans un pool de processus : les connexions en rafale ne bloquent plus les autres requêtes
+password_hasher = PasswordHasher(
+    workers=int(os.environ['PASSWORD_HASH_WORKERS']) if 'PASSWORD_HASH_WORKERS' in os.environ else None,
+    rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12)
+)
 db = SQLAlchemy(app)
+# Réponses GET en cache (ETag / 304), invalidées par les écritures sur les collections suivies
+response_cache = ResponseCache()
+# Générateurs d'administration exécutés en arrière-plan (voir /api/jobs)
+jobs = JobQueue(workers=int(os.environ.get('JOB_WORKERS', 2)))
+# Traductions : mémoire en base + LRU avant le moteur (TRANSLATION_BACKEND_URL, sinon moteur de démonstration)
+MAX_TRANSLATE_CHARS = 20000
+translator = Translator(
+    backend=http_backend(os.environ['TRANSLATION_BACKEND_URL']) if os.environ.get('TRANSLATION_BACKEND_URL') else mock_backend,
+    fuzzy_threshold=float(os.environ.get('TRANSLATION_FUZZY_THRESHOLD', 0.9))
+)
+# Webhooks sortants vers les intégrations (LMS...) : envoi groupé en arrière-plan, voir /api/admin/webhooks
+webhook_dispatcher = WebhookDispatcher(
+    batch_size=int(os.environ.get('WEBHOOK_BATCH_SIZE', 50)),
+    max_attempts=int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 10)),
+    interval=float(os.environ.get('WEBHOOK_INTERVAL', 1.0)),
+    timeout=float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+)
+# Compteurs et latences par endpoint, exposés sur /metrics (format Prometheus)
+metrics = Metrics()
+metrics.init_app(app)
+# Hooks before_request de l'application, en un seul passage ordonné (voir middleware.py)
+pipeline = Pipeline()
+pipeline.init_app(app)
 
 # --- Génération dynamique OpenAPI ---
 def generate_openapi_spec():
@@ -61,8 +111,10 @@ def generate_openapi_spec():
 
 # Endpoint pour fournir le schéma OpenAPI dynamique
 @app.route('/openapi.json')
+@response_cache.cached()
 def openapi_spec():
-    return jsonify(generate_openapi_spec())
+    # Spécification générée une seule fois, une fois toutes les routes déclarées (voir fin du module)
+    return jsonify(openapi_document)
 
 
 
@@ -98,7 +150,6 @@ def test_dynamic_doc():
 @app.route('/api/admin/generate-multilang-examples', methods=['POST'])
 @role_required(['admin'])
 def generate_multilang_examples():
-    global sequences, next_sequence_id, internet_resources
     exemples = [
         # Maya
         {"titulo": "U yookotil k'iimil", "modalidad": "en ligne", "niveau": "A1", "theme": "salutations", "langue": "maya", "dialecte": "yucatèque", "contexte_culturel": "communautaire", "support_audio": None, "support_video": None},
@@ -111,14 +162,11 @@ def generate_multilang_examples():
         # Italien
         {"titulo": "Sequenza di saluti", "modalidad": "presenziale", "niveau": "A2", "theme": "saluti", "langue": "it", "dialecte": "", "contexte_culturel": "scolastico", "support_audio": None, "support_video": None}
     ]
-    for ex in exemples:
-        ex["id"] = next_sequence_id
-        sequences.append(ex)
-        next_sequence_id += 1
+    sequences.extend(exemples)
     # Exemples ressources
     res_ex = [
-        {"id": str(len(internet_resources) + 1), "title": "Audio maya", "description": "Enregistrement natif maya", "url": "http://example.com/maya-audio", "date": "2025-07-16", "content": "Audio maya", "type": "audio", "theme": "salutations", "niveau": "A1", "langue": "maya", "dialecte": "yucatèque", "contexte_culturel": "communautaire", "support_audio": "http://example.com/maya-audio.mp3", "support_video": None},
-        {"id": str(len(internet_resources) + 2), "title": "Vidéo présentation FR", "description": "Vidéo de présentation en français", "url": "http://example.com/fr-video", "date": "2025-07-16", "content": "Vidéo FR", "type": "video", "theme": "présentation", "niveau": "A2", "langue": "fr", "dialecte": "", "contexte_culturel": "scolaire", "support_audio": None, "support_video": "http://example.com/fr-video.mp4"}
+        {"id": None, "title": "Audio maya", "description": "Enregistrement natif maya", "url": "http://example.com/maya-audio", "date": "2025-07-16", "content": "Audio maya", "type": "audio", "theme": "salutations", "niveau": "A1", "langue": "maya", "dialecte": "yucatèque", "contexte_culturel": "communautaire", "support_audio": "http://example.com/maya-audio.mp3", "support_video": None},
+        {"id": None, "title": "Vidéo présentation FR", "description": "Vidéo de présentation en français", "url": "http://example.com/fr-video", "date": "2025-07-16", "content": "Vidéo FR", "type": "video", "theme": "présentation", "niveau": "A2", "langue": "fr", "dialecte": "", "contexte_culturel": "scolaire", "support_audio": None, "support_video": "http://example.com/fr-video.mp4"}
     ]
     internet_resources.extend(res_ex)
     return jsonify({"message": "Exemples multilingues injectés."})
@@ -189,68 +237,115 @@ TRANSLATIONS = {
     }
 }
 
+SUPPORTED_LANGUAGES = tuple(LANGUAGES)
+
+# Langue courante : ?lang= prioritaire, sinon négociation Accept-Language (q-values, mémoïsée).
+# Résolue à la première traduction seulement, puis gardée sur g pour la requête
 def get_lang():
-    lang = request.args.get('lang') or request.headers.get('Accept-Language', 'fr').split(',')[0]
-    if lang not in LANGUAGES:
-        lang = 'fr'
-    g.lang = lang
+    lang = g.get('lang')
+    if lang is None:
+        lang = request.args.get('lang')
+        if lang not in SUPPORTED_LANGUAGES:
+            lang = negotiate_language(request.headers.get('Accept-Language', ''), SUPPORTED_LANGUAGES, 'fr')
+        g.lang = lang
     return lang
 
 def t(key):
-    lang = getattr(g, 'lang', 'fr')
-    return TRANSLATIONS.get(lang, TRANSLATIONS['fr']).get(key, key)
-
-# Middleware pour définir la langue courante
-@app.before_request
-def set_language():
-    get_lang()
-# Audit/logging avancé (historique, traçabilité, sécurité, mock)
-audit_log = []
-
-@app.before_request
+    return TRANSLATIONS.get(get_lang(), TRANSLATIONS['fr']).get(key, key)
+# Audit/logging avancé (historique, traçabilité, sécurité)
+# Les derniers événements restent en mémoire (tampon borné), l'historique complet est
+# ajouté par lots à un fichier JSON Lines par un thread d'écriture
+os.makedirs(app.instance_path, exist_ok=True)
+audit_log = AuditLog(
+    path=os.environ.get('AUDIT_LOG_FILE', os.path.join(app.instance_path, 'audit.log')),
+    capacity=int(os.environ.get('AUDIT_LOG_CAPACITY', 1000))
+)
 
-def log_request():
-    from datetime import datetime
-    user = 'public'
-    try:
-        # N'essaie de lire le JWT que si ce n'est pas un endpoint public
-        if request.endpoint not in ['status', 'api_version', 'openapi_spec', 'list_endpoints', 'demo_token', 'static', 'swaggerui.blueprint', 'swaggerui.static']:
-            from flask_jwt_extended import verify_jwt_in_request, get_jwt
-            verify_jwt_in_request(optional=True)
-            claims = get_jwt()
-            user = claims.get('username', 'anonyme') if claims else 'public'
-    except Exception:
-        user = 'public'
-    audit_log.append({
+@app.after_request
+def log_request(response):
+    # Claims déjà décodés pour la requête (ou servis par le cache des tokens vérifiés)
+    claims = optional_claims()
+    user = claims.get('username', 'anonyme') if claims else 'public'
+    audit_log.record({
         "time": datetime.utcnow().isoformat(),
         "endpoint": request.path,
         "method": request.method,
-        "user": user
+        "user": user,
+        "status": response.status_code
     })
+    return response
 
 @app.route('/api/admin/audit-log', methods=['GET'])
 @role_required(['admin'])
 def get_audit_log():
-    return jsonify(audit_log[-100:])  # Derniers 100 événements
-# Sessions de travail collaboratives (multi-utilisateurs, chat, mock)
-sessions = {}
+    try:
+        limit = max(1, int(request.args.get('limit', 100)))
+    except (TypeError, ValueError):
+        limit = 100
+    return jsonify(audit_log.recent(limit))  # Derniers événements (100 par défaut)
+# Sessions de travail collaboratives (multi-utilisateurs, chat), persistées en base
+# Historique conservé par session (les plus anciens messages sont compactés par lots)
+SESSION_HISTORY = int(os.environ.get('SESSION_HISTORY', 500))
+SESSION_COMPACT_EVERY = 50
+
+def _find_session(session_id):
+    return db.session.get(WorkSession, str(session_id))
+
+def _session_users(work_session):
+    return [m.username for m in SessionMember.query.filter_by(session_id=work_session.id).order_by(SessionMember.id)]
+
+def _session_messages(session_id, since=0):
+    query = SessionMessage.query.filter(SessionMessage.session_id == session_id, SessionMessage.seq > since)
+    return [{"seq": m.seq, "user": m.user, "message": m.message} for m in query.order_by(SessionMessage.seq)]
+
+def _add_session_message(work_session, user, text):
+    # Le compteur de la session est incrémenté en base : les numéros restent uniques entre workers
+    db.session.execute(update(WorkSession).where(WorkSession.id == work_session.id)
+                       .values(last_seq=WorkSession.last_seq + 1))
+    seq = db.session.scalar(select(WorkSession.last_seq).where(WorkSession.id == work_session.id))
+    db.session.add(SessionMessage(session_id=work_session.id, seq=seq, user=user, message=text))
+    if seq % SESSION_COMPACT_EVERY == 0 and seq > SESSION_HISTORY:
+        SessionMessage.query.filter(SessionMessage.session_id == work_session.id,
+                                    SessionMessage.seq <= seq - SESSION_HISTORY).delete(synchronize_session=False)
+    db.session.commit()
+    return {"seq": seq, "user": user, "message": text}
+
+def _fetch_session_messages(session_id, since):
+    # Appelé pendant un flux SSE : la connexion est rendue au pool après chaque lecture
+    try:
+        return _session_messages(session_id, since)
+    finally:
+        db.session.close()
+
+session_hub = SessionHub(_fetch_session_messages, history=min(SESSION_HISTORY, 200))
+
+def _since_arg():
+    try:
+        return max(0, int(request.args.get('since') or request.headers.get('Last-Event-ID') or 0))
+    except ValueError:
+        return 0
 
 @app.route('/api/session', methods=['POST'])
 @jwt_required()
 def create_session():
     data = request.get_json() or {}
-    session_id = str(len(sessions) + 1)
-    sessions[session_id] = {"users": [get_jwt().get('username', 'anonyme')], "messages": []}
-    return jsonify({"session_id": session_id})
+    work_session = WorkSession()
+    db.session.add(work_session)
+    db.session.flush()
+    db.session.add(SessionMember(session_id=work_session.id, username=get_jwt().get('username', 'anonyme')))
+    db.session.commit()
+    return jsonify({"session_id": work_session.id})
 
 @app.route('/api/session/<session_id>/join', methods=['POST'])
 @jwt_required()
 def join_session(session_id):
     user = get_jwt().get('username', 'anonyme')
-    if session_id in sessions:
-        if user not in sessions[session_id]["users"]:
-            sessions[session_id]["users"].append(user)
-        return jsonify({"session_id": session_id, "users": sessions[session_id]["users"]})
+    work_session = _find_session(session_id)
+    if work_session is not None:
+        if not SessionMember.query.filter_by(session_id=work_session.id, username=user).first():
+            db.session.add(SessionMember(session_id=work_session.id, username=user))
+            db.session.commit()
+        return jsonify({"session_id": session_id, "users": _session_users(work_session)})
     return jsonify({"error": "Session inconnue."}), 404
 
 @app.route('/api/session/<session_id>/message', methods=['POST'])
@@ -258,17 +353,38 @@ def join_session(session_id):
 def send_message(session_id):
     user = get_jwt().get('username', 'anonyme')
     msg = request.get_json().get('message')
-    if session_id in sessions:
-        sessions[session_id]["messages"].append({"user": user, "message": msg})
-        return jsonify({"session_id": session_id, "messages": sessions[session_id]["messages"]})
+    work_session = _find_session(session_id)
+    if work_session is not None:
+        message = _add_session_message(work_session, user, msg)
+        session_hub.publish(work_session.id, message)
+        # Seuls les messages postérieurs à ?since= sont renvoyés (le message envoyé par défaut)
+        since = _since_arg() if 'since' in request.args else message['seq'] - 1
+        return jsonify({"session_id": session_id, "seq": message['seq'],
+                        "messages": _session_messages(work_session.id, since)})
     return jsonify({"error": "Session inconnue."}), 404
 
 @app.route('/api/session/<session_id>', methods=['GET'])
 @jwt_required()
 def get_session(session_id):
-    if session_id in sessions:
-        return jsonify(sessions[session_id])
+    work_session = _find_session(session_id)
+    if work_session is not None:
+        # ?since=<seq> : uniquement les messages reçus depuis (historique borné à SESSION_HISTORY)
+        return jsonify({"users": _session_users(work_session), "last_seq": work_session.last_seq,
+                        "messages": _session_messages(work_session.id, _since_arg())})
     return jsonify({"error": "Session inconnue."}), 404
+
+# Flux SSE des messages d'une session (reprise via ?since= ou l'en-tête Last-Event-ID)
+@app.route('/api/session/<session_id>/events', methods=['GET'])
+@jwt_required()
+def session_events(session_id):
+    work_session = _find_session(session_id)
+    if work_session is None:
+        return jsonify({"error": "Session inconnue."}), 404
+    key, since = work_session.id, _since_arg()
+    db.session.close()
+    stream = session_hub.stream(key, since)
+    return Response(stream_with_context(stream), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 # API webhook (notifications externes, intégration LMS, mock)
 @app.route('/api/webhook', methods=['POST'])
 def webhook():
@@ -276,56 +392,130 @@ def webhook():
     # Mock : log l'événement
     print(f"Webhook reçu : {event}")
     return jsonify({"message": f"Webhook '{event}' reçu."})
-# Gestion collaborative avancée (édition, validation, workflow, mock)
-collab_status = {}
+
+# Abonnements aux webhooks sortants : "events" liste des types ("sequence.upserted") ou des
+# familles ("sequence", "resource") ; vide = tous. Les lots sont signés (HMAC-SHA256) si "secret" est fourni
+def _webhook_subscription_json(subscription):
+    return {"id": subscription.id, "url": subscription.url, "events": subscription.events or [],
+            "active": subscription.active, "signed": bool(subscription.secret)}
+
+@app.route('/api/admin/webhooks', methods=['GET'])
+@role_required(['admin'])
+def list_webhooks():
+    subscriptions = WebhookSubscription.query.order_by(WebhookSubscription.id)
+    return jsonify([_webhook_subscription_json(s) for s in subscriptions])
+
+@app.route('/api/admin/webhooks', methods=['POST'])
+@role_required(['admin'])
+def create_webhook():
+    data = request.get_json() or {}
+    url = data.get('url')
+    if not isinstance(url, str) or not url.startswith(('http://', 'https://')) or len(url) > 500:
+        return jsonify({"error": "Champ 'url' invalide (http:// ou https://)."}), 400
+    events = data.get('events') or []
+    if not isinstance(events, list) or not all(isinstance(e, str) for e in events):
+        return jsonify({"error": "Champ 'events' invalide (liste de types d'événements)."}), 400
+    subscription = WebhookSubscription(url=url, events=events, secret=data.get('secret') or None,
+                                       created_by=get_jwt().get('username'))
+    db.session.add(subscription)
+    db.session.commit()
+    return jsonify(_webhook_subscription_json(subscription)), 201
+
+@app.route('/api/admin/webhooks/<int:subscription_id>', methods=['DELETE'])
+@role_required(['admin'])
+def delete_webhook(subscription_id):
+    subscription = db.session.get(WebhookSubscription, subscription_id)
+    if subscription is None:
+        return jsonify({"error": "Abonnement inconnu."}), 404
+    WebhookDelivery.query.filter_by(subscription_id=subscription_id).delete(synchronize_session=False)
+    db.session.delete(subscription)
+    db.session.commit()
+    return jsonify({"message": "Abonnement supprimé."})
+
+# Lettres mortes : événements abandonnés après WEBHOOK_MAX_ATTEMPTS tentatives
+@app.route('/api/admin/webhooks/dead-letters', methods=['GET'])
+@role_required(['admin'])
+def webhook_dead_letters():
+    try:
+        limit = min(max(1, int(request.args.get('limit', 100))), 1000)
+    except (TypeError, ValueError):
+        limit = 100
+    rows = WebhookDelivery.query.filter_by(status=WEBHOOK_DEAD).order_by(WebhookDelivery.id).limit(limit)
+    return jsonify([{"id": r.id, "event_id": r.event_id, "subscription_id": r.subscription_id, "event": r.event, "attempts": r.attempts,
+                     "last_error": r.last_error, "created_at": r.created_at.isoformat()} for r in rows])
+
+@app.route('/api/admin/webhooks/dead-letters/retry', methods=['POST'])
+@role_required(['admin'])
+def retry_webhook_dead_letters():
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"error": "Champ 'ids' invalide (liste d'identifiants)."}), 400
+    return jsonify({"requeued": webhook_dispatcher.retry_dead(ids)})
+
+@app.route('/api/admin/webhooks/stats', methods=['GET'])
+@role_required(['admin'])
+def webhook_stats():
+    by_status = dict(db.session.execute(select(WebhookDelivery.status, func.count())
+                                        .group_by(WebhookDelivery.status)).all())
+    return jsonify({"queued": by_status, **{outcome: webhook_dispatcher.counts[outcome] for outcome in WEBHOOK_OUTCOMES}})
+# Gestion collaborative avancée (édition, validation, workflow)
+def _set_workflow_status(id, status):
+    db.session.merge(SequenceStatus(sequence_id=id, status=status))
+    db.session.commit()
 
 @app.route('/api/sequences/<int:id>/validate', methods=['POST'])
 @role_required(['admin', 'enseignant'])
 def validate_sequence(id):
-    collab_status[id] = 'validée'
+    _set_workflow_status(id, 'validée')
     return jsonify({"id": id, "status": "validée"})
 
 @app.route('/api/sequences/<int:id>/edit', methods=['POST'])
 @role_required(['admin', 'enseignant'])
 def edit_sequence(id):
-    collab_status[id] = 'en édition'
+    _set_workflow_status(id, 'en édition')
     return jsonify({"id": id, "status": "en édition"})
 
 @app.route('/api/sequences/<int:id>/workflow', methods=['GET'])
 @jwt_required()
 def get_sequence_workflow(id):
-    status = collab_status.get(id, 'brouillon')
+    row = db.session.get(SequenceStatus, id)
+    status = row.status if row else 'brouillon'
     return jsonify({"id": id, "workflow_status": status})
-# Génération de synthèses/export PDF multi-séquences (mock)
+# Export PDF multi-séquences : pages de chaque séquence en cache selon son contenu
+MAX_EXPORT_SEQUENCES = 1000
+pdf_exporter = PdfExporter(cache_size=int(os.environ.get('PDF_CACHE_SIZE', 2048)))
+
 @app.route('/api/export-pdf', methods=['POST'])
 @jwt_required()
 def export_pdf():
-    ids = request.get_json().get('ids', [])
-    selected = [seq for seq in sequences if seq.get('id') in ids]
-    # Mock : retourne une synthèse texte
-    content = '\n\n'.join([f"Séquence {seq.get('id')}: {seq.get('titulo')} ({seq.get('modalidad')})" for seq in selected])
-    return content, 200, {'Content-Type': 'text/plain'}
+    """Export PDF des séquences ``ids`` (une nouvelle page par séquence), envoyé en flux"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids', [])
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids doit être une liste"}), 400
+    if len(ids) > MAX_EXPORT_SEQUENCES:
+        return jsonify({"error": f"{MAX_EXPORT_SEQUENCES} séquences au maximum par export"}), 400
+    # Ordre de la demande conservé, doublons ignorés
+    seen, selected = set(), []
+    for id in ids:
+        key = sequences.key(id)
+        if key in seen:
+            continue
+        seen.add(key)
+        seq = sequences.get(key)
+        if seq is not None:
+            selected.append(seq)
+    if not selected:
+        return jsonify({"error": "Aucune séquence trouvée"}), 404
+    title = data.get('title') if isinstance(data.get('title'), str) else "Séquences didactiques"
+    return Response(stream_with_context(pdf_exporter.stream(selected, title=title)), mimetype='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename="sequences.pdf"'})
 # Analyse de corpus (statistiques linguistiques avancées, mock)
 @app.route('/api/corpus-analysis', methods=['GET'])
 @jwt_required()
 def corpus_analysis():
-    from collections import Counter
-    # Concatène tous les contenus
-    texts = []
-    for seq in sequences:
-        if 'description' in seq:
-            texts.append(seq['description'])
-    for res in internet_resources:
-        if 'content' in res:
-            texts.append(res['content'])
-    words = ' '.join(texts).lower().split()
-    word_counts = Counter(words)
-    most_common = word_counts.most_common(10)
-    return jsonify({
-        "total_words": len(words),
-        "unique_words": len(word_counts),
-        "most_common": most_common
-    })
+    # Fréquences maintenues à chaque écriture sur les descriptions et contenus (voir corpus_stats)
+    return jsonify(corpus_stats.corpus())
 # Génération de plans de progression personnalisés selon le profil utilisateur (mock)
 @app.route('/api/progression-plan', methods=['GET'])
 @jwt_required()
@@ -352,52 +542,66 @@ def progression_plan():
 @jwt_required()
 def semantic_search():
     data = request.get_json() or {}
-    query = data.get('query', '').lower()
-    results = []
-    # Recherche fuzzy sur séquences
-    for seq in sequences:
-        if query in str(seq).lower():
-            results.append({"type": "sequence", "item": seq})
-    # Recherche fuzzy sur ressources
-    for res in internet_resources:
-        if query in str(res).lower():
-            results.append({"type": "resource", "item": res})
-    return jsonify(results)
+    query = data.get('query', '')
+    page_size = page_size_arg(data.get('page_size'))
+    # Index inversé (BM25) sur séquences et ressources, trié par score décroissant
+    hits = search_index.search(query)
+    try:
+        page, next_cursor = paginate(hits, key=lambda hit: (-hit[0], hit[1][0], hit[1][1]),
+                                     cursor=data.get('cursor'), page_size=page_size)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    collections = {"sequence": sequences, "resource": internet_resources}
+    results = [{"type": kind, "item": collections[kind].get(id), "score": round(score, 4)}
+               for score, (kind, id) in page]
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 # Génération de feedback automatique sur une séquence ou ressource (mock)
 @app.route('/api/sequences/<int:id>/feedback', methods=['GET'])
 @jwt_required()
 def sequence_feedback(id):
-    for seq in sequences:
-        if seq.get('id') == id:
-            feedback = f"Séquence '{seq.get('titulo')}' : niveau {seq.get('niveau', 'inconnu')}, thème {seq.get('theme', 'inconnu')}. Bonne structuration."
-            return jsonify({"feedback": feedback})
+    seq = sequences.get(id)
+    if seq is not None:
+        feedback = f"Séquence '{seq.get('titulo')}' : niveau {seq.get('niveau', 'inconnu')}, thème {seq.get('theme', 'inconnu')}. Bonne structuration."
+        return jsonify({"feedback": feedback})
     return jsonify({"message": "Secuencia no encontrada"}), 404
 
 @app.route('/api/internet/resources/<string:id>/feedback', methods=['GET'])
 @jwt_required()
 def resource_feedback(id):
-    for res in internet_resources:
-        if res.get('id') == id:
-            feedback = f"Ressource '{res.get('title')}' : type {res.get('type', 'inconnu')}, thème {res.get('theme', 'inconnu')}. Utile pour l'apprentissage."
-            return jsonify({"feedback": feedback})
+    res = internet_resources.get(id)
+    if res is not None:
+        feedback = f"Ressource '{res.get('title')}' : type {res.get('type', 'inconnu')}, thème {res.get('theme', 'inconnu')}. Utile pour l'apprentissage."
+        return jsonify({"feedback": feedback})
     return jsonify({"message": "Resource not found"}), 404
-# Génération de quiz/activités à partir d’un texte libre (mock)
+# Génération de quiz/activités à partir du contenu : quiz gardés en cache selon l'empreinte du contenu
+quiz_generator = QuizGenerator(
+    dictionary_paths=[p for p in os.environ.get('QUIZ_DICTIONARIES', '').split(os.pathsep) if p] or default_dictionary_paths(),
+    cache_size=int(os.environ.get('QUIZ_CACHE_SIZE', 1024)))
+
+def _quiz_args(default=5):
+    """(nombre de questions, variante) depuis la requête"""
+    try:
+        count = min(max(1, int(request.args.get('count', default))), MAX_QUESTIONS)
+    except (TypeError, ValueError):
+        count = default
+    try:
+        variant = max(0, int(request.args.get('variant', 0)))
+    except (TypeError, ValueError):
+        variant = 0
+    return count, variant
+
 @app.route('/api/quiz-from-text', methods=['POST'])
 @jwt_required()
 def quiz_from_text():
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     text = data.get('text', '')
-    if not text:
+    if not text or not isinstance(text, str):
         return jsonify({"error": "Texte requis."}), 400
-    # Mock : génère 3 questions sur le texte
-    quiz = {
-        "questions": [
-            {"q": f"Quel est le thème principal du texte ?", "type": "ouverte"},
-            {"q": f"Combien de mots contient le texte ?", "type": "ouverte", "answer": len(text.split())},
-            {"q": f"Citez un mot du texte de plus de 6 lettres.", "type": "ouverte"}
-        ]
-    }
-    return jsonify(quiz)
+    count, variant = _quiz_args()
+    return jsonify(quiz_generator.quiz_from_text(text, count=count, variant=variant))
 # Extraction automatique de mots-clés/thèmes d’un texte (mock)
 @app.route('/api/keywords', methods=['POST'])
 @jwt_required()
@@ -426,51 +630,255 @@ def similarity():
     else:
         score = len(set1 & set2) / len(set1 | set2)
     return jsonify({"similarity": round(score, 3)})
+
+# Similarité par lots : une requête contre plusieurs éléments, ou toutes les paires d'un ensemble
+MAX_SIMILARITY_ITEMS = 10000
+MAX_PAIRWISE_ITEMS = 2000
+
+def _similarity_items(data):
+    """(étiquettes, listes de mots) des éléments comparés : textes fournis ou enregistrements d'une collection."""
+    if 'items' in data:
+        items = data['items']
+        if not isinstance(items, list) or not all(isinstance(text, str) for text in items):
+            raise ValueError("items doit être une liste de textes")
+        return list(range(len(items))), [tokenize(text) for text in items]
+    collection = {'sequences': sequences, 'resources': internet_resources}.get(data.get('kind', 'sequences'))
+    if collection is None:
+        raise ValueError("kind doit valoir 'sequences' ou 'resources'")
+    if 'ids' in data:
+        if not isinstance(data['ids'], list):
+            raise ValueError("ids doit être une liste")
+        records = [r for r in (collection.get(id) for id in dict.fromkeys(data['ids'])) if r is not None]
+    else:
+        criteria = data.get('filter') or {}
+        if not isinstance(criteria, dict):
+            raise ValueError("filter doit être un objet")
+        records = collection.filter(**criteria)
+    return [r['id'] for r in records], [record_tokens(r) for r in records]
+
+@app.route('/api/similarity/batch', methods=['POST'])
+@jwt_required()
+def similarity_batch():
+    """Similarité (jaccard ou cosine TF-IDF) d'une requête contre un lot, ou de toutes les paires du lot"""
+    data = request.get_json(silent=True) or {}
+    metric = data.get('metric', 'jaccard')
+    if metric not in SIMILARITY_METRICS:
+        return jsonify({"error": "metric doit valoir 'jaccard' ou 'cosine'"}), 400
+    try:
+        threshold = float(data.get('threshold', 0.0))
+        limit = int(data['limit']) if data.get('limit') is not None else None
+        labels, tokens = _similarity_items(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    query = data.get('query')
+    if query is None and data.get('query_id') is not None:
+        collection = {'sequences': sequences, 'resources': internet_resources}.get(data.get('kind', 'sequences'))
+        record = collection.get(data['query_id']) if collection is not None else None
+        if record is None:
+            return jsonify({"error": "Élément de requête introuvable"}), 404
+        query = record_tokens(record)
+    elif isinstance(query, str):
+        query = tokenize(query)
+    elif query is not None:
+        return jsonify({"error": "query doit être un texte"}), 400
+
+    if query is not None:
+        if len(tokens) > MAX_SIMILARITY_ITEMS:
+            return jsonify({"error": f"{MAX_SIMILARITY_ITEMS} éléments au maximum"}), 400
+        scores = TermMatrix(tokens, metric).one_to_many(query) if tokens else []
+        results = sorted(({"id": label, "score": round(float(score), 4)} for label, score in zip(labels, scores)
+                          if score >= threshold and score > 0), key=lambda item: -item["score"])
+        return jsonify({"metric": metric, "results": results[:limit] if limit else results})
+    if len(tokens) > MAX_PAIRWISE_ITEMS:
+        return jsonify({"error": f"{MAX_PAIRWISE_ITEMS} éléments au maximum pour la comparaison deux à deux"}), 400
+    pairs = sorted(TermMatrix(tokens, metric).pairs(threshold) if tokens else [], key=lambda pair: -pair[2])
+    pairs = [{"a": labels[i], "b": labels[j], "score": round(score, 4)} for i, j, score in (pairs[:limit] if limit else pairs)]
+    return jsonify({"metric": metric, "pairs": pairs})
+
+@app.route('/api/similarity/duplicates', methods=['GET'])
+@jwt_required()
+def near_duplicates():
+    """Quasi-doublons (Jaccard ≥ threshold) dans les séquences et/ou les ressources, par MinHash/LSH"""
+    kind = request.args.get('kind', 'all')
+    kinds = {'sequences': {'sequence'}, 'resources': {'resource'}, 'all': None}
+    if kind not in kinds:
+        return jsonify({"error": "kind doit valoir 'sequences', 'resources' ou 'all'"}), 400
+    try:
+        threshold = float(request.args.get('threshold', 0.5))
+        limit = min(max(1, int(request.args.get('limit', 100))), 10000)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Paramètres threshold/limit invalides"}), 400
+    pairs = duplicate_index.near_duplicates(threshold, kinds=kinds[kind], limit=limit)
+    names = {'sequence': 'sequences', 'resource': 'resources'}
+    return jsonify([{"a": {"kind": names[a[0]], "id": a[1]}, "b": {"kind": names[b[0]], "id": b[1]},
+                     "similarity": round(score, 4)} for a, b, score in pairs])
 # Traduction automatique (français ↔ espagnol ↔ maya, mock)
 @app.route('/api/translate', methods=['POST'])
 @jwt_required()
 def translate():
+    """Traduction phrase par phrase, via la mémoire de traduction puis le moteur (details=true : origine de chaque phrase)"""
     data = request.get_json() or {}
     text = data.get('text', '')
     source = data.get('source', 'fr')
     target = data.get('target', 'es')
-    if not text:
+    if not text or not isinstance(text, str):
         return jsonify({"error": "Texte à traduire requis."}), 400
-    # Simulation de traduction
-    translation = f"[{source}->{target}] {text[::-1]}"
-    return jsonify({"translation": translation})
-# Résumé automatique de documents ou ressources (NLP, mock)
+    if len(text) > MAX_TRANSLATE_CHARS:
+        return jsonify({"error": f"{MAX_TRANSLATE_CHARS} caractères au maximum"}), 400
+    if not all(isinstance(lang, str) and 0 < len(lang) <= 16 for lang in (source, target)):
+        return jsonify({"error": "Langues source/cible invalides"}), 400
+    try:
+        translation, segments = translator.translate(text, source, target)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Traduction : moteur indisponible ({e})")
+        return jsonify({"error": "Moteur de traduction indisponible"}), 502
+    matches = {origin: 0 for origin in ('memory', 'backend')}
+    for _, _, origin, _ in segments:
+        matches['memory' if origin == 'lru' else origin] += 1
+    result = {"translation": translation, "matches": matches,
+              "suggestions": sum(1 for *_, suggestion in segments if suggestion)}
+    if data.get('details'):
+        # Entrée approchée de la mémoire (score de Dice) : à relire, elle n'est pas reprise dans la traduction
+        result["segments"] = [{"source": src, "translation": dst, "match": 'memory' if origin == 'lru' else origin,
+                               **({"suggestion": suggestion} if suggestion else {})}
+                              for src, dst, origin, suggestion in segments]
+    return jsonify(result)
+
+@app.route('/api/translation-memory', methods=['POST'])
+@role_required(['admin', 'enseignant'])
+def add_translation_memory():
+    """Ajoute ou corrige des traductions validées : {"source", "target", "entries": [{"source_text", "target_text"}]}"""
+    data = request.get_json(silent=True) or {}
+    source, target, entries = data.get('source'), data.get('target'), data.get('entries')
+    if not all(isinstance(lang, str) and 0 < len(lang) <= 16 for lang in (source, target)):
+        return jsonify({"error": "Langues source/cible invalides"}), 400
+    if not isinstance(entries, list) or not all(
+            isinstance(e, dict) and isinstance(e.get('source_text'), str) and isinstance(e.get('target_text'), str)
+            and e['target_text'] for e in entries):
+        return jsonify({"error": "entries doit être une liste de {source_text, target_text}"}), 400
+    stored = translator.store(source, target, [(e['source_text'], e['target_text']) for e in entries], replace=True)
+    return jsonify({"stored": stored})
+
+@app.route('/api/translate/stats', methods=['GET'])
+@role_required(['admin'])
+def translation_stats():
+    """Origine des phrases traduites par ce worker (LRU, mémoire, mémoire approchée, moteur) et taux de réussite"""
+    return jsonify(translator.stats())
+# Résumé automatique de documents ou ressources : phrases classées à l'écriture (voir summarize.py)
+MAX_SUMMARY_BATCH = 1000
+SUMMARY_KINDS = {'documents': 'document', 'resources': 'resource'}
+
+def _summary_sentences(value):
+    try:
+        return min(max(1, int(value)), MAX_SUMMARY_SENTENCES)
+    except (TypeError, ValueError):
+        return SUMMARY_SENTENCES
+
 @app.route('/api/library/documents/<string:id>/summary', methods=['GET'])
 @jwt_required()
 def summarize_document(id):
-    for doc in library_documents:
-        if doc['id'] == id:
-            content = doc.get('content', '')
-            summary = content[:100] + ('...' if len(content) > 100 else '')
-            return jsonify({"summary": summary})
+    if id in library_documents:
+        summary = summarizer.summary(('document', library_documents.key(id)), _summary_sentences(request.args.get('sentences')))
+        return jsonify({"summary": summary})
     return jsonify({"message": "Document not found"}), 404
 
 @app.route('/api/internet/resources/<string:id>/summary', methods=['GET'])
 @jwt_required()
 def summarize_resource(id):
-    for res in internet_resources:
-        if res['id'] == id:
-            content = res.get('content', '')
-            summary = content[:100] + ('...' if len(content) > 100 else '')
-            return jsonify({"summary": summary})
+    if id in internet_resources:
+        summary = summarizer.summary(('resource', internet_resources.key(id)), _summary_sentences(request.args.get('sentences')))
+        return jsonify({"summary": summary})
     return jsonify({"message": "Resource not found"}), 404
+
+@app.route('/api/summaries', methods=['POST'])
+@jwt_required()
+def summarize_batch():
+    """Résumés d'un lot : ``{"kind": "documents"|"resources", "ids": [...], "sentences": 3}``"""
+    data = request.get_json(silent=True) or {}
+    kind = SUMMARY_KINDS.get(data.get('kind', 'documents'))
+    if kind is None:
+        return jsonify({"error": "Paramètre 'kind' inconnu."}), 400
+    ids = data.get('ids', [])
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids doit être une liste"}), 400
+    if len(ids) > MAX_SUMMARY_BATCH:
+        return jsonify({"error": f"{MAX_SUMMARY_BATCH} éléments au maximum par lot"}), 400
+    collection = library_documents if kind == 'document' else internet_resources
+    sentences = _summary_sentences(data.get('sentences'))
+    summaries, missing = {}, []
+    for id in dict.fromkeys(map(str, ids)):
+        key = collection.key(id)
+        if key in collection:
+            summaries[id] = summarizer.summary((kind, key), sentences)
+        else:
+            missing.append(id)
+    return jsonify({"summaries": summaries, "missing": missing})
 # Génération automatique de séquences/ressources à partir d'un prompt IA (mock)
+# Tâches en arrière-plan : les générateurs renvoient 202 et un identifiant à suivre sur /api/jobs/<id>
+MAX_GENERATE_COUNT = int(os.environ.get('MAX_GENERATE_COUNT', 100000))
+JOB_BATCH_SIZE = 500
+
+def _count_arg(value):
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        return None
+    return count if 1 <= count <= MAX_GENERATE_COUNT else None
+
+def _job_batches(count):
+    # Tailles des lots successifs : avancement et annulation sont pris en compte entre deux lots
+    for start in range(0, count, JOB_BATCH_SIZE):
+        yield min(JOB_BATCH_SIZE, count - start)
+
+def _submit_job(kind, params, total=None):
+    try:
+        job = jobs.submit(kind, params, user=get_jwt().get('username'), total=total)
+    except JobQueueFull:
+        return jsonify({"error": "Trop de tâches en attente, réessayez plus tard."}), 503
+    return jsonify({"job_id": job.id, "status": job.status,
+                    "status_url": url_for('get_job', job_id=job.id)}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+@role_required(['admin'])
+def list_jobs():
+    # Les tâches d'un worker arrêté sont reprises avant d'être listées
+    jobs.recover()
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    limit = page_size_arg(request.args.get('limit'))
+    return jsonify([job.to_dict() for job in query.order_by(Job.created_at.desc()).limit(limit)])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@role_required(['admin'])
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Tâche inconnue."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@role_required(['admin'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Tâche inconnue."}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/admin/generate-from-prompt', methods=['POST'])
 @role_required(['admin'])
 def generate_from_prompt():
-    global sequences, next_sequence_id, internet_resources
     data = request.get_json() or {}
     prompt = data.get('prompt', '').strip()
     if not prompt:
         return jsonify({"error": "Prompt requis."}), 400
+    return _submit_job('generate-from-prompt', {"prompt": prompt}, 2)
+
+@jobs.task('generate-from-prompt')
+def _generate_from_prompt_job(ctx, prompt):
     # Simulation IA : génère une séquence et une ressource à partir du prompt
     seq = {
-        "id": next_sequence_id,
+        "id": sequences.new_id(),
         "titulo": f"Séquence IA : {prompt[:30]}",
         "modalidad": "en ligne",
         "niveau": "A2",
@@ -481,13 +889,14 @@ def generate_from_prompt():
         "support_audio": None,
         "support_video": None
     }
-    sequences.append(seq)
-    next_sequence_id += 1
+    sequences.add(seq)
+    ctx.advance()
+    res_id = internet_resources.new_id()
     res = {
-        "id": str(len(internet_resources) + 1),
+        "id": res_id,
         "title": f"Ressource IA : {prompt[:30]}",
         "description": f"Ressource générée à partir du prompt : {prompt}",
-        "url": f"http://example.com/ia-resource-{len(internet_resources) + 1}",
+        "url": f"http://example.com/ia-resource-{res_id}",
         "date": "2025-07-16",
         "content": f"Contenu IA pour : {prompt}",
         "type": "ia",
@@ -498,78 +907,105 @@ def generate_from_prompt():
         "support_audio": None,
         "support_video": None
     }
-    internet_resources.append(res)
-    return jsonify({"sequence": seq, "resource": res})
+    internet_resources.add(res)
+    ctx.advance()
+    return {"sequence": seq, "resource": res}
 # Statistiques sur la langue maya (simulation sur les séquences)
 @app.route('/api/stats', methods=['GET'])
 @jwt_required()
 def get_stats():
-    from collections import Counter
-    niveaux = [seq.get('niveau') for seq in sequences if 'niveau' in seq]
-    themes = [seq.get('theme') for seq in sequences if 'theme' in seq]
-    modalites = [seq.get('modalidad') for seq in sequences if 'modalidad' in seq]
+    histograms, total = corpus_stats.distribution('sequence')
     return jsonify({
-        "niveaux": dict(Counter(niveaux)),
-        "themes": dict(Counter(themes)),
-        "modalites": dict(Counter(modalites)),
-        "total_sequences": len(sequences)
+        "niveaux": histograms['niveau'],
+        "themes": histograms['theme'],
+        "modalites": histograms['modalidad'],
+        "total_sequences": total
     })
+# Endpoint admin : recalcul complet des statistiques de corpus et contrôle de cohérence
+@app.route('/api/admin/stats/rebuild', methods=['POST'])
+@role_required(['admin'])
+def rebuild_stats():
+    return jsonify(corpus_stats.rebuild())
 # Génération de plans de cours à partir de séquences sélectionnées
 @app.route('/api/lesson-plan', methods=['POST'])
 @jwt_required()
 def generate_lesson_plan():
-    ids = request.get_json().get('ids', [])
-    selected = [seq for seq in sequences if seq.get('id') in ids]
-    plan = {
-        "titre": "Plan de cours généré",
-        "sequences": selected,
-        "objectifs": [f"Maîtriser le thème {seq.get('theme', 'inconnu')} (niveau {seq.get('niveau', 'inconnu')})" for seq in selected],
-        "modalites": list(set(seq.get('modalidad') for seq in selected))
-    }
-    return jsonify(plan)
-# Génération de quiz/activités à partir d’une séquence (simulation)
+    ids = (request.get_json(silent=True) or {}).get('ids', [])
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids doit être une liste"}), 400
+    if len(ids) > MAX_EXPORT_SEQUENCES:
+        return jsonify({"error": f"{MAX_EXPORT_SEQUENCES} séquences au maximum par plan"}), 400
+    # Ordre de la demande conservé, doublons ignorés
+    keys = dict.fromkeys(key for key in map(sequences.key, ids) if key is not None)
+    selected = [seq for seq in map(sequences.get, keys) if seq is not None]
+    count, _ = _quiz_args(default=3)
+    return jsonify(quiz_generator.lesson_plan(selected, questions=count))
+# Génération de quiz/activités à partir d’une séquence (même quiz tant que la séquence ne change pas)
 @app.route('/api/sequences/<int:id>/quiz', methods=['GET'])
 @jwt_required()
 def generate_quiz(id):
-    for seq in sequences:
-        if seq.get('id') == id:
-            quiz = {
-                "sequence_id": id,
-                "questions": [
-                    {"q": f"Expliquez le thème de la séquence '{seq.get('theme', 'inconnu')}'.", "type": "ouverte"},
-                    {"q": f"Quel est le niveau de cette séquence ?", "type": "choix", "options": ["A1", "A2", "B1", "B2"]},
-                    {"q": f"La modalité est-elle présentielle ou en ligne ?", "type": "choix", "options": ["présentiel", "en ligne"]}
-                ]
-            }
-            return jsonify(quiz)
+    seq = sequences.get(id)
+    if seq is not None:
+        count, variant = _quiz_args()
+        return jsonify({"sequence_id": id, **quiz_generator.quiz(seq, count=count, variant=variant)})
     return jsonify({"message": "Secuencia no encontrada"}), 404
 # Endpoint admin : import de séquences/ressources au format CSV
 @app.route('/api/admin/import-csv', methods=['POST'])
 @role_required(['admin'])
 def import_csv():
-    global sequences, internet_resources, next_sequence_id
     what = request.args.get('what', 'sequences')
     file = request.files.get('file')
     if not file:
         return jsonify({"error": "Aucun fichier fourni."}), 400
-    import csv
-    import io
-    reader = csv.DictReader(io.StringIO(file.read().decode('utf-8')))
-    items = list(reader)
     if what == 'sequences':
-        for item in items:
-            item['id'] = int(item.get('id', next_sequence_id))
-        sequences.extend(items)
-        if items:
-            next_sequence_id = max(int(item['id']) for item in sequences) + 1
-        return jsonify({"message": f"{len(items)} séquences importées."})
+        collection, label = sequences, "séquences"
     elif what == 'resources':
-        for item in items:
-            item['id'] = str(item.get('id', len(internet_resources) + 1))
-        internet_resources.extend(items)
-        return jsonify({"message": f"{len(items)} ressources importées."})
+        collection, label = internet_resources, "ressources"
     else:
         return jsonify({"error": "Paramètre 'what' inconnu."}), 400
+    # Le fichier est lu en flux et inséré par lots (une transaction par lot) ; avec ?progress=1,
+    # l'avancement est renvoyé au fil de l'eau en JSON Lines
+    if request.args.get('progress', '').lower() in ('1', 'true', 'yes'):
+        # Flask ferme les fichiers reçus à la fin de la vue : l'envoi est recopié (par blocs,
+        # sur disque au-delà de 1 Mo) pour rester lisible pendant la réponse en flux
+        upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        file.save(upload)
+        upload.seek(0)
+        def lines():
+            with upload:
+                for step in _import_csv_batches(collection, upload, label):
+                    yield json.dumps(step, ensure_ascii=False) + '\n'
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    summary = None
+    for summary in _import_csv_batches(collection, file.stream, label):
+        pass
+    return jsonify(summary)
+
+def _validate_csv_record(collection):
+    def validate(record):
+        if 'id' in record and collection.key(record['id']) is None:
+            return f"Identifiant invalide : {record['id']!r}"
+        return None
+    return validate
+
+def _import_csv_batches(collection, stream, label):
+    """Importe le CSV par lots et génère l'avancement après chaque lot, puis un résumé final."""
+    imported, rejected, errors = 0, 0, []
+    for batch, batch_errors in read_batches(stream, validate=_validate_csv_record(collection)):
+        rejected += len(batch_errors)
+        errors.extend({"ligne": line, "erreur": message} for line, message in batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        if batch:
+            # Les lignes sans id reçoivent un identifiant du compteur partagé, relevé lot par lot
+            collection.extend(batch)
+            imported += len(batch)
+        yield {"importees": imported, "rejetees": rejected}
+    yield {
+        "message": f"{imported} {label} importées.",
+        "importees": imported,
+        "rejetees": rejected,
+        "erreurs": errors,
+        "termine": True
+    }
 # Recherche avancée sur les séquences (filtres multiples, recherche plein texte)
 @app.route('/api/sequences/advanced-search', methods=['GET'])
 @jwt_required()
@@ -578,38 +1014,180 @@ def advanced_search_sequences():
     niveau = request.args.get('niveau')
     theme = request.args.get('theme')
     modalidad = request.args.get('modalidad')
-    results = []
-    for seq in sequences:
-        if query and query not in str(seq).lower():
-            continue
-        if niveau and seq.get('niveau') != niveau:
-            continue
-        if theme and seq.get('theme') != theme:
-            continue
-        if modalidad and seq.get('modalidad') != modalidad:
-            continue
-        results.append(seq)
-    return jsonify(results)
-# Notifications simulées par utilisateur (en mémoire)
-user_notifications = {}
+    langue = request.args.get('langue')
+    dialecte = request.args.get('dialecte')
+    page_size = page_size_arg(request.args.get('page_size'))
+    # Les filtres exacts passent par les index secondaires, le plein texte par l'index inversé
+    candidates = sequences.filter(niveau=niveau or None, theme=theme or None, modalidad=modalidad or None,
+                                  langue=langue or None, dialecte=dialecte or None)
+    if query:
+        allowed = {seq['id'] for seq in candidates}
+        ranked = [(score, id) for score, (_, id) in search_index.search(query, kinds=('sequence',)) if id in allowed]
+    else:
+        ranked = [(0.0, seq['id']) for seq in candidates]
+    try:
+        page, next_cursor = paginate(ranked, key=lambda hit: (-hit[0], hit[1]),
+                                     cursor=request.args.get('cursor'), page_size=page_size)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify([sequences.get(id) for _, id in page])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+# Notifications par utilisateur (persistées en base) : numéros croissants par utilisateur, seules les
+# NOTIFICATION_HISTORY dernières sont gardées. Non lues = last_seq - read_seq (boîte de réception)
+NOTIFICATION_HISTORY = int(os.environ.get('NOTIFICATION_HISTORY', 200))
+NOTIFICATION_COMPACT_EVERY = 20
+# Attente maximale d'un GET /api/notifications?wait=
+NOTIFICATION_MAX_WAIT = 30
+
+def _notifications(user, since=0):
+    query = Notification.query.filter(Notification.username == user, Notification.seq > since)
+    return [{"seq": n.seq, "notification": n.payload} for n in query.order_by(Notification.seq)]
+
+def _fetch_notifications(user, since):
+    # Appelé pendant une attente (long-poll, SSE) : la connexion est rendue au pool après chaque lecture
+    try:
+        return _notifications(user, since)
+    finally:
+        db.session.close()
+
+# Même mécanisme que les sessions : un tampon borné par utilisateur écouté, relu en base pour les autres workers
+notification_hub = SessionHub(_fetch_notifications, history=min(NOTIFICATION_HISTORY, 200))
 
+def _inbox_state(user):
+    inbox = db.session.get(NotificationInbox, user)
+    last_seq, read_seq = (inbox.last_seq, inbox.read_seq) if inbox is not None else (0, 0)
+    return {"last_seq": last_seq, "read_seq": read_seq, "unread": last_seq - read_seq}
+
+def _add_notification(user, payload):
+    if db.session.get(NotificationInbox, user) is None:
+        db.session.add(NotificationInbox(username=user))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Boîte créée au même moment par un autre worker
+            db.session.rollback()
+    db.session.execute(update(NotificationInbox).where(NotificationInbox.username == user)
+                       .values(last_seq=NotificationInbox.last_seq + 1))
+    seq = db.session.scalar(select(NotificationInbox.last_seq).where(NotificationInbox.username == user))
+    db.session.add(Notification(username=user, seq=seq, payload=payload))
+    if seq % NOTIFICATION_COMPACT_EVERY == 0 and seq > NOTIFICATION_HISTORY:
+        # Les notifications supprimées comptent comme lues : le compteur reste exact
+        floor = seq - NOTIFICATION_HISTORY
+        Notification.query.filter(Notification.username == user,
+                                  Notification.seq <= floor).delete(synchronize_session=False)
+        db.session.execute(update(NotificationInbox).where(NotificationInbox.username == user).values(
+            read_seq=case((NotificationInbox.read_seq < floor, floor), else_=NotificationInbox.read_seq)))
+    db.session.commit()
+    message = {"seq": seq, "notification": payload}
+    notification_hub.publish(user, message)
+    return message
+
+# ?since=<seq> : uniquement les notifications suivantes ; ?wait=<s> : attend (long-poll) s'il n'y en a pas
 @app.route('/api/notifications', methods=['GET'])
 @jwt_required()
 def get_notifications():
     user = get_jwt().get('username', 'anonyme')
-    notes = user_notifications.get(user, [])
-    return jsonify(notes)
+    since = _since_arg()
+    try:
+        wait = min(max(0.0, float(request.args.get('wait', 0))), NOTIFICATION_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Paramètre 'wait' invalide."}), 400
+    notifications = _notifications(user, since)
+    if not notifications and wait:
+        db.session.close()
+        with notification_hub.subscription(user) as channel:
+            notifications = notification_hub.listen(user, channel, since, wait)
+    return jsonify({"notifications": notifications, **_inbox_state(user)})
 
 @app.route('/api/notifications', methods=['POST'])
 @jwt_required()
 def add_notification():
     user = get_jwt().get('username', 'anonyme')
-    notif = request.get_json().get('notification')
-    if notif:
-        user_notifications.setdefault(user, []).append(notif)
-    return jsonify(user_notifications.get(user, []))
-# Partage de séquences/ressources entre utilisateurs (simulation)
-shared_items = {}
+    notif = (request.get_json() or {}).get('notification')
+    if not notif:
+        return jsonify({"error": "Champ 'notification' requis."}), 400
+    message = _add_notification(user, notif)
+    return jsonify({"seq": message["seq"], **_inbox_state(user)})
+
+# Marque comme lues les notifications jusqu'à "seq" (par défaut toutes)
+@app.route('/api/notifications/read', methods=['POST'])
+@jwt_required()
+def read_notifications():
+    user = get_jwt().get('username', 'anonyme')
+    seq = (request.get_json(silent=True) or {}).get('seq')
+    if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool) or seq < 0):
+        return jsonify({"error": "Champ 'seq' invalide."}), 400
+    inbox = db.session.get(NotificationInbox, user)
+    if inbox is not None:
+        seq = inbox.last_seq if seq is None else min(seq, inbox.last_seq)
+        # Le curseur ne recule jamais (lectures concurrentes depuis plusieurs clients)
+        db.session.execute(update(NotificationInbox).where(NotificationInbox.username == user,
+                                                           NotificationInbox.read_seq < seq).values(read_seq=seq))
+        db.session.commit()
+    return jsonify(_inbox_state(user))
+
+@app.route('/api/notifications/unread', methods=['GET'])
+@jwt_required()
+def unread_notifications():
+    return jsonify(_inbox_state(get_jwt().get('username', 'anonyme')))
+
+# Flux SSE des notifications (reprise via ?since= ou l'en-tête Last-Event-ID)
+@app.route('/api/notifications/events', methods=['GET'])
+@jwt_required()
+def notification_events():
+    user, since = get_jwt().get('username', 'anonyme'), _since_arg()
+    db.session.close()
+    return Response(stream_with_context(notification_hub.stream(user, since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+# Partage de séquences/ressources entre utilisateurs et favoris personnels (table user_item)
+def _add_user_item(username, relation, kind, item_id):
+    _add_user_items(username, relation, kind, [item_id])
+
+def _add_user_items(username, relation, kind, item_ids):
+    # Une seule requête pour les éléments déjà présents et un seul commit pour tout le lot
+    item_ids = list(dict.fromkeys(str(item_id) for item_id in item_ids))
+    existing = {row.item_id for row in UserItem.query.filter(
+        UserItem.username == username, UserItem.relation == relation, UserItem.kind == kind,
+        UserItem.item_id.in_(item_ids))}
+    for item_id in item_ids:
+        if item_id not in existing:
+            db.session.add(UserItem(username=username, relation=relation, kind=kind, item_id=item_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+def _user_items(username, relation):
+    items = {'sequences': [], 'resources': []}
+    for row in UserItem.query.filter_by(username=username, relation=relation).order_by(UserItem.id):
+        items[row.kind].append(int(row.item_id) if row.kind == 'sequences' else row.item_id)
+    return items
+
+def _user_items_page(username, relation):
+    """Réponse paginée (keyset sur l'ordre d'ajout) des éléments d'un utilisateur, contenus inclus."""
+    try:
+        after = decode_cursor(request.args.get('cursor'))
+        after_id = int(after[0]) if after else 0
+    except (ValueError, TypeError, IndexError):
+        return jsonify({"error": "Curseur invalide."}), 400
+    page_size = page_size_arg(request.args.get('page_size'))
+    fields = fields_arg(request.args.get('fields'))
+    query = UserItem.query.filter_by(username=username, relation=relation).filter(UserItem.id > after_id)
+    if request.args.get('kind') in ('sequences', 'resources'):
+        query = query.filter_by(kind=request.args['kind'])
+    rows = query.order_by(UserItem.id).limit(page_size + 1).all()
+    collections = {'sequences': sequences, 'resources': internet_resources}
+    items = {'sequences': [], 'resources': []}
+    for row in rows[:page_size]:
+        record = collections[row.kind].get(row.item_id)
+        # Un élément supprimé depuis reste listé par son seul id
+        items[row.kind].append(project(record, fields) if record is not None else {"id": collections[row.kind].key(row.item_id)})
+    response = jsonify(items)
+    if len(rows) > page_size:
+        response.headers['X-Next-Cursor'] = encode_cursor((rows[page_size - 1].id,))
+    return response
 
 @app.route('/api/sequences/<int:id>/share', methods=['POST'])
 @jwt_required()
@@ -618,8 +1196,7 @@ def share_sequence(id):
     to_user = data.get('to_user')
     if not to_user:
         return jsonify({"error": "Champ 'to_user' requis."}), 400
-    shared_items.setdefault(to_user, {'sequences': set(), 'resources': set()})
-    shared_items[to_user]['sequences'].add(id)
+    _add_user_item(to_user, 'shared', 'sequences', id)
     return jsonify({"message": f"Séquence {id} partagée avec {to_user}."})
 
 @app.route('/api/internet/resources/<string:id>/share', methods=['POST'])
@@ -629,60 +1206,47 @@ def share_resource(id):
     to_user = data.get('to_user')
     if not to_user:
         return jsonify({"error": "Champ 'to_user' requis."}), 400
-    shared_items.setdefault(to_user, {'sequences': set(), 'resources': set()})
-    shared_items[to_user]['resources'].add(id)
+    _add_user_item(to_user, 'shared', 'resources', id)
     return jsonify({"message": f"Ressource {id} partagée avec {to_user}."})
 
 @app.route('/api/shared', methods=['GET'])
 @jwt_required()
 def get_shared():
     user = get_jwt().get('username', 'anonyme')
-    shared = shared_items.get(user, {'sequences': set(), 'resources': set()})
-    return jsonify({
-        "sequences": list(shared['sequences']),
-        "resources": list(shared['resources'])
-    })
-# Favoris/bookmarks personnels (stockés en mémoire par utilisateur)
-user_favorites = {}
+    return _user_items_page(user, 'shared')
+# Favoris/bookmarks personnels
 
 @app.route('/api/sequences/<int:id>/favorite', methods=['POST'])
 @jwt_required()
 def favorite_sequence(id):
     user = get_jwt().get('username', 'anonyme')
-    user_favorites.setdefault(user, {'sequences': set(), 'resources': set()})
-    user_favorites[user]['sequences'].add(id)
-    return jsonify({"favorites": list(user_favorites[user]['sequences'])})
+    _add_user_item(user, 'favorite', 'sequences', id)
+    return jsonify({"favorites": _user_items(user, 'favorite')['sequences']})
 
 @app.route('/api/internet/resources/<string:id>/favorite', methods=['POST'])
 @jwt_required()
 def favorite_resource(id):
     user = get_jwt().get('username', 'anonyme')
-    user_favorites.setdefault(user, {'sequences': set(), 'resources': set()})
-    user_favorites[user]['resources'].add(id)
-    return jsonify({"favorites": list(user_favorites[user]['resources'])})
+    _add_user_item(user, 'favorite', 'resources', id)
+    return jsonify({"favorites": _user_items(user, 'favorite')['resources']})
 
 @app.route('/api/favorites', methods=['GET'])
 @jwt_required()
 def get_favorites():
     user = get_jwt().get('username', 'anonyme')
-    favs = user_favorites.get(user, {'sequences': set(), 'resources': set()})
-    return jsonify({
-        "sequences": list(favs['sequences']),
-        "resources": list(favs['resources'])
-    })
+    return _user_items_page(user, 'favorite')
 # Endpoint : commentaires/notes sur séquences et ressources
 @app.route('/api/sequences/<int:id>/comments', methods=['POST'])
 @jwt_required()
 def add_sequence_comment(id):
     comment = request.get_json().get('comment')
     user = get_jwt().get('username', 'anonyme')
-    for seq in sequences:
-        if seq.get('id') == id:
-            if 'comments' not in seq:
-                seq['comments'] = []
-            if comment:
-                seq['comments'].append({"user": user, "comment": comment})
-            return jsonify(seq)
+    seq = sequences.get(id)
+    if seq is not None:
+        comments = seq.get('comments', [])
+        if comment:
+            comments = comments + [{"user": user, "comment": comment}]
+        return jsonify(sequences.update(id, {'comments': comments}))
     return jsonify({"message": "Secuencia no encontrada"}), 404
 
 @app.route('/api/internet/resources/<string:id>/comments', methods=['POST'])
@@ -690,39 +1254,36 @@ def add_sequence_comment(id):
 def add_resource_comment(id):
     comment = request.get_json().get('comment')
     user = get_jwt().get('username', 'anonyme')
-    for res in internet_resources:
-        if res.get('id') == id:
-            if 'comments' not in res:
-                res['comments'] = []
-            if comment:
-                res['comments'].append({"user": user, "comment": comment})
-            return jsonify(res)
+    res = internet_resources.get(id)
+    if res is not None:
+        comments = res.get('comments', [])
+        if comment:
+            comments = comments + [{"user": user, "comment": comment}]
+        return jsonify(internet_resources.update(id, {'comments': comments}))
     return jsonify({"message": "Resource not found"}), 404
 # Endpoint : annotation/catégorisation collaborative (tags sur séquences et ressources)
 @app.route('/api/sequences/<int:id>/tags', methods=['POST'])
 @jwt_required()
 def add_sequence_tag(id):
     tag = request.get_json().get('tag')
-    for seq in sequences:
-        if seq.get('id') == id:
-            if 'tags' not in seq:
-                seq['tags'] = []
-            if tag and tag not in seq['tags']:
-                seq['tags'].append(tag)
-            return jsonify(seq)
+    seq = sequences.get(id)
+    if seq is not None:
+        tags = seq.get('tags', [])
+        if tag and tag not in tags:
+            tags = tags + [tag]
+        return jsonify(sequences.update(id, {'tags': tags}))
     return jsonify({"message": "Secuencia no encontrada"}), 404
 
 @app.route('/api/internet/resources/<string:id>/tags', methods=['POST'])
 @jwt_required()
 def add_resource_tag(id):
     tag = request.get_json().get('tag')
-    for res in internet_resources:
-        if res.get('id') == id:
-            if 'tags' not in res:
-                res['tags'] = []
-            if tag and tag not in res['tags']:
-                res['tags'].append(tag)
-            return jsonify(res)
+    res = internet_resources.get(id)
+    if res is not None:
+        tags = res.get('tags', [])
+        if tag and tag not in tags:
+            tags = tags + [tag]
+        return jsonify(internet_resources.update(id, {'tags': tags}))
     return jsonify({"message": "Resource not found"}), 404
 # Endpoint admin : rapport d'activité simple
 @app.route('/api/admin/activity-report', methods=['GET'])
@@ -736,92 +1297,123 @@ def activity_report():
         "nb_users": user_count
     })
 # Endpoint admin : exporter séquences/ressources au format CSV
-import io, csv
 @app.route('/api/admin/export-csv', methods=['GET'])
 @role_required(['admin'])
 def export_csv():
     what = request.args.get('what', 'sequences')
-    si = io.StringIO()
     if what == 'sequences':
-        if not sequences:
-            return ('', 204)
-        writer = csv.DictWriter(si, fieldnames=sorted(sequences[0].keys()))
-        writer.writeheader()
-        writer.writerows(sequences)
-        output = si.getvalue()
-        return output, 200, {'Content-Type': 'text/csv'}
+        records = sequences.all()
     elif what == 'resources':
-        if not internet_resources:
-            return ('', 204)
-        writer = csv.DictWriter(si, fieldnames=sorted(internet_resources[0].keys()))
-        writer.writeheader()
-        writer.writerows(internet_resources)
-        output = si.getvalue()
-        return output, 200, {'Content-Type': 'text/csv'}
+        records = internet_resources.all()
     else:
         return jsonify({"error": "Paramètre 'what' inconnu."}), 400
+    if not records:
+        return ('', 204)
+    # Réponse envoyée par blocs au fil de l'écriture ; les colonnes couvrent tous les champs rencontrés
+    return Response(iter_csv(records, fieldnames(records)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={what}.csv'})
 # Endpoint : suggestions de séquences ou ressources selon le profil utilisateur
+# Poids des éléments du profil : favoris, éléments partagés avec l'utilisateur, consultations récentes
+SUGGESTION_WEIGHTS = {'favorite': 1.0, 'shared': 0.7, 'view': 0.5}
+SUGGESTION_PROFILE_SIZE = 50
+SUGGESTION_KINDS = {'sequences': 'sequence', 'resources': 'resource', 'documents': 'document'}
+
+def _suggestion_profile(username):
+    seeds = {}
+    for doc in suggestion_engine.views(username):
+        seeds[doc] = SUGGESTION_WEIGHTS['view']
+    rows = UserItem.query.filter(UserItem.username == username, UserItem.relation.in_(('favorite', 'shared'))) \
+        .order_by(UserItem.id.desc()).limit(SUGGESTION_PROFILE_SIZE)
+    for row in rows:
+        kind = SUGGESTION_KINDS[row.kind]
+        key = (kind, sequences.key(row.item_id) if kind == 'sequence' else row.item_id)
+        seeds[key] = max(seeds.get(key, 0.0), SUGGESTION_WEIGHTS[row.relation])
+    return seeds
+
 @app.route('/api/suggestions', methods=['GET'])
 @jwt_required()
 def get_suggestions():
-    import random
+    """Suggestions proches des favoris, partages et consultations récentes (kind=sequences|resources|documents)"""
     claims = get_jwt()
     role = claims.get('roles', ['demo'])[0]
-    # Pour l'exemple, suggestions aléatoires selon le rôle
-    if role == 'enseignant':
-        suggestions = random.sample(sequences, min(3, len(sequences))) if sequences else []
-    elif role == 'chercheur':
-        suggestions = random.sample(library_documents, min(3, len(library_documents))) if library_documents else []
-    else:
-        suggestions = random.sample(internet_resources, min(3, len(internet_resources))) if internet_resources else []
-    return jsonify(suggestions)
+    try:
+        limit = min(max(1, int(request.args.get('limit', 3))), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = 3
+    kind = request.args.get('kind')
+    if kind is not None and kind not in SUGGESTION_KINDS:
+        return jsonify({"error": "Paramètre 'kind' inconnu."}), 400
+    # Sans profil : les ajouts les plus récents du type associé au rôle
+    fallback = SUGGESTION_KINDS[kind] if kind else {'enseignant': 'sequence', 'chercheur': 'document'}.get(role, 'resource')
+    docs = suggestion_engine.suggest(_suggestion_profile(claims.get('username', 'anonyme')), limit=limit,
+                                     kinds={SUGGESTION_KINDS[kind]} if kind else None, fallback_kind=fallback)
+    collections = {'sequence': sequences, 'resource': internet_resources, 'document': library_documents}
+    suggestions = [collections[doc_kind].get(key) for doc_kind, key in docs]
+    return jsonify([record for record in suggestions if record is not None])
 # Endpoint admin : génération automatique de ressources pédagogiques
 @app.route('/api/admin/generate-resources', methods=['POST'])
 @role_required(['admin'])
 def generate_resources():
-    global internet_resources
     data = request.get_json() or {}
     types = data.get('types', ['document', 'podcast', 'lien'])
     themes = data.get('themes', ['grammaire', 'culture', 'oral', 'écrit'])
     niveaux = data.get('niveaux', ['A1', 'A2', 'B1', 'B2'])
-    count = int(data.get('count', 8))
+    count = _count_arg(data.get('count', 8))
+    if count is None:
+        return jsonify({"error": f"'count' doit être un entier entre 1 et {MAX_GENERATE_COUNT}."}), 400
+    return _submit_job('generate-resources', {"count": count, "types": types, "themes": themes, "niveaux": niveaux}, count)
+
+@jobs.task('generate-resources')
+def _generate_resources_job(ctx, count, types, themes, niveaux):
     import random
-    for i in range(count):
-        res = {
-            "id": str(len(internet_resources) + 1),
-            "title": f"{random.choice(types).capitalize()} {random.choice(themes)} {random.choice(niveaux)}",
-            "description": f"Ressource pédagogique sur {random.choice(themes)} pour le niveau {random.choice(niveaux)}.",
-            "url": f"http://example.com/auto-resource-{len(internet_resources) + 1}",
-            "date": f"2023-07-{random.randint(10,28)}",
-            "content": f"Contenu auto-généré pour {random.choice(themes)}.",
-            "type": random.choice(types),
-            "theme": random.choice(themes),
-            "niveau": random.choice(niveaux)
-        }
-        internet_resources.append(res)
-    return jsonify({"message": f"{count} ressources pédagogiques générées."})
+    for size in _job_batches(count):
+        generated = []
+        for res_id in internet_resources.new_ids(size):
+            res = {
+                "id": res_id,
+                "title": f"{random.choice(types).capitalize()} {random.choice(themes)} {random.choice(niveaux)}",
+                "description": f"Ressource pédagogique sur {random.choice(themes)} pour le niveau {random.choice(niveaux)}.",
+                "url": f"http://example.com/auto-resource-{res_id}",
+                "date": f"2023-07-{random.randint(10,28)}",
+                "content": f"Contenu auto-généré pour {random.choice(themes)}.",
+                "type": random.choice(types),
+                "theme": random.choice(themes),
+                "niveau": random.choice(niveaux)
+            }
+            generated.append(res)
+        internet_resources.extend(generated)
+        ctx.advance(size)
+    return {"message": f"{count} ressources pédagogiques générées."}
 # Endpoint admin : génération automatique de séquences didactiques personnalisées
 @app.route('/api/admin/generate-custom-sequences', methods=['POST'])
 @role_required(['admin'])
 def generate_custom_sequences():
-    global sequences, next_sequence_id
     data = request.get_json() or {}
     niveaux = data.get('niveaux', ['A1', 'A2', 'B1', 'B2'])
     themes = data.get('themes', ['salutations', 'famille', 'école', 'nature'])
     modalites = data.get('modalites', ['présentiel', 'en ligne'])
-    count = int(data.get('count', 8))
+    count = _count_arg(data.get('count', 8))
+    if count is None:
+        return jsonify({"error": f"'count' doit être un entier entre 1 et {MAX_GENERATE_COUNT}."}), 400
+    return _submit_job('generate-custom-sequences',
+                       {"count": count, "niveaux": niveaux, "themes": themes, "modalites": modalites}, count)
+
+@jobs.task('generate-custom-sequences')
+def _generate_custom_sequences_job(ctx, count, niveaux, themes, modalites):
     import random
-    for _ in range(count):
-        seq = {
-            "id": next_sequence_id,
-            "titulo": f"Séquence {random.choice(niveaux)} - {random.choice(themes)}",
-            "modalidad": random.choice(modalites),
-            "niveau": random.choice(niveaux),
-            "theme": random.choice(themes)
-        }
-        sequences.append(seq)
-        next_sequence_id += 1
-    return jsonify({"message": f"{count} séquences personnalisées générées."})
+    for size in _job_batches(count):
+        generated = []
+        for _ in range(size):
+            seq = {
+                "titulo": f"Séquence {random.choice(niveaux)} - {random.choice(themes)}",
+                "modalidad": random.choice(modalites),
+                "niveau": random.choice(niveaux),
+                "theme": random.choice(themes)
+            }
+            generated.append(seq)
+        sequences.extend(generated)
+        ctx.advance(size)
+    return {"message": f"{count} séquences personnalisées générées."}
 # Endpoint public : métadonnées de l'API
 @app.route('/api/meta', methods=['GET'])
 def api_meta():
@@ -839,61 +1431,146 @@ def api_meta():
 @app.route('/api/admin/generate-sequences', methods=['POST'])
 @role_required(['admin'])
 def generate_sequences():
-    global sequences, next_sequence_id
-    count = int(request.args.get('count', 5))
-    for i in range(count):
-        seq = {
-            "id": next_sequence_id,
-            "titulo": f"Séquence auto {next_sequence_id}",
-            "modalidad": "présentiel" if next_sequence_id % 2 == 0 else "en ligne"
-        }
-        sequences.append(seq)
-        next_sequence_id += 1
-    return jsonify({"message": f"{count} séquences générées."})
+    count = _count_arg(request.args.get('count', 5))
+    if count is None:
+        return jsonify({"error": f"'count' doit être un entier entre 1 et {MAX_GENERATE_COUNT}."}), 400
+    return _submit_job('generate-sequences', {"count": count}, count)
+
+@jobs.task('generate-sequences')
+def _generate_sequences_job(ctx, count):
+    for size in _job_batches(count):
+        generated = []
+        for seq_id in sequences.new_ids(size):
+            seq = {
+                "id": seq_id,
+                "titulo": f"Séquence auto {seq_id}",
+                "modalidad": "présentiel" if seq_id % 2 == 0 else "en ligne"
+            }
+            generated.append(seq)
+        sequences.extend(generated)
+        ctx.advance(size)
+    return {"message": f"{count} séquences générées."}
 
 # Endpoint admin : générer automatiquement des utilisateurs de test
 @app.route('/api/admin/generate-users', methods=['POST'])
 @role_required(['admin'])
 def generate_users():
+    # Le hachage bcrypt est coûteux : il est fait en arrière-plan
+    return _submit_job('generate-users', {}, 5)
+
+@jobs.task('generate-users')
+def _generate_users_job(ctx):
     users_data = [
         {"username": f"testuser{i}", "password": f"test{i}pass", "roles": ["enseignant"]} for i in range(1, 6)
     ]
-    created = 0
-    for udata in users_data:
-        if not User.query.filter_by(username=udata["username"]).first():
-            user = User(username=udata["username"], password=bcrypt.generate_password_hash(udata["password"]).decode('utf-8'))
-            for rname in udata["roles"]:
-                role = Role.query.filter_by(name=rname).first()
-                user.roles.append(role)
-            db.session.add(user)
-            created += 1
+    created = _create_users(users_data)
+    ctx.advance(len(users_data))
+    return {"message": f"{created} utilisateurs de test générés."}
+
+def _create_users(users_data):
+    """Crée les comptes absents : deux requêtes (comptes existants, rôles) et des hachages en parallèle."""
+    usernames = [udata["username"] for udata in users_data]
+    existing = {u.username for u in User.query.filter(User.username.in_(usernames))}
+    missing = [udata for udata in users_data if udata["username"] not in existing]
+    if not missing:
+        return 0
+    role_names = {rname for udata in missing for rname in udata["roles"]}
+    roles = {role.name: role for role in Role.query.filter(Role.name.in_(role_names))}
+    hashes = password_hasher.hash_many([udata["password"] for udata in missing])
+    for udata, pw_hash in zip(missing, hashes):
+        user = User(username=udata["username"], password=pw_hash)
+        user.roles.extend(roles[rname] for rname in udata["roles"] if rname in roles)
+        db.session.add(user)
     db.session.commit()
-    return jsonify({"message": f"{created} utilisateurs de test générés."})
+    return len(missing)
 # Endpoint admin : exporter toutes les données mock
 @app.route('/api/admin/export-mocks', methods=['GET'])
 @role_required(['admin'])
 def export_mocks():
     return jsonify({
-        "sequences": sequences,
-        "library_documents": library_documents,
-        "internet_resources": internet_resources
+        "sequences": sequences.all(),
+        "library_documents": library_documents.all(),
+        "internet_resources": internet_resources.all()
     })
 
 # Endpoint admin : importer des données mock (remplace tout)
 @app.route('/api/admin/import-mocks', methods=['POST'])
 @role_required(['admin'])
 def import_mocks():
-    global sequences, next_sequence_id, library_documents, internet_resources
     data = request.get_json() or {}
-    sequences = data.get("sequences", [])
-    # recalculer next_sequence_id
-    if sequences:
-        next_sequence_id = max(seq.get("id", 0) for seq in sequences) + 1
-    else:
-        next_sequence_id = 1
-    library_documents = data.get("library_documents", [])
-    internet_resources = data.get("internet_resources", [])
+    # Chaque collection est remplacée en une transaction ; le compteur d'ids repart du plus grand id importé
+    sequences.replace_all(data.get("sequences", []))
+    library_documents.replace_all(data.get("library_documents", []))
+    internet_resources.replace_all(data.get("internet_resources", []))
     return jsonify({"message": "Mock data importés."})
+
+# Instantanés binaires (voir snapshot.py) : export en flux, import différentiel
+SNAPSHOT_BATCH = 500
+
+def _snapshot_collections():
+    return {"sequences": sequences, "library_documents": library_documents, "internet_resources": internet_resources}
+
+# Endpoint admin : exporter un instantané binaire compressé (?collections=a,b, ?compression=gzip|zstd)
+@app.route('/api/admin/export-snapshot', methods=['GET'])
+@role_required(['admin'])
+def export_snapshot():
+    available = _snapshot_collections()
+    names = [n for n in request.args.get('collections', '').split(',') if n] or list(available)
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        return jsonify({"error": f"Collections inconnues : {', '.join(unknown)}"}), 400
+    compression = request.args.get('compression') or SNAPSHOT_COMPRESSIONS[0]
+    if compression not in SNAPSHOT_COMPRESSIONS:
+        return jsonify({"error": f"Compression non disponible (valeurs : {', '.join(SNAPSHOT_COMPRESSIONS)})"}), 400
+    # Listes figées avant l'envoi : l'instantané reflète l'état à cet instant, même si des écritures suivent
+    frozen = {name: available[name].all() for name in names}
+    filename = f"genseqdid-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.snap"
+    return Response(stream_with_context(write_snapshot(frozen, compression)), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Endpoint admin : restaurer un instantané (corps brut ou fichier 'file') ; seuls les enregistrements
+# ajoutés, modifiés ou supprimés sont écrits. ?dry_run=1 renvoie le diff sans rien modifier
+@app.route('/api/admin/import-snapshot', methods=['POST'])
+@role_required(['admin'])
+def import_snapshot():
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    file = request.files.get('file')
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+        shutil.copyfileobj(file.stream if file else request.stream, upload)
+        try:
+            reader = SnapshotReader(upload)
+            # Toutes les sections sont vérifiées avant la première écriture
+            reader.verify()
+        except SnapshotError as e:
+            return jsonify({"error": str(e)}), 400
+        available = _snapshot_collections()
+        summary = {}
+        for name in reader.collections:
+            collection = available.get(name)
+            if collection is None:
+                continue
+            current = {collection.key(record['id']): record for record in collection.all()}
+            counts = {"added": 0, "changed": 0, "removed": 0}
+            batch, removed = [], []
+            for op, item in diff_records(reader.records(name), current, key=lambda r: collection.key(r.get('id'))):
+                if op == 'delete':
+                    removed.append(item)
+                    continue
+                counts["changed" if collection.key(item.get('id')) in current else "added"] += 1
+                if not dry_run:
+                    batch.append(item)
+                    if len(batch) >= SNAPSHOT_BATCH:
+                        collection.extend(batch)
+                        batch = []
+            counts["removed"] = len(removed)
+            if batch:
+                collection.extend(batch)
+            if not dry_run:
+                for start in range(0, len(removed), SNAPSHOT_BATCH):
+                    collection.delete_many(removed[start:start + SNAPSHOT_BATCH])
+            counts["unchanged"] = reader.collections[name] - counts["added"] - counts["changed"]
+            summary[name] = counts
+    return jsonify({"dry_run": dry_run, "collections": summary})
 # Variable globale pour le mode maintenance
 maintenance_mode = False
 
@@ -906,25 +1583,22 @@ def set_maintenance():
     maintenance_mode = bool(data.get("enabled", False))
     return jsonify({"maintenance": maintenance_mode})
 
+# Endpoints toujours accessibles en mode maintenance
+MAINTENANCE_ENDPOINTS = frozenset((
+    'status', 'api_version', 'openapi_spec', 'list_endpoints', 'demo_token', 'static', 'metrics_endpoint',
+    'swagger_ui.show'
+))
+
 # Middleware : bloquer l'API en mode maintenance (sauf admin et endpoints publics)
-@app.before_request
+# Première étape : hors maintenance, un seul test de drapeau
+@pipeline.step(10)
 def check_maintenance():
-    public_endpoints = [
-        'status', 'api_version', 'openapi_spec', 'list_endpoints', 'demo_token', 'static',
-        'swaggerui.blueprint', 'swaggerui.static'
-    ]
-    if maintenance_mode:
-        # Autoriser admin
-        try:
-            claims = get_jwt()
-            if 'admin' in claims.get('roles', []):
-                return
-        except Exception:
-            pass
-        # Autoriser endpoints publics
-        if request.endpoint in public_endpoints:
-            return
-        return jsonify({"error": "API en maintenance"}), 503
+    if not maintenance_mode or request.endpoint in MAINTENANCE_ENDPOINTS:
+        return
+    # Autoriser admin (claims mémoïsés : la vue ne redécode pas le token)
+    if 'admin' in optional_claims().get('roles', []):
+        return
+    return jsonify({"error": "API en maintenance"}), 503
 # Endpoint public : génération d'un token JWT demo (lecture seule)
 @app.route('/api/auth/demo-token', methods=['GET'])
 def demo_token():
@@ -932,6 +1606,7 @@ def demo_token():
     return jsonify({"access_token": access_token})
 # Endpoint public : liste des endpoints disponibles
 @app.route('/api/endpoints', methods=['GET'])
+@response_cache.cached()
 def list_endpoints():
     output = []
     for rule in app.url_map.iter_rules():
@@ -955,21 +1630,19 @@ def api_version():
 @app.route('/api/admin/reset-mocks', methods=['POST'])
 @role_required(['admin'])
 def reset_mocks():
-    global sequences, next_sequence_id, library_documents, internet_resources
-    sequences = []
-    next_sequence_id = 1
-    library_documents = [
+    sequences.clear()
+    library_documents.replace_all([
         {"id": "1", "title": "Document 1", "description": "Description du Document 1", "url": "http://example.com/doc1", "date": "2023-01-01", "content": "Contenu du Document 1"},
         {"id": "2", "title": "Document 2", "description": "Description du Document 2", "url": "http://example.com/doc2", "date": "2023-01-02", "content": "Contenu du Document 2"},
         {"id": "3", "title": "Grammaire de la langue maya", "description": "Ouvrage de référence sur la grammaire maya.", "url": "http://example.com/maya-grammaire", "date": "2023-02-01", "content": "Contenu sur la grammaire maya."},
         {"id": "4", "title": "Histoire du peuple maya", "description": "Document historique sur la civilisation maya.", "url": "http://example.com/maya-histoire", "date": "2023-03-01", "content": "Contenu historique maya."}
-    ]
-    internet_resources = [
+    ])
+    internet_resources.replace_all([
         {"id": "1", "title": "Ressource 1", "description": "Description de la Ressource 1", "url": "http://example.com/res1", "date": "2023-01-01", "content": "Contenu de la Ressource 1"},
         {"id": "2", "title": "Ressource 2", "description": "Description de la Ressource 2", "url": "http://example.com/res2", "date": "2023-01-02", "content": "Contenu de la Ressource 2"},
         {"id": "3", "title": "Cours de maya en ligne", "description": "Ressource pédagogique pour apprendre le maya.", "url": "http://example.com/maya-cours", "date": "2023-04-01", "content": "Cours interactif de langue maya."},
         {"id": "4", "title": "Podcast sur la culture maya", "description": "Podcast audio sur la culture et la langue maya.", "url": "http://example.com/maya-podcast", "date": "2023-05-01", "content": "Podcast en langue maya."}
-    ]
+    ])
     return jsonify({"message": "Mock data réinitialisés."})
 # Endpoint admin : liste des utilisateurs mock
 @app.route('/api/users', methods=['GET'])
@@ -1029,12 +1702,171 @@ class Role(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
 
+# Contenus pédagogiques : l'enregistrement JSON complet (tags et commentaires compris)
+# plus les champs de filtrage en colonnes indexées
+class ContentRecordMixin:
+    row_id = db.Column(db.Integer, primary_key=True)
+    niveau = db.Column(db.String(64), index=True)
+    theme = db.Column(db.String(128), index=True)
+    modalidad = db.Column(db.String(64), index=True)
+    langue = db.Column(db.String(32), index=True)
+    dialecte = db.Column(db.String(64), index=True)
+    data = db.Column(db.JSON, nullable=False)
+
+class Sequence(ContentRecordMixin, db.Model):
+    id = db.Column(db.Integer, unique=True, nullable=False)
+
+class InternetResource(ContentRecordMixin, db.Model):
+    id = db.Column(db.String(64), unique=True, nullable=False)
+
+class LibraryDocument(ContentRecordMixin, db.Model):
+    id = db.Column(db.String(64), unique=True, nullable=False)
+
+# Journal des écritures, relu par les autres workers pour synchroniser leurs index en mémoire
+class DataChange(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    collection = db.Column(db.String(32), nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    item_id = db.Column(db.String(64))
+    __table_args__ = (db.Index('ix_data_change_collection_id', 'collection', 'id'),)
+
+# Compteurs d'identifiants partagés entre workers
+class IdCounter(db.Model):
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# Favoris (relation 'favorite') et partages (relation 'shared') par utilisateur
+class UserItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), nullable=False)
+    relation = db.Column(db.String(16), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    item_id = db.Column(db.String(64), nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('username', 'relation', 'kind', 'item_id'),
+        db.Index('ix_user_item_username_relation', 'username', 'relation'),
+    )
+
+class SequenceStatus(db.Model):
+    sequence_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(32), nullable=False)
+
+class WorkSession(db.Model):
+    # Identifiant aléatoire : une session ne se devine pas à partir d'une autre
+    id = db.Column(db.String(32), primary_key=True, default=lambda: secrets.token_urlsafe(12))
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+
+class SessionMember(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('work_session.id'), nullable=False, index=True)
+    username = db.Column(db.String(80), nullable=False)
+    __table_args__ = (db.UniqueConstraint('session_id', 'username'),)
+
+class SessionMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('work_session.id'), nullable=False)
+    # Numéro du message dans sa session (1, 2, 3...) : curseur des lectures incrémentales
+    seq = db.Column(db.Integer, nullable=False)
+    user = db.Column(db.String(80))
+    message = db.Column(db.Text)
+    __table_args__ = (db.UniqueConstraint('session_id', 'seq'),)
+
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.JSON)
+    __table_args__ = (db.UniqueConstraint('username', 'seq'),)
+
+# Boîte de réception : dernier numéro attribué et curseur de lecture de chaque utilisateur
+class NotificationInbox(db.Model):
+    username = db.Column(db.String(80), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    read_seq = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    id = db.Column(db.String(32), primary_key=True, default=lambda: secrets.token_urlsafe(12))
+    kind = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False, index=True)
+    params = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Processus qui détient la tâche (hôte:pid) et son dernier battement de cœur (voir jobs.py)
+    owner = db.Column(db.String(128))
+    heartbeat_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status,
+            "progress": self.progress, "total": self.total,
+            "cancel_requested": self.cancel_requested, "created_by": self.created_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "owner": self.owner, "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            "result": self.result, "error": self.error
+        }
+
+jobs.init_app(app, db, Job)
+
+# Mémoire de traduction : une entrée par phrase normalisée et paire de langues
+class TranslationUnit(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source_lang = db.Column(db.String(16), nullable=False)
+    target_lang = db.Column(db.String(16), nullable=False)
+    key_hash = db.Column(db.String(40), nullable=False)
+    source_text = db.Column(db.Text, nullable=False)
+    target_text = db.Column(db.Text, nullable=False)
+    # Dernière écriture (ajout ou correction) : les autres workers rattrapent les entrées plus récentes
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    __table_args__ = (
+        db.UniqueConstraint('source_lang', 'target_lang', 'key_hash'),
+        db.Index('ix_translation_unit_pair_updated', 'source_lang', 'target_lang', 'updated_at'),
+    )
+
+translator.init_app(db, TranslationUnit)
+
+class WebhookSubscription(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    events = db.Column(db.JSON)
+    secret = db.Column(db.String(128))
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_by = db.Column(db.String(80))
+
+# Envois de webhooks en attente (status 'pending') et lettres mortes ('dead') ; les envois réussis sont supprimés
+class WebhookDelivery(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('webhook_subscription.id'), nullable=False)
+    # Identifiant de l'événement, commun à ses envois vers les différentes destinations
+    event_id = db.Column(db.String(24), nullable=False)
+    event = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(16), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    claim = db.Column(db.String(16), index=True)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.Index('ix_webhook_delivery_status_due', 'status', 'next_attempt_at'),)
+
+webhook_dispatcher.init_app(app, db, WebhookSubscription, WebhookDelivery)
+
 # Initialisation de la base et création des utilisateurs/rôles mock
 def init_db():
     db.create_all()
     # Création des rôles si non existants
-    for role_name in ["enseignant", "chercheur", "admin"]:
-        if not Role.query.filter_by(name=role_name).first():
+    role_names = ["enseignant", "chercheur", "admin"]
+    existing_roles = {role.name for role in Role.query.filter(Role.name.in_(role_names))}
+    for role_name in role_names:
+        if role_name not in existing_roles:
             db.session.add(Role(name=role_name))
     db.session.commit()
     # Création des utilisateurs mock
@@ -1043,62 +1875,165 @@ def init_db():
         {"username": "chercheur", "password": "chercheur123", "roles": ["chercheur"]},
         {"username": "admin", "password": "admin123", "roles": ["admin"]}
     ]
-    for udata in users_data:
-        if not User.query.filter_by(username=udata["username"]).first():
-            user = User(username=udata["username"], password=bcrypt.generate_password_hash(udata["password"]).decode('utf-8'))
-            for rname in udata["roles"]:
-                role = Role.query.filter_by(name=rname).first()
-                user.roles.append(role)
-            db.session.add(user)
-    db.session.commit()
-
+    _create_users(users_data)
+    init_store()
 
-# Décorateur personnalisé pour vérifier le rôle
-def role_required(required_roles):
-    def decorator(fn):
-        @jwt_required()
-        def wrapper(*args, **kwargs):
-            claims = get_jwt()
-            user_roles = claims.get('roles', [])
-            if any(role in user_roles for role in required_roles):
-                return fn(*args, **kwargs)
-            return jsonify({"msg": "Accès refusé : rôle requis"}), 403
-        wrapper.__name__ = fn.__name__
-        return wrapper
-    return decorator
 
+# Attache les collections en mémoire à leurs tables (une fois par processus)
+store_ready = False
 
-
-
-# Mock databases
-sequences = []
-next_sequence_id = 1
-library_documents = [
+def init_store():
+    global store_ready
+    if store_ready:
+        return
+    try:
+        db.create_all()
+    except OperationalError:
+        # Tables créées en parallèle par un autre worker
+        db.session.rollback()
+    for collection, model, name in ((sequences, Sequence, 'sequences'),
+                                    (internet_resources, InternetResource, 'internet_resources'),
+                                    (library_documents, LibraryDocument, 'library_documents')):
+        collection.bind(SqlBackend(db, model, name, DataChange, IdCounter))
+    # Tâches laissées par un worker arrêté (redémarrage, plantage)
+    jobs.recover()
+    store_ready = True
+
+# Endpoints qui ne lisent pas les collections : pas de lecture du journal des modifications
+STORE_FREE_ENDPOINTS = frozenset((
+    'status', 'api_version', 'openapi_spec', 'list_endpoints', 'demo_token', 'static', 'swagger_ui.show',
+    'login', 'refresh'
+))
+
+# Chaque requête rejoue d'abord les écritures faites par les autres workers
+@pipeline.step(20)
+def sync_store():
+    if not store_ready:
+        init_store()
+    elif request.endpoint not in STORE_FREE_ENDPOINTS:
+        sync_collections(sequences, internet_resources, library_documents)
+
+
+
+
+
+# Mock databases (collections indexées par id et par niveau/thème/modalité/langue/dialecte)
+sequences = Collection(id_type=int)
+library_documents = Collection(id_type=str, records=[
     {"id": "1", "title": "Document 1", "description": "Description du Document 1", "url": "http://example.com/doc1", "date": "2023-01-01", "content": "Contenu du Document 1"},
     {"id": "2", "title": "Document 2", "description": "Description du Document 2", "url": "http://example.com/doc2", "date": "2023-01-02", "content": "Contenu du Document 2"},
     {"id": "3", "title": "Grammaire de la langue maya", "description": "Ouvrage de référence sur la grammaire maya.", "url": "http://example.com/maya-grammaire", "date": "2023-02-01", "content": "Contenu sur la grammaire maya."},
     {"id": "4", "title": "Histoire du peuple maya", "description": "Document historique sur la civilisation maya.", "url": "http://example.com/maya-histoire", "date": "2023-03-01", "content": "Contenu historique maya."}
-]
-internet_resources = [
+])
+internet_resources = Collection(id_type=str, records=[
     {"id": "1", "title": "Ressource 1", "description": "Description de la Ressource 1", "url": "http://example.com/res1", "date": "2023-01-01", "content": "Contenu de la Ressource 1"},
     {"id": "2", "title": "Ressource 2", "description": "Description de la Ressource 2", "url": "http://example.com/res2", "date": "2023-01-02", "content": "Contenu de la Ressource 2"},
     {"id": "3", "title": "Cours de maya en ligne", "description": "Ressource pédagogique pour apprendre le maya.", "url": "http://example.com/maya-cours", "date": "2023-04-01", "content": "Cours interactif de langue maya."},
     {"id": "4", "title": "Podcast sur la culture maya", "description": "Podcast audio sur la culture et la langue maya.", "url": "http://example.com/maya-podcast", "date": "2023-05-01", "content": "Podcast en langue maya."}
-]
+])
+# Index plein texte maintenu à chaque écriture sur les collections
+search_index = InvertedIndex()
+search_index.attach(sequences, 'sequence')
+search_index.attach(internet_resources, 'resource')
+# Statistiques de /api/corpus-analysis et /api/stats, tenues à jour par les mêmes notifications
+corpus_stats = CorpusStats()
+corpus_stats.attach(sequences, 'sequence', 'description', histograms=True)
+corpus_stats.attach(internet_resources, 'resource', 'content')
+# Clés de tri de /api/sequences (id et champs indexés), tenues triées à l'écriture
+sequence_order = SortedKeys(('id', *sequences.indexed_fields))
+sequence_order.attach(sequences)
+# Versions de données des réponses mises en cache (voir response_cache.cached)
+response_cache.track('sequences', sequences)
+response_cache.track('library_documents', library_documents)
+response_cache.track('internet_resources', internet_resources)
+# Voisins les plus proches de chaque élément, recalculés à l'écriture (voir /api/suggestions)
+suggestion_engine = SuggestionEngine(k=int(os.environ.get('SUGGESTION_NEIGHBORS', 20)))
+suggestion_engine.attach(sequences, 'sequence')
+suggestion_engine.attach(internet_resources, 'resource')
+suggestion_engine.attach(library_documents, 'document')
+# Signatures MinHash pour /api/similarity/duplicates
+duplicate_index = MinHashIndex()
+duplicate_index.attach(sequences, 'sequence')
+duplicate_index.attach(internet_resources, 'resource')
+# Classement des phrases des documents et ressources pour leurs résumés (recalculé quand le texte change)
+summarizer = Summarizer(cache_size=int(os.environ.get('SUMMARY_CACHE_SIZE', 4096)))
+summarizer.attach(library_documents, 'document')
+summarizer.attach(internet_resources, 'resource')
+
+# Webhooks : écritures locales sur les séquences et ressources
+webhook_dispatcher.attach(sequences, 'sequence')
+webhook_dispatcher.attach(internet_resources, 'resource')
+
+@app.after_request
+def dispatch_webhooks(response):
+    # Événements déjà inscrits avec l'écriture : le thread d'envoi les envoie par lots, hors de la requête
+    webhook_dispatcher.wake()
+    return response
+
+@app.after_request
+def update_suggestions(response):
+    # Seules les requêtes qui ont écrit (ou rejoué des écritures) dans une collection suivie ont des voisins à
+    # recalculer ; un gros arriéré part au thread de fond
+    if suggestion_engine.pending:
+        suggestion_engine.wake()
+    return response
+# Tailles exposées par /metrics, calculées à la lecture
+metrics.gauge('collection_size', "Éléments dans les collections du processus.", lambda: {
+    ('sequences',): len(sequences),
+    ('internet_resources',): len(internet_resources),
+    ('library_documents',): len(library_documents),
+}, labels=('collection',))
+metrics.gauge('work_sessions', "Sessions de travail collaboratives en base.",
+              lambda: db.session.scalar(select(func.count()).select_from(WorkSession)))
+metrics.gauge('translation_segments_total', "Phrases traduites par origine (lru, memory, backend).",
+              lambda: {(origin,): translator.counts[origin] for origin in TRANSLATION_SOURCES},
+              labels=('origin',), type='counter')
+metrics.gauge('webhook_events_total', "Événements de webhooks envoyés, refusés (à retenter) ou abandonnés.",
+              lambda: {(outcome,): webhook_dispatcher.counts[outcome] for outcome in WEBHOOK_OUTCOMES},
+              labels=('outcome',), type='counter')
+metrics.gauge('quiz_cache_total', "Quiz servis depuis le cache (hit) ou générés (miss).",
+              lambda: {('hit',): quiz_generator.hits, ('miss',): quiz_generator.misses},
+              labels=('result',), type='counter')
+metrics.gauge('summary_rankings_total', "Classements de phrases calculés, repris d'un contenu identique, ou inutiles (texte inchangé).",
+              lambda: {(result,): summarizer.counts[result] for result in ('computed', 'reused', 'unchanged')},
+              labels=('result',), type='counter')
+metrics.gauge('audit_log_length', "Événements d'audit conservés en mémoire.", lambda: len(audit_log))
+
+# Endpoint public (ou protégé par METRICS_TOKEN) : métriques au format texte Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"error": "Accès refusé"}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
-    user = User.query.filter_by(username=username).first()
-    if user and bcrypt.check_password_hash(user.password, password):
-        roles = [role.name for role in user.roles]
+    user = User.query.options(selectinload(User.roles)).filter_by(username=username).first()
+    try:
+        valid = user is not None and password_hasher.check(user.password, password)
+    except PasswordHasherBusy:
+        return jsonify({"msg": "Service de connexion saturé, réessayez."}), 503, {'Retry-After': '1'}
+    if valid:
+        claims = {"roles": [role.name for role in user.roles], "username": user.username}
         # Force l'identity à être une chaîne pour éviter le bug PyJWT/Flask-JWT-Extended
-        access_token = create_access_token(identity=str(user.id), additional_claims={"roles": roles, "username": user.username})
-        return jsonify(access_token=access_token), 200
+        access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+        refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
+        return jsonify(access_token=access_token, refresh_token=refresh_token), 200
     return jsonify({"msg": "Identifiants invalides"}), 401
 
+# Nouveau jeton d'accès à partir du jeton de rafraîchissement (Authorization: Bearer <refresh_token>)
+@app.route('/api/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    claims = get_jwt()
+    access_token = create_access_token(identity=claims['sub'], additional_claims={
+        "roles": claims.get('roles', []), "username": claims.get('username')})
+    return jsonify(access_token=access_token), 200
+
 # Exemple d'endpoint protégé par JWT et rôle
 @app.route('/api/protected', methods=['GET'])
 @role_required(['admin'])
@@ -1113,7 +2048,6 @@ def protected():
 @app.route('/api/sequences', methods=['POST'])
 @jwt_required()
 def create_sequence():
-    global next_sequence_id
     if not request.is_json:
         return jsonify({"msg": "El cuerpo de la solicitud debe ser un objeto JSON."}), 400
     data = request.get_json()
@@ -1129,15 +2063,40 @@ def create_sequence():
     data.setdefault("contexte_culturel", "scolaire")
     data.setdefault("support_audio", None)
     data.setdefault("support_video", None)
-    data["id"] = next_sequence_id
-    next_sequence_id += 1
-    sequences.append(data)
+    data["id"] = sequences.new_id()
+    sequences.add(data)
     return jsonify({"message": t('created'), "data": data}), 201
 
 @app.route('/api/sequences', methods=['GET'])
 @jwt_required()
+@response_cache.cached('sequences')
 def get_sequences():
-    return jsonify(sequences)
+    fields = fields_arg(request.args.get('fields'))
+    # Lecture groupée : ?ids=1,2,3 renvoie les séquences existantes dans l'ordre demandé
+    if request.args.get('ids'):
+        ids = [id for id in request.args['ids'].split(',') if id.strip()]
+        if len(ids) > MAX_PAGE_SIZE:
+            return jsonify({"error": f"{MAX_PAGE_SIZE} identifiants au maximum."}), 400
+        found = (sequences.get(id.strip()) for id in ids)
+        return jsonify([project(seq, fields) for seq in found if seq is not None])
+    # Filtres optionnels (?niveau=...&theme=...) résolus par les index secondaires
+    filters = {field: request.args.get(field) or None for field in sequences.indexed_fields}
+    # Pagination par curseur (?page_size=&cursor=) et tri serveur (?sort=champ ou -champ, id par défaut)
+    field, descending = sort_arg(request.args.get('sort'))
+    cursor, page_size = request.args.get('cursor'), page_size_arg(request.args.get('page_size'))
+    try:
+        if field in sequence_order.fields and not any(filters.values()):
+            # Tri par id ou champ indexé, sans filtre : clés déjà triées, recherche du curseur par dichotomie
+            page, next_cursor = sequence_order.page(field, cursor, page_size, reverse=descending)
+        else:
+            page, next_cursor = paginate(sequences.filter(**filters), key=sort_key(field), cursor=cursor,
+                                         page_size=page_size, reverse=descending)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify([project(seq, fields) for seq in page])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 
@@ -1149,26 +2108,129 @@ def update_sequence(id):
     data = request.get_json()
     if not isinstance(data, dict):
         return jsonify({"msg": "El cuerpo de la solicitud debe ser un objeto JSON válido."}), 400
-    for seq in sequences:
-        if seq.get("id") == id:
-            seq.update(data)
-            seq["id"] = id  # On garde l'id inchangé
-            return jsonify({"message": t('updated'), "data": seq})
+    seq = sequences.update(id, data)  # On garde l'id inchangé
+    if seq is not None:
+        return jsonify({"message": t('updated'), "data": seq})
     return jsonify({"message": t('sequence_not_found')}), 404
 
 
 @app.route('/api/sequences/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_sequence(id):
-    for i, seq in enumerate(sequences):
-        if seq.get("id") == id:
-            sequences.pop(i)
-            return jsonify({"message": t('deleted')})
+    if sequences.delete(id) is not None:
+        return jsonify({"message": t('deleted')})
     return jsonify({"message": t('sequence_not_found')}), 404
 
+# Écritures groupées : create/update/delete/tag/comment/favorite appliqués en un aller-retour
+MAX_BULK_OPERATIONS = 1000
+BULK_REQUIRED_FIELDS = {'sequences': ("titulo", "modalidad"), 'resources': ("title",)}
+
+def _bulk_tags(op):
+    tags = op.get('tags') if 'tags' in op else [op.get('tag')]
+    if not isinstance(tags, list):
+        return None
+    return [tag for tag in tags if isinstance(tag, str) and tag]
+
+def _apply_bulk(collection, kind, operations, user, atomic=False):
+    """Valide toutes les opérations sur une copie de travail puis écrit le lot (une transaction par type d'écriture)."""
+    results, working, created, deleted, favorites = [], {}, [], [], []
+    for index, op in enumerate(operations):
+        result = {"index": index, "status": 200}
+        results.append(result)
+        action = op.get('op') if isinstance(op, dict) else None
+        if action == 'create':
+            data = op.get('data')
+            if not isinstance(data, dict):
+                result.update(status=400, error="Champ 'data' (objet) requis.")
+                continue
+            missing = [f for f in BULK_REQUIRED_FIELDS[kind] if not data.get(f)]
+            if missing:
+                result.update(status=400, error=f"Champ obligatoire absent ou vide : {missing[0]}.")
+                continue
+            record = dict(data)
+            if kind == 'sequences':
+                for field, default in (("dialecte", "yucatèque"), ("contexte_culturel", "scolaire"),
+                                       ("support_audio", None), ("support_video", None)):
+                    record.setdefault(field, default)
+            created.append((result, record))
+            result['status'] = 201
+            continue
+        if action not in ('update', 'delete', 'tag', 'comment', 'favorite'):
+            result.update(status=400, error="Opération inconnue (create, update, delete, tag, comment, favorite).")
+            continue
+        key = collection.key(op.get('id'))
+        result['id'] = key
+        if key is None or key in deleted or (key not in working and key not in collection):
+            result.update(status=404, error="Élément introuvable.")
+            continue
+        if action == 'delete':
+            working.pop(key, None)
+            deleted.append(key)
+            continue
+        if action == 'favorite':
+            favorites.append(key)
+            continue
+        record = working.get(key) or dict(collection.get(key))
+        if action == 'update':
+            data = op.get('data')
+            if not isinstance(data, dict):
+                result.update(status=400, error="Champ 'data' (objet) requis.")
+                continue
+            record.update(data)
+            record['id'] = key
+        elif action == 'tag':
+            tags = _bulk_tags(op)
+            if tags is None:
+                result.update(status=400, error="Champ 'tags' (liste) invalide.")
+                continue
+            current = record.get('tags', [])
+            record['tags'] = current + [tag for tag in dict.fromkeys(tags) if tag not in current]
+        elif action == 'comment':
+            comment = op.get('comment')
+            if not comment:
+                result.update(status=400, error="Champ 'comment' requis.")
+                continue
+            record['comments'] = record.get('comments', []) + [{"user": user, "comment": comment}]
+        working[key] = record
+    if atomic and any(result['status'] >= 400 for result in results):
+        return results, False
+    for (result, record), new_id in zip(created, collection.new_ids(len(created)) if created else ()):
+        record['id'] = result['id'] = new_id
+    if working or created:
+        collection.extend(list(working.values()) + [record for _, record in created])
+    if deleted:
+        collection.delete_many(deleted)
+    if favorites:
+        _add_user_items(user, 'favorite', kind, favorites)
+    return results, True
+
+def _bulk_endpoint(collection, kind):
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({"error": "Champ 'operations' (liste) requis."}), 400
+    if len(operations) > MAX_BULK_OPERATIONS:
+        return jsonify({"error": f"{MAX_BULK_OPERATIONS} opérations au maximum par lot."}), 400
+    user = get_jwt().get('username', 'anonyme')
+    results, applied = _apply_bulk(collection, kind, operations, user, atomic=bool(data.get('atomic')))
+    failed = sum(1 for result in results if result['status'] >= 400)
+    return jsonify({"applied": applied, "succeeded": len(results) - failed if applied else 0,
+                    "failed": failed, "results": results}), 200 if applied else 409
+
+@app.route('/api/sequences/bulk', methods=['POST'])
+@jwt_required()
+def bulk_sequences():
+    return _bulk_endpoint(sequences, 'sequences')
+
+@app.route('/api/internet/resources/bulk', methods=['POST'])
+@jwt_required()
+def bulk_resources():
+    return _bulk_endpoint(internet_resources, 'resources')
+
 
 @app.route('/api/library/search', methods=['GET'])
 @jwt_required()
+@response_cache.cached('library_documents')
 def search_library():
     query = request.args.get('query', '')
     try:
@@ -1198,13 +2260,15 @@ def search_library():
 @app.route('/api/library/documents/<string:id>', methods=['GET'])
 @jwt_required()
 def get_library_document(id):
-    for doc in library_documents:
-        if doc['id'] == id:
-            return jsonify(doc)
+    doc = library_documents.get(id)
+    if doc is not None:
+        suggestion_engine.record_view(get_jwt().get('username', 'anonyme'), ('document', doc['id']))
+        return jsonify(doc)
     return jsonify({"message": t('document_not_found')}), 404
 
 @app.route('/api/internet/search', methods=['GET'])
 @jwt_required()
+@response_cache.cached('internet_resources')
 def search_internet():
     query = request.args.get('query', '')
     try:
@@ -1234,10 +2298,15 @@ def search_internet():
 @app.route('/api/internet/resources/<string:id>', methods=['GET'])
 @jwt_required()
 def get_internet_resource(id):
-    for res in internet_resources:
-        if res['id'] == id:
-            return jsonify(res)
+    res = internet_resources.get(id)
+    if res is not None:
+        suggestion_engine.record_view(get_jwt().get('username', 'anonyme'), ('resource', res['id']))
+        return jsonify(res)
+    return jsonify({"message": t('resource_not_found')}), 404
+
 
+# Toutes les routes sont déclarées : la spécification OpenAPI est figée pour la durée du processus
+openapi_document = generate_openapi_spec()
 
 if __name__ == '__main__':
     with app.app_context():
@@ -0,0 +1,99 @@
+"""Journal d'audit borné : tampon circulaire en mémoire et écriture asynchrone par lots."""
+import atexit
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+
+class AuditLog:
+    """Garde les ``capacity`` derniers événements en mémoire et les ajoute à un fichier JSON Lines.
+
+    ``record`` ne bloque jamais la requête : les entrées passent par une file bornée
+    vidée par un thread d'écriture (un par processus) ; si la file est pleine,
+    l'entrée n'est conservée qu'en mémoire et comptée dans ``dropped``.
+    """
+
+    def __init__(self, path=None, capacity=1000, queue_size=10000, batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._recent = deque(maxlen=capacity)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def record(self, entry):
+        self._recent.append(entry)
+        if not self.path:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def recent(self, limit=100):
+        entries = list(self._recent)
+        return entries[-limit:] if limit else entries
+
+    def __len__(self):
+        return len(self._recent)
+
+    def _ensure_writer(self):
+        # Le thread est (re)démarré dans chaque processus, y compris après un fork de worker
+        if self._writer is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            if batch[0] is None:
+                return
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        # Un seul write() en mode append par lot : les lignes de plusieurs workers ne s'entremêlent pas
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in batch)
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Audit : écriture impossible dans {self.path} ({e})")
+
+    def close(self):
+        """Vide la file et arrête le thread d'écriture (appelé à la sortie du processus)."""
+        writer = self._writer
+        if writer is None or self._pid != os.getpid() or not writer.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            return
+        writer.join(timeout=5)
+        self._writer = None
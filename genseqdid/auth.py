@@ -0,0 +1,151 @@
+"""Authentification JWT : un seul décodage par requête, cache des tokens déjà vérifiés et contrôle des rôles.
+
+Remplace ``jwt_required`` / ``get_jwt`` de Flask-JWT-Extended pour les vues de l'API : les
+claims sont décodés au plus une fois par requête (mémoïsés sur ``g``) et la vérification de
+signature est évitée pour les tokens vus récemment. Les erreurs levées restent celles de
+Flask-JWT-Extended, donc les réponses 401/422 de ``JWTManager`` sont inchangées.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException, NoAuthorizationError, WrongTokenError
+from jwt.exceptions import PyJWTError
+
+
+class TokenCache:
+    """LRU des claims de tokens déjà vérifiés, indexé par empreinte SHA-256 du token.
+
+    Une entrée n'est jamais servie après l'expiration (``exp``) du token.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, claims.get('exp'))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+def _bearer_token():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def load_claims():
+    """Claims du token de la requête courante (None si absent ou invalide), décodés au plus une fois."""
+    if 'jwt_claims' in g:
+        return g.jwt_claims
+    g.jwt_claims, g.jwt_error = None, None
+    token = _bearer_token()
+    if token is None:
+        g.jwt_error = NoAuthorizationError('Missing Authorization Header')
+        return None
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            claims = decode_token(token)
+        except (JWTExtendedException, PyJWTError) as e:
+            g.jwt_error = e
+            return None
+        token_cache.put(token, claims)
+    g.jwt_claims = claims
+    return claims
+
+
+def optional_claims():
+    """Claims si la requête porte un token valide, sinon un dict vide (jamais d'erreur)."""
+    return load_claims() or {}
+
+
+def get_jwt():
+    """Claims du token courant ; à utiliser dans une vue protégée par ``jwt_required``."""
+    claims = g.get('jwt_claims')
+    if claims is None:
+        raise RuntimeError("You must call @jwt_required() before using this method")
+    return claims
+
+
+def get_jwt_identity():
+    return get_jwt().get('sub')
+
+
+def _require_claims(refresh=False):
+    claims = load_claims()
+    if claims is None:
+        raise g.jwt_error
+    if refresh and claims.get('type') != 'refresh':
+        raise WrongTokenError('Only refresh tokens are allowed')
+    if not refresh and claims.get('type') == 'refresh':
+        raise WrongTokenError('Only non-refresh tokens are allowed')
+    return claims
+
+
+def jwt_required(refresh=False):
+    """Exige un token valide (d'accès, ou de rafraîchissement si ``refresh``)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            _require_claims(refresh)
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def role_required(required_roles):
+    """Exige un token d'accès portant au moins un des rôles ``required_roles``."""
+    required = frozenset(required_roles)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            claims = _require_claims()
+            if required.isdisjoint(claims.get('roles', ())):
+                return jsonify({"msg": "Accès refusé : rôle requis"}), 403
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,87 @@
+"""Export et import CSV en flux : aucune étape ne matérialise le fichier complet en mémoire.
+
+Les valeurs structurées (tags, commentaires, ...) sont écrites en JSON dans leur cellule
+et relues comme telles à l'import, pour que l'aller-retour export → import soit fidèle.
+"""
+import csv
+import io
+import json
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 20
+
+
+def fieldnames(records):
+    """Union triée des champs de ``records`` (``id`` en premier) : les lignes hétérogènes sont acceptées."""
+    names = set()
+    for record in records:
+        names.update(record)
+    names.discard('id')
+    return ['id'] + sorted(names)
+
+
+def _cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def iter_csv(records, columns, chunk_size=CHUNK_SIZE):
+    """Génère le CSV de ``records`` par blocs d'environ ``chunk_size`` caractères."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, restval='', extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow({field: _cell(value) for field, value in record.items()})
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _value(cell):
+    cell = cell.strip()
+    if cell[:1] in ('[', '{'):
+        try:
+            return json.loads(cell)
+        except ValueError:
+            pass
+    return cell
+
+
+def read_batches(stream, validate=None, batch_size=BATCH_SIZE):
+    """Lit un CSV UTF-8 depuis un flux binaire et génère des lots ``(records, errors)``.
+
+    Les cellules vides sont omises. ``validate(record)`` renvoie un message d'erreur
+    (ligne rejetée) ou None ; ``errors`` est une liste de ``(numéro de ligne, message)``.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    batch, errors = [], []
+    try:
+        for row in reader:
+            if None in row:
+                errors.append((reader.line_num, "Plus de colonnes que dans l'en-tête."))
+                continue
+            record = {field: _value(cell) for field, cell in row.items() if field and cell and cell.strip()}
+            if not record:
+                continue
+            error = validate(record) if validate else None
+            if error:
+                errors.append((reader.line_num, error))
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch, errors
+                batch, errors = [], []
+    except UnicodeDecodeError:
+        errors.append((reader.line_num + 1, "Fichier non encodé en UTF-8."))
+    except csv.Error as e:
+        errors.append((reader.line_num, f"CSV invalide : {e}"))
+    finally:
+        text.detach()
+    if batch or errors:
+        yield batch, errors
@@ -0,0 +1,264 @@
+"""File de tâches en arrière-plan pour les générateurs d'administration.
+
+Une tâche est une ligne de la table ``Job`` (statut, avancement, résultat) exécutée par
+un pool de threads du processus qui l'a reçue ; l'état étant en base, n'importe quel
+worker peut répondre à ``/api/jobs/<id>`` ou enregistrer une annulation.
+
+Chaque tâche en file ou en cours porte son propriétaire (``hôte:pid``) et un battement
+de cœur que le processus rafraîchit tant qu'il la détient. Au démarrage d'un worker, à
+la liste des tâches et périodiquement, les tâches dont le propriétaire a disparu (pid
+mort sur le même hôte, ou battement trop ancien) sont reprises : remises en file si
+elles n'avaient pas commencé, marquées en échec sinon (un générateur interrompu n'est
+pas rejoué, il aurait déjà écrit une partie de ses enregistrements).
+"""
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = frozenset((DONE, FAILED, CANCELLED))
+ACTIVE = (QUEUED, RUNNING)
+HOSTNAME = socket.gethostname()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobContext:
+    """Interface d'une tâche en cours : avancement et points d'annulation."""
+
+    def __init__(self, jobs, job):
+        self._jobs = jobs
+        self.id = job.id
+        self.total = job.total or 0
+        self.done = 0
+
+    def set_total(self, total):
+        self.total = total
+        self._jobs._update(self.id, total=total)
+
+    def advance(self, count=1):
+        """Enregistre l'avancement et lève ``JobCancelled`` si une annulation a été demandée."""
+        self.done += count
+        job = self._jobs._update(self.id, progress=self.done, heartbeat_at=_now())
+        if job is None or job.cancel_requested:
+            raise JobCancelled()
+
+
+class JobQueue:
+    """Pool de ``workers`` threads par processus, alimenté par une file bornée à ``queue_size`` tâches.
+
+    Battement de cœur toutes les ``heartbeat`` secondes ; une tâche sans battement depuis
+    ``stale_after`` secondes est considérée comme orpheline.
+    """
+
+    def __init__(self, workers=2, queue_size=100, heartbeat=10, stale_after=60):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self.app = self.db = self.model = None
+        self._handlers = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        # Tâches en file ou en cours dans ce processus (battement de cœur)
+        self._owned = set()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self):
+        return f'{HOSTNAME}:{os.getpid()}'
+
+    def init_app(self, app, db, model):
+        self.app, self.db, self.model = app, db, model
+
+    def task(self, name):
+        """Décorateur enregistrant ``fn(ctx, **params)`` comme type de tâche ``name``."""
+        def decorator(fn):
+            self._handlers[name] = fn
+            return fn
+        return decorator
+
+    def _ensure_workers(self):
+        # Threads (re)démarrés dans chaque processus, y compris après un fork de worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._owned = set()
+                self._threads = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                                 for i in range(self.workers)]
+                self._threads.append(threading.Thread(target=self._beat, name='job-heartbeat', daemon=True))
+                for thread in self._threads:
+                    thread.start()
+
+    def submit(self, name, params=None, user=None, total=None):
+        """Enregistre et met en file une tâche ; renvoie la ligne ``Job`` créée."""
+        if name not in self._handlers:
+            raise KeyError(name)
+        self._ensure_workers()
+        job = self.model(kind=name, params=params or {}, created_by=user, status=QUEUED, total=total,
+                         owner=self.owner, heartbeat_at=_now())
+        self.db.session.add(job)
+        self.db.session.commit()
+        if not self._enqueue(job.id):
+            job.status, job.error, job.finished_at = FAILED, "File de tâches pleine.", _now()
+            self.db.session.commit()
+            raise JobQueueFull()
+        return job
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            self._owned.add(job_id)
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            self._release(job_id)
+            return False
+        return True
+
+    def _release(self, job_id):
+        with self._lock:
+            self._owned.discard(job_id)
+
+    def cancel(self, job_id):
+        """Demande l'annulation ; une tâche encore en file est annulée immédiatement."""
+        job = self.db.session.get(self.model, job_id)
+        if job is None:
+            return None
+        if job.status not in FINISHED:
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                job.status, job.finished_at = CANCELLED, _now()
+            self.db.session.commit()
+        return job
+
+    def _update(self, job_id, **changes):
+        job = self.db.session.get(self.model, job_id)
+        if job is not None:
+            for field, value in changes.items():
+                setattr(job, field, value)
+        self.db.session.commit()
+        return job
+
+    def _gone(self, owner, heartbeat_at, now):
+        """Vrai si le processus ``owner`` ne détient plus la tâche."""
+        if heartbeat_at is None or heartbeat_at < now - timedelta(seconds=self.stale_after):
+            return True
+        host, _, pid = (owner or '').rpartition(':')
+        return host == HOSTNAME and pid.isdigit() and not _pid_alive(int(pid))
+
+    def recover(self):
+        """Reprend les tâches orphelines (voir le module) ; renvoie ``(remises en file, en échec)``."""
+        self._ensure_workers()
+        model, session, now = self.model, self.db.session, _now()
+        rows = session.execute(
+            select(model.id, model.status, model.owner, model.heartbeat_at, model.created_at,
+                   model.cancel_requested).where(model.status.in_(ACTIVE))
+        ).all()
+        requeued, failed = [], 0
+        for job_id, status, owner, heartbeat_at, created_at, cancel_requested in rows:
+            if owner == self.owner or not self._gone(owner, heartbeat_at or created_at, now):
+                continue
+            # Mise à jour conditionnelle : un seul worker reprend une tâche donnée
+            claim = update(model).where(model.id == job_id, model.status == status,
+                                        model.owner.is_(None) if owner is None else model.owner == owner)
+            if status == QUEUED and not cancel_requested:
+                changes = {"owner": self.owner, "heartbeat_at": now}
+            elif cancel_requested:
+                changes = {"status": CANCELLED, "finished_at": now}
+            else:
+                changes = {"status": FAILED, "finished_at": now,
+                           "error": "Tâche interrompue : le worker qui l'exécutait s'est arrêté."}
+            if session.execute(claim.values(**changes)).rowcount:
+                if "owner" in changes:
+                    requeued.append(job_id)
+                else:
+                    failed += 1
+        session.commit()
+        for job_id in requeued:
+            if not self._enqueue(job_id):
+                self._update(job_id, status=FAILED, error="File de tâches pleine.", finished_at=_now())
+                failed += 1
+        if requeued or failed:
+            print(f"Tâches reprises : {len(requeued)} remise(s) en file, {failed} en échec")
+        return len(requeued), failed
+
+    def _beat(self):
+        last_recovery = time.monotonic()
+        while True:
+            time.sleep(self.heartbeat)
+            with self._lock:
+                owned = list(self._owned)
+            with self.app.app_context():
+                try:
+                    if owned:
+                        self.db.session.execute(update(self.model)
+                                                .where(self.model.id.in_(owned), self.model.owner == self.owner)
+                                                .values(heartbeat_at=_now()))
+                        self.db.session.commit()
+                    if time.monotonic() - last_recovery >= self.stale_after:
+                        last_recovery = time.monotonic()
+                        self.recover()
+                except Exception:
+                    self.db.session.rollback()
+                    traceback.print_exc()
+                finally:
+                    self.db.session.remove()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            with self.app.app_context():
+                try:
+                    self._execute(job_id)
+                finally:
+                    self._release(job_id)
+                    self.db.session.remove()
+
+    def _execute(self, job_id):
+        job = self.db.session.get(self.model, job_id)
+        if job is None or job.status != QUEUED or job.owner != self.owner:
+            return
+        job.status, job.started_at, job.heartbeat_at = RUNNING, _now(), _now()
+        self.db.session.commit()
+        ctx = JobContext(self, job)
+        try:
+            result = self._handlers[job.kind](ctx, **(job.params or {}))
+        except JobCancelled:
+            self.db.session.rollback()
+            self._update(job_id, status=CANCELLED, finished_at=_now())
+        except Exception as e:
+            self.db.session.rollback()
+            traceback.print_exc()
+            self._update(job_id, status=FAILED, error=str(e) or e.__class__.__name__, finished_at=_now())
+        else:
+            self._update(job_id, status=DONE, result=result, progress=ctx.done, finished_at=_now())
@@ -0,0 +1,134 @@
+"""Diffusion en direct des messages de sessions collaboratives (Server-Sent Events).
+
+Chaque processus garde, par session écoutée, un tampon borné des derniers messages
+partagé par tous ses abonnés : un message publié localement les réveille tous, et
+ceux publiés par les autres workers sont relus en base au plus une fois par
+``refresh_interval`` et par session, quel que soit le nombre d'abonnés.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _Channel:
+    def __init__(self, history):
+        self.messages = deque(maxlen=history)
+        self.last_seq = 0
+        self.refreshed_at = 0.0
+        self.refreshing = False
+        self.subscribers = 0
+
+    def after(self, seq):
+        return [m for m in self.messages if m['seq'] > seq]
+
+    def covers(self, seq):
+        # Le tampon contient tout ce qui suit ``seq`` (sinon il faut relire la base)
+        return not self.messages or self.messages[0]['seq'] <= seq + 1
+
+
+class SessionHub:
+    """Abonnements aux messages de sessions, avec numéros de séquence par session.
+
+    ``fetch(session_id, after_seq)`` lit en base les messages de numéro > ``after_seq``
+    (liste de dicts portant ``seq``) ; il n'est appelé que depuis les abonnés.
+    """
+
+    def __init__(self, fetch, history=200, refresh_interval=2.0):
+        self.fetch = fetch
+        self.history = history
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._channels = {}
+
+    def publish(self, session_id, message):
+        """Transmet un message déjà enregistré aux abonnés locaux de la session."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                return
+            if message['seq'] == channel.last_seq + 1:
+                self._append(channel, [message])
+            else:
+                # Des messages d'autres workers manquent avant celui-ci : relecture immédiate
+                channel.refreshed_at = 0.0
+            self._changed.notify_all()
+
+    def _append(self, channel, messages):
+        for message in messages:
+            if message['seq'] > channel.last_seq:
+                channel.messages.append(message)
+                channel.last_seq = message['seq']
+
+    @contextmanager
+    def subscription(self, session_id):
+        """Inscrit un abonné ; le tampon de la session vit tant qu'elle a des abonnés locaux."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                channel = self._channels[session_id] = _Channel(self.history)
+            channel.subscribers += 1
+        try:
+            yield channel
+        finally:
+            with self._lock:
+                channel.subscribers -= 1
+                if not channel.subscribers and self._channels.get(session_id) is channel:
+                    del self._channels[session_id]
+
+    def listen(self, session_id, channel, after_seq, timeout):
+        """Messages de numéro > ``after_seq``, en attendant au plus ``timeout`` secondes s'il n'y en a pas."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                behind = not channel.covers(after_seq)
+                if not behind:
+                    messages = channel.after(after_seq)
+                    if messages:
+                        return messages
+                now = time.monotonic()
+                refresh = not behind and not channel.refreshing and now - channel.refreshed_at >= self.refresh_interval
+                if refresh:
+                    channel.refreshing = True
+                elif not behind:
+                    if now >= deadline:
+                        return []
+                    wait = min(deadline, channel.refreshed_at + self.refresh_interval) - now
+                    self._changed.wait(max(wait, 0.01))
+                    continue
+            if behind:
+                # Abonné en retard sur le tampon : lecture directe de la base
+                return self.fetch(session_id, after_seq)
+            # Un seul abonné par session et par processus relit la base pour tous les autres
+            fetched = []
+            try:
+                fetched = self.fetch(session_id, channel.last_seq)
+            finally:
+                with self._lock:
+                    self._append(channel, fetched)
+                    channel.refreshing = False
+                    channel.refreshed_at = time.monotonic()
+                    self._changed.notify_all()
+
+    def stream(self, session_id, after_seq, max_duration=300.0, heartbeat=15.0):
+        """Flux SSE des messages suivant ``after_seq`` ; se termine après ``max_duration`` secondes.
+
+        Le client se reconnecte alors avec l'en-tête ``Last-Event-ID`` pour reprendre
+        au dernier numéro reçu, sans perte ni doublon.
+        """
+        end = time.monotonic() + max_duration
+        yield 'retry: 1000\n\n'
+        with self.subscription(session_id) as channel:
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return
+                messages = self.listen(session_id, channel, after_seq, min(heartbeat, remaining))
+                if not messages:
+                    yield ': ping\n\n'
+                    continue
+                for message in messages:
+                    after_seq = message['seq']
+                    yield f"id: {message['seq']}\nevent: message\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
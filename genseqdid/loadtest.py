@@ -0,0 +1,186 @@
+"""Banc de charge HTTP de genseqdid (bibliothèque standard uniquement).
+
+    python loadtest.py --url http://localhost:5000 --save avant.json
+    python loadtest.py --url http://localhost:5000 --baseline avant.json
+    python loadtest.py --hooks --save hooks-avant.json
+
+Chaque scénario est joué pendant ``--duration`` secondes par ``--concurrency`` clients
+(connexions keep-alive) ; le rapport donne requêtes/s, latences p50/p95 et erreurs,
+et le gain par rapport à une mesure enregistrée avec ``--save``. ``--hooks`` mesure sans
+serveur, dans le processus, le coût des hooks ``before_request`` de l'application.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+# (nom, méthode, chemin, corps JSON, authentifié)
+SCENARIOS = [
+    ('status', 'GET', '/api/status', None, False),
+    ('openapi', 'GET', '/openapi.json', None, False),
+    ('sequences', 'GET', '/api/sequences', None, True),
+    ('stats', 'GET', '/api/stats', None, True),
+    ('corpus-analysis', 'GET', '/api/corpus-analysis', None, True),
+    ('advanced-search', 'GET', '/api/sequences/advanced-search?query=maya', None, True),
+    ('translate', 'POST', '/api/translate', {"text": "Bix a beel", "source": "maya", "target": "fr"}, True),
+]
+
+# (nom, chemin, en-têtes, authentifié) des requêtes passées aux hooks avec --hooks
+HOOK_SCENARIOS = [
+    ('public', '/api/status', {}, False),
+    ('accept-language', '/api/sequences', {'Accept-Language': 'es-MX,es;q=0.9,en;q=0.8,*;q=0.1'}, True),
+    ('lang-param', '/api/sequences?lang=maya', {}, True),
+    ('anonymous', '/api/sequences', {'Accept-Language': 'de-DE,de;q=0.9'}, False),
+]
+
+
+def _connection(url, timeout):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return cls(parts.hostname, parts.port, timeout=timeout)
+
+
+def login(url, username, password):
+    conn = _connection(url, 10)
+    conn.request('POST', '/api/auth/login', json.dumps({"username": username, "password": password}),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    body = json.loads(response.read() or b'{}')
+    conn.close()
+    if response.status != 200:
+        raise SystemExit(f"Connexion impossible ({response.status}) : {body}")
+    return body['access_token']
+
+
+def run_scenario(url, scenario, token, duration, concurrency, timeout=10):
+    _, method, path, payload, authenticated = scenario
+    headers = {'Content-Type': 'application/json'}
+    if authenticated:
+        headers['Authorization'] = f'Bearer {token}'
+    body = json.dumps(payload) if payload is not None else None
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        conn = _connection(url, timeout)
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = _connection(url, timeout)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "errors": errors[0],
+    }
+
+
+def run_hooks(scenario, iterations):
+    """Durée moyenne (µs) de ``preprocess_request`` pour une requête, contexte recréé à chaque tour."""
+    from flask_jwt_extended import create_access_token
+
+    import app as application
+    _, path, headers, authenticated = scenario
+    flask_app = application.app
+    headers = dict(headers)
+    if authenticated:
+        with flask_app.app_context():
+            headers['Authorization'] = 'Bearer ' + create_access_token(
+                identity='admin', additional_claims={"roles": ["admin"], "username": "admin"})
+    with flask_app.app_context():
+        application.init_store()
+    total = 0.0
+    for _ in range(iterations):
+        with flask_app.test_request_context(path, headers=headers):
+            start = time.perf_counter()
+            flask_app.preprocess_request()
+            total += time.perf_counter() - start
+    return {"iterations": iterations, "us": round(total / iterations * 1e6, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge genseqdid")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--duration', type=float, default=10.0, help="secondes par scénario")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--only', help="scénarios à jouer, séparés par des virgules")
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--save', help="enregistre les résultats (JSON) pour une comparaison ultérieure")
+    parser.add_argument('--baseline', help="résultats enregistrés auxquels comparer cette mesure")
+    parser.add_argument('--hooks', action='store_true', help="mesure les hooks before_request dans le processus")
+    parser.add_argument('--iterations', type=int, default=20000, help="requêtes par scénario avec --hooks")
+    args = parser.parse_args(argv)
+
+    selected = set(args.only.split(',')) if args.only else None
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    if args.hooks:
+        print(f"{'scénario':<18}{'µs/requête':>12}{'gain':>9}")
+        for scenario in HOOK_SCENARIOS:
+            name = scenario[0]
+            if selected and name not in selected:
+                continue
+            result = results[name] = run_hooks(scenario, args.iterations)
+            before = baseline.get(name, {}).get('us')
+            gain = f"x{before / result['us']:.2f}" if before else '-'
+            print(f"{name:<18}{result['us']:>12}{gain:>9}")
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    token = login(args.url, args.username, args.password)
+    print(f"{'scénario':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'erreurs':>9}{'gain':>9}")
+    for scenario in SCENARIOS:
+        name = scenario[0]
+        if selected and name not in selected:
+            continue
+        result = results[name] = run_scenario(args.url, scenario, token, args.duration, args.concurrency)
+        before = baseline.get(name, {}).get('rps')
+        gain = f"x{result['rps'] / before:.2f}" if before else '-'
+        print(f"{name:<18}{result['rps']:>10}{result['p50_ms'] or '-':>10}{result['p95_ms'] or '-':>10}"
+              f"{result['errors']:>9}{gain:>9}")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Métriques HTTP au format texte Prometheus, alimentées par des hooks before/after_request.
+
+Les compteurs sont propres à chaque processus : avec plusieurs workers, chacun expose
+les siens et ``pid`` les distingue. Sous charge, chaque requête ne coûte qu'un appel à
+``perf_counter``, une recherche de seau (``bisect``) et quelques additions sous verrou.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import request
+
+# Seaux de latence (secondes) et de taille de réponse (octets)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, bounds, value):
+        # Compteurs par seau non cumulés : le cumul est fait à l'export
+        self.counts[bisect_left(bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Compteurs, histogrammes et jauges d'une application Flask.
+
+    Les requêtes sont regroupées par règle d'URL (``/api/sequences/<int:id>``) et non par
+    chemin, pour garder un nombre de séries borné. Les jauges enregistrées par ``gauge``
+    sont calculées à la lecture de ``/metrics`` seulement.
+    """
+
+    def __init__(self, prefix='genseqdid', latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.prefix = prefix
+        self.latency_buckets = tuple(latency_buckets)
+        self.size_buckets = tuple(size_buckets)
+        self.in_flight = 0
+        self._requests = {}
+        self._latency = {}
+        self._sizes = {}
+        self._request_bytes = {}
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        # Enregistré avant les autres hooks : les requêtes refusées par un hook suivant sont mesurées aussi
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def gauge(self, name, help_text, fn, labels=(), type='gauge'):
+        """Jauge ``name`` ; ``fn()`` renvoie une valeur, ou ``{(valeurs des labels): valeur}``.
+
+        ``type='counter'`` expose un compteur tenu ailleurs (lu de la même façon).
+        """
+        self._gauges.append((name, help_text, fn, tuple(labels), type))
+
+    def _before_request(self):
+        # Horodatage dans l'environ WSGI : un seul accès au proxy ``request`` par hook
+        request.environ['genseqdid.metrics_start'] = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+
+    def _after_request(self, response):
+        req = request._get_current_object()
+        start = req.environ.get('genseqdid.metrics_start')
+        if start is None:
+            return response
+        # Pour une réponse en flux (SSE, export CSV), la durée s'arrête à l'envoi des en-têtes
+        elapsed = time.perf_counter() - start
+        series = (req.url_rule.rule if req.url_rule is not None else '<unmatched>', req.method)
+        size = response.content_length
+        received = req.content_length
+        with self._lock:
+            key = series + (response.status_code,)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get(series)
+            if histogram is None:
+                histogram = self._latency[series] = _Histogram(len(self.latency_buckets) + 1)
+            histogram.observe(self.latency_buckets, elapsed)
+            if size is not None:
+                histogram = self._sizes.get(series)
+                if histogram is None:
+                    histogram = self._sizes[series] = _Histogram(len(self.size_buckets) + 1)
+                histogram.observe(self.size_buckets, size)
+            if received:
+                self._request_bytes[series] = self._request_bytes.get(series, 0) + received
+        return response
+
+    def _teardown_request(self, exc=None):
+        # La jauge est décrémentée même si la réponse n'a pas atteint after_request
+        if request.environ.pop('genseqdid.metrics_start', None) is not None:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _histogram_lines(self, name, bounds, histograms, pid):
+        lines = []
+        for (rule, method), histogram in sorted(histograms.items()):
+            labels = ('endpoint', 'method', 'pid')
+            values = (rule, method, pid)
+            cumulative = 0
+            for bound, count in zip(bounds + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{name}_bucket{_labels(labels, values, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels, values)} {_number(histogram.sum)}')
+            lines.append(f'{name}_count{_labels(labels, values)} {histogram.count}')
+        return lines
+
+    def render(self):
+        """Exposition au format texte Prometheus (version 0.0.4)."""
+        p = self.prefix
+        pid = os.getpid()
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {key: _copy(h) for key, h in self._latency.items()}
+            sizes = {key: _copy(h) for key, h in self._sizes.items()}
+            request_bytes = dict(self._request_bytes)
+            in_flight = self.in_flight
+
+        lines = [f'# HELP {p}_http_requests_total Requêtes traitées par endpoint, méthode et statut.',
+                 f'# TYPE {p}_http_requests_total counter']
+        for (rule, method, status), count in sorted(requests.items()):
+            lines.append(f'{p}_http_requests_total'
+                         f'{_labels(("endpoint", "method", "status", "pid"), (rule, method, status, pid))} {count}')
+        lines += [f'# HELP {p}_http_request_duration_seconds Durée de traitement des requêtes.',
+                  f'# TYPE {p}_http_request_duration_seconds histogram']
+        lines += self._histogram_lines(f'{p}_http_request_duration_seconds', self.latency_buckets, latency, pid)
+        lines += [f'# HELP {p}_http_response_size_bytes Taille des corps de réponse (hors flux).',
+                  f'# TYPE {p}_http_response_size_bytes histogram']
+        lines += self._histogram_lines(f'{p}_http_response_size_bytes', self.size_buckets, sizes, pid)
+        lines += [f'# HELP {p}_http_request_size_bytes_total Octets reçus dans les corps de requête.',
+                  f'# TYPE {p}_http_request_size_bytes_total counter']
+        for (rule, method), total in sorted(request_bytes.items()):
+            lines.append(f'{p}_http_request_size_bytes_total'
+                         f'{_labels(("endpoint", "method", "pid"), (rule, method, pid))} {total}')
+        lines += [f'# HELP {p}_http_requests_in_flight Requêtes en cours de traitement.',
+                  f'# TYPE {p}_http_requests_in_flight gauge',
+                  f'{p}_http_requests_in_flight{_labels(("pid",), (pid,))} {in_flight}']
+
+        for name, help_text, fn, labels, type in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Métriques : jauge {name} indisponible ({e})")
+                continue
+            lines += [f'# HELP {p}_{name} {help_text}', f'# TYPE {p}_{name} {type}']
+            values = value if isinstance(value, dict) else {(): value}
+            for label_values, v in values.items():
+                if not isinstance(label_values, tuple):
+                    label_values = (label_values,)
+                lines.append(f'{p}_{name}{_labels(labels + ("pid",), label_values + (pid,))} {_number(v)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(histogram):
+    copy = _Histogram(len(histogram.counts))
+    copy.counts = list(histogram.counts)
+    copy.sum, copy.count = histogram.sum, histogram.count
+    return copy
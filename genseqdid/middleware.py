@@ -0,0 +1,88 @@
+"""Chaîne ``before_request`` ordonnée et négociation de langue mémoïsée.
+
+Flask appelle chaque hook ``before_request`` l'un après l'autre ; ici les étapes de
+l'application sont réunies dans un seul hook, dans un ordre explicite, et la première
+qui renvoie une réponse arrête la chaîne (les étapes suivantes ne coûtent rien). Chaque
+étape commence par son test le moins cher : un drapeau, puis l'appartenance de
+``request.endpoint`` à un ``frozenset``, et seulement ensuite un décodage ou une requête SQL.
+"""
+from bisect import insort
+from functools import lru_cache
+
+
+class Pipeline:
+    """Étapes ``before_request`` exécutées par ordre croissant de ``order``."""
+
+    def __init__(self):
+        self._steps = []
+
+    def init_app(self, app):
+        app.before_request(self.run)
+
+    def step(self, order):
+        """Décorateur : ajoute une étape ; à ``order`` égal, l'ordre d'enregistrement est conservé."""
+        def register(fn):
+            insort(self._steps, (order, len(self._steps), fn))
+            return fn
+        return register
+
+    @property
+    def steps(self):
+        return [fn for _, _, fn in self._steps]
+
+    def run(self):
+        for _, _, fn in self._steps:
+            response = fn()
+            if response is not None:
+                return response
+        return None
+
+
+def _quality(value):
+    try:
+        q = float(value)
+    except ValueError:
+        return 0.0
+    return q if 0 <= q <= 1 else 0.0
+
+
+def parse_accept_language(header):
+    """``[(étiquette, q), ...]`` d'un en-tête ``Accept-Language``, par préférence décroissante.
+
+    À qualité égale, l'ordre de l'en-tête est conservé ; les entrées ``q=0`` sont exclues.
+    """
+    ranges = []
+    for position, item in enumerate(header.split(',')):
+        tag, _, params = item.partition(';')
+        tag = tag.strip().lower()
+        if not tag:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                q = _quality(value.strip())
+        if q > 0:
+            ranges.append((-q, position, tag))
+    ranges.sort()
+    return [(tag, -q) for q, _, tag in ranges]
+
+
+@lru_cache(maxsize=512)
+def negotiate_language(header, supported, default):
+    """Langue de ``supported`` (tuple) la mieux classée par ``header`` ; ``default`` sinon.
+
+    Une étiquette régionale (``es-MX``) accepte sa langue principale (``es``), ``*`` accepte
+    ``default``. Les navigateurs envoient peu d'en-têtes différents : le résultat est mémoïsé.
+    """
+    if not header:
+        return default
+    for tag, _ in parse_accept_language(header):
+        if tag == '*':
+            return default
+        if tag in supported:
+            return tag
+        primary = tag.split('-', 1)[0]
+        if primary in supported:
+            return primary
+    return default
@@ -0,0 +1,161 @@
+"""Pagination par curseur (keyset) pour les listes renvoyées par l'API.
+
+``paginate`` extrait une page d'une liste quelconque (tas borné, tout tri) ; pour les
+tris courants d'une collection, ``SortedKeys`` garde les clés triées à l'écriture et
+une page n'est plus qu'une recherche dichotomique du curseur suivie d'une tranche.
+"""
+import base64
+import heapq
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size_arg(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Taille de page issue d'un paramètre de requête, bornée à ``maximum``."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    if size < 1:
+        return default
+    return min(size, maximum)
+
+
+def encode_cursor(key):
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Clé de tri encodée dans ``cursor`` (None si absent). ValueError si le curseur est invalide."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Curseur invalide.")
+    if not isinstance(key, list):
+        raise ValueError("Curseur invalide.")
+    return tuple(key)
+
+
+def paginate(items, key, cursor=None, page_size=DEFAULT_PAGE_SIZE, reverse=False):
+    """Renvoie ``(page, next_cursor)`` : les ``page_size`` éléments suivant ``cursor`` dans l'ordre de ``key``.
+
+    ``items`` n'a pas besoin d'être trié : seule la page demandée est extraite (tas borné).
+    """
+    after = decode_cursor(cursor)
+    if after is not None:
+        if reverse:
+            items = (item for item in items if key(item) < after)
+        else:
+            items = (item for item in items if key(item) > after)
+    try:
+        page = (heapq.nlargest if reverse else heapq.nsmallest)(page_size + 1, items, key=key)
+    except TypeError:
+        raise ValueError("Curseur invalide.")
+    next_cursor = encode_cursor(key(page[page_size - 1])) if len(page) > page_size else None
+    return page[:page_size], next_cursor
+
+
+def sort_value(value):
+    """Clé de tri JSON-sérialisable d'une valeur quelconque : nombres, puis textes, puis absents."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, '')
+    if value is None:
+        return (2, 0, '')
+    return (1, 0, value if isinstance(value, str) else json.dumps(value, sort_keys=True))
+
+
+def sort_key(field):
+    """Clé de tri des enregistrements sur ``field``, départagée par l'id."""
+    if field == 'id':
+        return lambda record: (record['id'],)
+    return lambda record: (*sort_value(record.get(field)), record['id'])
+
+
+class SortedKeys:
+    """Clés de tri ``sort_key(field)`` des enregistrements d'une collection, tenues triées.
+
+    Chaque liste est construite à sa première page (un tri), puis maintenue par ``insort``
+    à chaque écriture ; un rechargement complet (rejeu, import) la marque à reconstruire.
+    """
+
+    def __init__(self, fields=('id',)):
+        self.fields = tuple(fields)
+        self.collection = None
+        self._keys = {field: sort_key(field) for field in self.fields}
+        self._current = {}
+        self._sorted = dict.fromkeys(self.fields)
+        self._lock = threading.Lock()
+
+    def attach(self, collection):
+        self.collection = collection
+
+        def listener(event, key, record):
+            with self._lock:
+                if event == 'clear':
+                    self._current.clear()
+                    self._sorted = dict.fromkeys(self.fields)
+                    return
+                previous = self._current.pop(key, None)
+                current = None
+                if event == 'upsert':
+                    current = self._current[key] = {field: self._keys[field](record) for field in self.fields}
+                for field, keys in self._sorted.items():
+                    if keys is None or (previous and current and previous[field] == current[field]):
+                        continue
+                    if previous is not None:
+                        position = bisect_left(keys, previous[field])
+                        if position < len(keys) and keys[position] == previous[field]:
+                            del keys[position]
+                    if current is not None:
+                        insort(keys, current[field])
+        collection.subscribe(listener)
+
+    def page(self, field, cursor=None, page_size=DEFAULT_PAGE_SIZE, reverse=False):
+        """Comme ``paginate`` sur toute la collection triée par ``sort_key(field)``."""
+        after = decode_cursor(cursor)
+        with self._lock:
+            keys = self._sorted[field]
+            if keys is None:
+                keys = self._sorted[field] = sorted(entry[field] for entry in self._current.values())
+            try:
+                if reverse:
+                    end = len(keys) if after is None else bisect_left(keys, after)
+                    selected = keys[max(0, end - page_size - 1):end][::-1]
+                else:
+                    start = 0 if after is None else bisect_right(keys, after)
+                    selected = keys[start:start + page_size + 1]
+            except TypeError:
+                raise ValueError("Curseur invalide.")
+        next_cursor = encode_cursor(selected[page_size - 1]) if len(selected) > page_size else None
+        # La dernière composante de la clé est l'id
+        records = (self.collection.get(key[-1]) for key in selected[:page_size])
+        return [record for record in records if record is not None], next_cursor
+
+
+def sort_arg(value, default='id'):
+    """Champ et sens de tri d'un paramètre ``sort`` (``champ`` ou ``-champ`` pour l'ordre décroissant)."""
+    value = (value or default).strip()
+    if value.startswith('-'):
+        return value[1:] or default, True
+    return value, False
+
+
+def fields_arg(value):
+    """Champs demandés par un paramètre ``fields=a,b`` (None : tous les champs)."""
+    fields = [f.strip() for f in (value or '').split(',') if f.strip()]
+    return fields or None
+
+
+def project(record, fields):
+    """Restreint ``record`` aux ``fields`` demandés (l'id est toujours conservé)."""
+    if fields is None or record is None:
+        return record
+    return {f: record[f] for f in ['id', *fields] if f in record}
@@ -0,0 +1,105 @@
+"""Hachage bcrypt hors des threads de requête, dans un pool de processus borné.
+
+Les hachages produits et vérifiés sont ceux de Flask-Bcrypt (``$2b$``, coût
+``BCRYPT_LOG_ROUNDS``) : les mots de passe déjà enregistrés restent valides.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    """Trop de hachages en attente : la requête doit être retentée plus tard."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        # Hachage mal formé ou mot de passe de plus de 72 octets
+        return False
+
+
+class PasswordHasher:
+    """Exécute bcrypt dans ``workers`` processus (0 : dans le thread appelant).
+
+    Au plus ``max_pending`` opérations sont en cours ou en attente dans le pool, lots de
+    ``hash_many`` compris : au-delà, ``PasswordHasherBusy`` est levée au bout de
+    ``timeout`` secondes plutôt que d'allonger indéfiniment la file.
+    """
+
+    def __init__(self, workers=None, max_pending=64, timeout=10.0, rounds=12):
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.timeout = timeout
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Pool (re)créé dans chaque processus. Jamais « fork » : l'application a déjà des threads
+        # (journal d'audit, tâches, webhooks) et un fork pourrait copier un verrou tenu par l'un d'eux
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(method))
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _submit(self, fn, *args):
+        # Une place est prise par opération soumise et rendue quand le processus l'a terminée
+        # (ou qu'elle a été annulée) : la file du pool ne dépasse jamais ``max_pending``
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeout:
+            # Encore en file : retirée tout de suite ; déjà en cours : sa place revient à la fin du calcul
+            future.cancel()
+            raise PasswordHasherBusy()
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self._result(self._submit(fn, *args))
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        if not isinstance(password, str) or not pw_hash:
+            return False
+        return self._run(_check, pw_hash, password)
+
+    def hash_many(self, passwords):
+        """Hache un lot de mots de passe en parallèle (création de comptes en masse), avec les mêmes limites."""
+        passwords = list(passwords)
+        if not self.workers or len(passwords) < 2:
+            return [self.hash(password) for password in passwords]
+        futures = []
+        try:
+            for password in passwords:
+                futures.append(self._submit(_hash, password, self.rounds))
+            return [self._result(future) for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,241 @@
+"""Export PDF de séquences didactiques, sans dépendance externe.
+
+Chaque séquence est rendue par un gabarit Jinja2 en lignes de texte balisées
+(``# titre``, ``## section``, ``- puce``), mises en page en A4 avec les polices
+standard Helvetica (encodage WinAnsi : accents français et espagnols, apostrophes
+du maya). Les pages d'une séquence sont mises en cache, compressées, sous l'empreinte
+de son contenu : un nouvel export ne rend que les séquences modifiées depuis.
+"""
+import hashlib
+import json
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from jinja2 import Environment
+
+SEQUENCE_TEMPLATE = """\
+# {{ seq.titulo or 'Séquence ' ~ seq.id }}
+{% for field, label in labels if seq[field] %}
+{{ label }} : {{ seq[field] }}
+{% endfor %}
+{% if seq.description %}
+
+## Description
+{{ seq.description }}
+{% endif %}
+{% if seq.objectifs %}
+
+## Objectifs
+{% for objectif in ([seq.objectifs] if seq.objectifs is string else seq.objectifs) %}
+- {{ objectif }}
+{% endfor %}
+{% endif %}
+{% if extra %}
+
+## Autres informations
+{% for field, value in extra %}
+- {{ field }} : {{ value }}
+{% endfor %}
+{% endif %}
+"""
+
+# Champs affichés sous le titre, dans cet ordre
+SEQUENCE_LABELS = (
+    ('niveau', 'Niveau'), ('modalidad', 'Modalité'), ('theme', 'Thème'), ('langue', 'Langue'),
+    ('dialecte', 'Dialecte'), ('contexte_culturel', 'Contexte culturel'),
+    ('support_audio', 'Support audio'), ('support_video', 'Support vidéo'),
+)
+_HIDDEN_FIELDS = frozenset(('id', 'titulo', 'description', 'objectifs')) | {field for field, _ in SEQUENCE_LABELS}
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 en points
+MARGIN = 56
+# (police, taille, espace avant) par type de ligne
+STYLES = {'h1': ('F2', 16, 0), 'h2': ('F2', 12, 8), 'body': ('F1', 10.5, 0), 'bullet': ('F1', 10.5, 0)}
+LEADING = 1.35
+BULLET_INDENT = 14
+
+# Chasses Helvetica (millièmes de corps) des caractères 32 à 126
+_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+# Le gras est plus large : on surestime pour ne jamais déborder de la marge
+_BOLD_FACTOR = 1.08
+
+
+def _char_width(ch):
+    code = ord(ch)
+    if 32 <= code <= 126:
+        return _WIDTHS[code - 32]
+    base = unicodedata.normalize('NFKD', ch)[:1]
+    if base and 32 <= ord(base) <= 126:
+        return _WIDTHS[ord(base) - 32]
+    return 556
+
+
+def text_width(text, font, size):
+    width = sum(_char_width(ch) for ch in text) * size / 1000
+    return width * _BOLD_FACTOR if font == 'F2' else width
+
+
+def _wrap(text, font, size, width):
+    """Découpe ``text`` en lignes de moins de ``width`` points (mots trop longs coupés)."""
+    lines, current = [], ''
+    for word in text.split():
+        candidate = f'{current} {word}' if current else word
+        if text_width(candidate, font, size) <= width:
+            current = candidate
+            continue
+        if current:
+            lines.append(current)
+        current = ''
+        while text_width(word, font, size) > width:
+            cut = len(word) - 1
+            while cut > 1 and text_width(word[:cut], font, size) > width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+        current = word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _stream_object(data, compressed=True):
+    if compressed:
+        data = zlib.compress(data)
+        return b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data)
+    return b'<< /Length %d >>\nstream\n%s\nendstream' % (len(data), data)
+
+
+class PdfExporter:
+    """Rend des séquences en PDF ; les pages de chaque séquence sont gardées dans un LRU."""
+
+    def __init__(self, template=SEQUENCE_TEMPLATE, cache_size=2048):
+        self.template = Environment(autoescape=False, trim_blocks=True, lstrip_blocks=True).from_string(template)
+        self._template_digest = hashlib.sha1(template.encode('utf-8')).hexdigest()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, record):
+        data = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1((self._template_digest + data).encode('utf-8')).hexdigest()
+
+    def render_text(self, record):
+        extra = [(field, value) for field, value in record.items()
+                 if field not in _HIDDEN_FIELDS and value not in (None, '', [], {})]
+        return self.template.render(seq=record, labels=SEQUENCE_LABELS, extra=extra)
+
+    def layout(self, text):
+        """Met en page le texte balisé ; renvoie le flux de contenu (non compressé) de chaque page."""
+        width = PAGE_WIDTH - 2 * MARGIN
+        pages, ops = [], []
+        y = PAGE_HEIGHT - MARGIN
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                y -= STYLES['body'][1] * 0.6
+                continue
+            if line.startswith('## '):
+                kind, line = 'h2', line[3:]
+            elif line.startswith('# '):
+                kind, line = 'h1', line[2:]
+            elif line.startswith('- '):
+                kind, line = 'bullet', line[2:]
+            else:
+                kind = 'body'
+            font, size, space_before = STYLES[kind]
+            indent = BULLET_INDENT if kind == 'bullet' else 0
+            y -= space_before
+            for i, part in enumerate(_wrap(line, font, size, width - indent)):
+                if y - size * LEADING < MARGIN:
+                    pages.append(b'\n'.join(ops))
+                    ops, y = [], PAGE_HEIGHT - MARGIN
+                y -= size * LEADING
+                if kind == 'bullet' and i == 0:
+                    ops.append(b'BT /%s %g Tf %g %g Td %s Tj ET' % (font.encode(), size, MARGIN + 4, y,
+                                                                 _pdf_string('•')))
+                ops.append(b'BT /%s %g Tf %g %g Td %s Tj ET' % (font.encode(), size, MARGIN + indent, y,
+                                                             _pdf_string(part)))
+        if ops or not pages:
+            pages.append(b'\n'.join(ops))
+        return pages
+
+    def fragment(self, record):
+        """Objets flux (compressés) des pages de ``record``, rendus une seule fois par contenu."""
+        key = self._digest(record)
+        with self._lock:
+            pages = self._fragments.get(key)
+            if pages is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return pages
+            self.misses += 1
+        pages = [_stream_object(ops) for ops in self.layout(self.render_text(record))]
+        with self._lock:
+            self._fragments[key] = pages
+            while len(self._fragments) > self.cache_size:
+                self._fragments.popitem(last=False)
+        return pages
+
+    def stream(self, records, title='Séquences didactiques'):
+        """Générateur des octets du PDF : chaque séquence est rendue puis envoyée à son tour."""
+        offsets = {}
+        position = 0
+
+        def emit(number, body):
+            nonlocal position
+            offsets[number] = position
+            data = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+            position += len(data)
+            return data
+
+        # 1 catalogue, 2 arbre des pages (écrit à la fin), 3-4 polices, 5 informations
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position = len(header)
+        yield header + emit(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>') \
+            + emit(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+        resources = b'<< /Font << /F1 3 0 R /F2 4 0 R >> >>'
+        kids = []
+        number = 6
+        for record in records:
+            chunk = []
+            for body in self.fragment(record):
+                # Le pied de page (numéro) est propre à l'export, le corps vient du cache
+                footer = b'BT /F1 9 Tf %g %g Td %s Tj ET' % (PAGE_WIDTH / 2 - 6, MARGIN / 2,
+                                                             _pdf_string(str(len(kids) + 1)))
+                chunk.append(emit(number, body))
+                chunk.append(emit(number + 1, _stream_object(footer, compressed=False)))
+                chunk.append(emit(number + 2, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                                              b'/Resources %s /Contents [%d 0 R %d 0 R] >>'
+                                  % (PAGE_WIDTH, PAGE_HEIGHT, resources, number, number + 1)))
+                kids.append(number + 2)
+                number += 3
+            yield b''.join(chunk)
+
+        created = datetime.now(timezone.utc).strftime("D:%Y%m%d%H%M%SZ")
+        tail = [
+            emit(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids))),
+            emit(1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+            emit(5, b'<< /Title %s /Producer (genseqdid) /CreationDate (%s) >>' % (_pdf_string(title), created.encode())),
+        ]
+        xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+        xref += [b'%010d 00000 n \n' % offsets[n] if n in offsets else b'0000000000 65535 f \n' for n in range(1, number)]
+        tail.append(b''.join(xref))
+        tail.append(b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, position))
+        yield b''.join(tail)
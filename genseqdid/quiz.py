@@ -0,0 +1,294 @@
+"""Quiz et plans de cours tirés du contenu des séquences.
+
+Les questions viennent du texte de la séquence : sens ou traduction des mots présents
+dans les dictionnaires maya–espagnol, textes à trous construits sur ses phrases et
+vocabulaire à définir (mots les plus fréquents). Le tirage (questions retenues, ordre
+des options) dépend de l'empreinte du contenu : tant que la séquence ne change pas, un
+quiz régénéré est identique et il est servi depuis un LRU gardé sous cette empreinte.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from search_index import fold, SKIPPED_FIELDS
+from translation import segment
+
+# Mots (apostrophes internes et finales du maya conservées), sous leur forme d'origine
+_WORD_RE = re.compile(r"[^\W_]+(?:['’‘ʼʻ´`′][^\W_]*)*")
+# Champs de classement : ils décrivent la séquence mais ne sont pas du texte à exploiter
+_META_FIELDS = SKIPPED_FIELDS | {'niveau', 'modalidad', 'langue', 'dialecte', 'tags', 'comments'}
+_STOPWORDS = frozenset("""
+    alors aussi autre avec avoir cette comme dans donc elle elles entre etre leur leurs mais meme
+    nous pour plus quand quel quelle sans selon sont tous tout toute toutes tres vous
+    ante bajo como con contra cual cuando desde donde esta este esto estos hasta para pero
+    porque sobre todo todos una unas unos
+""".split())
+NIVEAUX = ("A1", "A2", "B1", "B2")
+MODALITES = ("présentiel", "en ligne")
+CHOICES = 4
+VOCABULARY_SIZE = 10
+MAX_QUESTIONS = 20
+
+
+def _display(word):
+    # Les dictionnaires écrivent leurs entrées en capitales
+    return word[:1].upper() + word[1:].lower() if word.isupper() else word
+
+
+def _load_entries(path):
+    """Entrées ``(formes mayas, sens espagnol, catégorie)`` d'un fichier maya→espagnol ou espagnol→maya."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    entries = []
+    for item in data:
+        maya, spanish = item.get('maya'), item.get('spanish')
+        if not maya or not spanish:
+            continue
+        maya = [maya] if isinstance(maya, str) else list(maya)
+        pos = item.get('pos')
+        pos = ', '.join(pos) if isinstance(pos, list) else (pos or '')
+        entries.append((tuple(_display(m) for m in maya), _display(spanish), pos))
+    return entries
+
+
+class Dictionary:
+    """Index des entrées par forme maya et par sens espagnol (clés repliées par ``fold``)."""
+
+    def __init__(self, entries=()):
+        self.entries = []
+        self.by_maya = {}
+        self.by_spanish = {}
+        # Options des questions à choix (ordre d'insertion : tirages reproductibles)
+        self.meanings = {}
+        self.forms = {}
+        for entry in entries:
+            self.add(*entry)
+
+    def add(self, maya, spanish, pos=''):
+        entry = (tuple(maya), spanish, pos)
+        self.entries.append(entry)
+        for form in entry[0]:
+            self.by_maya.setdefault(fold(form), entry)
+        self.by_spanish.setdefault(fold(spanish), entry)
+        self.meanings.setdefault(spanish)
+        self.forms.setdefault(entry[0][0])
+
+    def lookup(self, key):
+        """``('maya' | 'spanish', entrée)`` pour un mot replié, ou None."""
+        entry = self.by_maya.get(key)
+        if entry is not None:
+            return 'maya', entry
+        entry = self.by_spanish.get(key)
+        if entry is not None:
+            return 'spanish', entry
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def record_text(record):
+    """Champs textuels d'un enregistrement, dans l'ordre de l'enregistrement."""
+    parts = []
+    for field, value in record.items():
+        if field in _META_FIELDS:
+            continue
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, list):
+            parts.extend(v for v in value if isinstance(v, str))
+    return parts
+
+
+class QuizGenerator:
+    """Génère quiz et plans de cours ; les quiz sont gardés dans un LRU selon leur empreinte."""
+
+    def __init__(self, dictionary_paths=(), cache_size=1024):
+        self.dictionary_paths = tuple(dictionary_paths)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._dictionary = None
+        self._dictionary_digest = ''
+        self._quizzes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def dictionary(self):
+        # Chargé à la première génération : les workers qui ne font pas de quiz n'en paient pas le coût
+        if self._dictionary is None:
+            with self._lock:
+                if self._dictionary is None:
+                    digest = hashlib.sha1()
+                    dictionary = Dictionary()
+                    for path in self.dictionary_paths:
+                        try:
+                            entries = _load_entries(path)
+                        except (OSError, ValueError) as e:
+                            print(f"Quiz : dictionnaire {path} ignoré ({e})")
+                            continue
+                        for entry in entries:
+                            dictionary.add(*entry)
+                        digest.update(json.dumps(entries, ensure_ascii=False).encode('utf-8'))
+                    self._dictionary_digest = digest.hexdigest()
+                    self._dictionary = dictionary
+        return self._dictionary
+
+    def _digest(self, content, count, variant):
+        data = json.dumps([content, count, variant], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1((self._dictionary_digest + data).encode('utf-8')).hexdigest()
+
+    def _cached(self, content, count, variant, build):
+        # L'empreinte du dictionnaire entre dans la clé : il doit être chargé avant
+        self.dictionary
+        key = self._digest(content, count, variant)
+        with self._lock:
+            quiz = self._quizzes.get(key)
+            if quiz is not None:
+                self._quizzes.move_to_end(key)
+                self.hits += 1
+                return quiz
+            self.misses += 1
+        quiz = build(random.Random(key))
+        with self._lock:
+            self._quizzes[key] = quiz
+            while len(self._quizzes) > self.cache_size:
+                self._quizzes.popitem(last=False)
+        return quiz
+
+    def quiz(self, record, count=5, variant=0):
+        """Quiz d'une séquence : ``{"questions", "vocabulaire"}`` (ne pas modifier : objet du cache).
+
+        ``variant`` donne un autre tirage sur le même contenu.
+        """
+        return self._cached(record, count, variant,
+                            lambda rng: self._build(record_text(record), count, rng, record))
+
+    def quiz_from_text(self, text, count=5, variant=0):
+        """Quiz d'un texte libre, mêmes règles que pour une séquence."""
+        return self._cached(text, count, variant, lambda rng: self._build([text], count, rng))
+
+    def lesson_plan(self, records, questions=3):
+        """Plan de cours des séquences ``records`` : objectifs, modalités, vocabulaire et activités."""
+        vocabulary = {}
+        activities = []
+        for seq in records:
+            quiz = self.quiz(seq, count=questions)
+            for item in quiz['vocabulaire']:
+                vocabulary.setdefault(fold(item['mot']), item)
+            activities.append({"sequence_id": seq.get('id'), "questions": quiz['questions']})
+        return {
+            "titre": "Plan de cours généré",
+            "sequences": records,
+            "objectifs": [f"Maîtriser le thème {seq.get('theme', 'inconnu')} (niveau {seq.get('niveau', 'inconnu')})"
+                          for seq in records],
+            "modalites": list(dict.fromkeys(seq.get('modalidad') for seq in records)),
+            "vocabulaire": list(vocabulary.values()),
+            "activites": activities,
+        }
+
+    def _build(self, texts, count, rng, record=None):
+        dictionary = self.dictionary
+        # Mots du texte : occurrences et première forme rencontrée, par clé repliée
+        counts, surface, sentences = Counter(), {}, []
+        for text in texts:
+            for sentence, _ in segment(text):
+                words = [(fold(w), w) for w in _WORD_RE.findall(sentence)]
+                if len(words) >= 5:
+                    sentences.append((sentence.strip(), words))
+                for key, word in words:
+                    counts[key] += 1
+                    surface.setdefault(key, word)
+        known = {key: dictionary.lookup(key) for key in counts}
+        content = [key for key in counts
+                   if known[key] or (len(key) >= 4 and key not in _STOPWORDS and not key.isdigit())]
+        # Mots du dictionnaire d'abord, puis les plus fréquents, puis les plus longs
+        content.sort(key=lambda key: (known[key] is None, -counts[key], -len(key)))
+        rank = {key: i for i, key in enumerate(content)}
+
+        vocabulary = []
+        for key in content[:VOCABULARY_SIZE]:
+            item = {"mot": surface[key], "occurrences": counts[key]}
+            if known[key]:
+                side, (maya, spanish, pos) = known[key]
+                item["traduction"] = spanish if side == 'maya' else ' / '.join(maya)
+                if pos:
+                    item["categorie"] = pos
+            vocabulary.append(item)
+
+        by_dictionary = [self._dictionary_question(surface[key], *known[key], rng)
+                         for key in content if known[key]]
+        cloze = []
+        for sentence, words in sentences:
+            candidates = [(rank[key], word) for key, word in words if key in rank]
+            if candidates:
+                cloze.append(self._cloze_question(sentence, min(candidates)[1], content, surface, rng))
+        rng.shuffle(cloze)
+        open_questions = [{"q": f"Définissez « {surface[key]} » et employez-le dans une phrase.",
+                           "type": "ouverte", "source": "vocabulaire"}
+                          for key in content[:VOCABULARY_SIZE] if not known[key]]
+
+        # Alternance des trois sources, puis questions générales pour compléter
+        questions = []
+        for i in range(max(len(by_dictionary), len(cloze), len(open_questions))):
+            for group in (by_dictionary, cloze, open_questions):
+                if i < len(group):
+                    questions.append(group[i])
+        questions += self._general_questions(record, texts)
+        return {"questions": questions[:count], "vocabulaire": vocabulary}
+
+    def _dictionary_question(self, word, side, entry, rng):
+        maya, spanish, _ = entry
+        if side == 'maya':
+            q, answer, pool = f"Que signifie « {word} » ?", spanish, self.dictionary.meanings
+        else:
+            q, answer, pool = f"Comment dit-on « {word} » en maya ?", maya[0], self.dictionary.forms
+        pool = [option for option in pool if option != answer]
+        options = rng.sample(pool, min(CHOICES - 1, len(pool))) + [answer]
+        rng.shuffle(options)
+        return {"q": q, "type": "choix", "options": options, "answer": answer, "source": "dictionnaire"}
+
+    @staticmethod
+    def _cloze_question(sentence, word, content, surface, rng):
+        text = re.sub(rf"(?<![^\W_]){re.escape(word)}(?![^\W_])", "_____", sentence, count=1)
+        pool = [surface[key] for key in content[:VOCABULARY_SIZE * 2] if surface[key] != word]
+        options = rng.sample(pool, min(CHOICES - 1, len(pool))) + [word]
+        rng.shuffle(options)
+        return {"q": f"Complétez : {text}", "type": "texte_a_trous", "options": options, "answer": word,
+                "source": "texte"}
+
+    @staticmethod
+    def _general_questions(record, texts):
+        if record is None:
+            return [{"q": "Quel est le thème principal du texte ?", "type": "ouverte", "source": "general"},
+                    {"q": "Combien de mots contient le texte ?", "type": "ouverte",
+                     "answer": sum(len(text.split()) for text in texts), "source": "general"}]
+        questions = [{"q": f"Expliquez le thème de la séquence '{record.get('theme', 'inconnu')}'.",
+                      "type": "ouverte", "source": "general"}]
+        question = {"q": "Quel est le niveau de cette séquence ?", "type": "choix", "options": list(NIVEAUX),
+                    "source": "general"}
+        if record.get('niveau') in NIVEAUX:
+            question["answer"] = record['niveau']
+        questions.append(question)
+        question = {"q": "La modalité est-elle présentielle ou en ligne ?", "type": "choix",
+                    "options": list(MODALITES), "source": "general"}
+        if record.get('modalidad') in MODALITES:
+            question["answer"] = record['modalidad']
+        questions.append(question)
+        return questions
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._quizzes), "hits": self.hits, "misses": self.misses,
+                    "dictionary_entries": len(self._dictionary) if self._dictionary is not None else None}
+
+
+def default_dictionary_paths():
+    """Dictionnaires maya–espagnol livrés à la racine du dépôt, s'ils sont présents."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [os.path.join(root, name) for name in ('maya-spanish-dictionary.json', 'spanish-maya-dictionary.json')]
+    return [path for path in paths if os.path.exists(path)]
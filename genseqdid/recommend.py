@@ -0,0 +1,330 @@
+"""Suggestions personnalisées : voisins les plus proches précalculés à l'écriture.
+
+Chaque séquence, ressource ou document est représenté par un vecteur de taille fixe
+(hachage des caractéristiques) : champs catégoriels (thème, niveau, modalité...), tags
+et TF-IDF de son texte. Les vecteurs normalisés forment une matrice NumPy ; les
+``k`` voisins les plus proches (cosinus) de chaque élément sont tenus à jour à chaque
+écriture par des produits matrice-vecteurs groupés. Une suggestion ne fait ensuite
+que cumuler les listes de voisins des éléments du profil : son coût ne dépend pas de
+la taille du catalogue.
+"""
+import heapq
+import math
+import os
+import threading
+import traceback
+import zlib
+from collections import Counter, OrderedDict, deque
+from itertools import islice
+
+import numpy as np
+
+from search_index import fold, index_terms, record_text
+
+# Champs catégoriels comparés à l'identique (après repli des accents)
+CATEGORICAL_FIELDS = ('theme', 'niveau', 'modalidad', 'langue', 'dialecte', 'type', 'contexte_culturel')
+# Poids relatifs des blocs de caractéristiques avant normalisation
+CATEGORICAL_WEIGHT = 1.0
+TEXT_WEIGHT = 1.0
+# Colonnes traitées par produit matriciel lors d'une mise à jour groupée
+FLUSH_CHUNK = 256
+# Écritures en attente appliquées dans la requête ; au-delà (chargement initial, import
+# de masse, rejeu d'un autre worker), elles sont confiées au thread de fond
+INLINE_FLUSH = 32
+
+
+def _feature(token, dim):
+    # Hachage signé : les collisions entre caractéristiques se compensent en moyenne
+    h = zlib.crc32(token.encode('utf-8'))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+class SuggestionEngine:
+    """Index des ``k`` plus proches voisins de tous les éléments attachés.
+
+    Les écritures notifiées par les collections sont mises en attente puis appliquées
+    par blocs de produits matriciels plutôt qu'élément par élément. ``wake`` (en fin de
+    requête d'écriture, ou avant une suggestion) applique tout de suite un petit nombre
+    d'écritures ; un gros arriéré, dont le calcul initial de toutes les listes au
+    démarrage, est traité par un thread de fond, bloc par bloc : entre deux blocs, les
+    suggestions sont servies avec les listes déjà calculées et, à défaut, par les
+    ajouts récents. Les IDF utilisés pour un élément sont ceux du corpus au moment de
+    sa dernière écriture.
+    """
+
+    def __init__(self, k=20, dim=1024, history=20, max_users=10000):
+        self.k = k
+        self.dim = dim
+        self.history = history
+        self.max_users = max_users
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._active = np.zeros(64, dtype=bool)
+        self._kth = np.zeros(64, dtype=np.float32)
+        self._rows = {}
+        self._docs = []
+        self._free = []
+        self._neighbors = []
+        self._referrers = []
+        self._terms = {}
+        self._df = Counter()
+        self._by_kind = {}
+        self._pending = OrderedDict()
+        self._views = OrderedDict()
+        self._pid = None
+        self._wakeup = threading.Condition(self._lock)
+
+    def attach(self, collection, kind):
+        self._by_kind.setdefault(kind, {})
+
+        def listener(event, key, record):
+            with self._lock:
+                if event == 'upsert':
+                    self._pending[(kind, key)] = record
+                elif event == 'delete':
+                    self._pending[(kind, key)] = None
+                elif event == 'clear':
+                    for doc in list(self._by_kind[kind]):
+                        self._pending[doc] = None
+                    for doc in [d for d in self._pending if d[0] == kind]:
+                        self._pending[doc] = None
+        collection.subscribe(listener)
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- Vectorisation ---
+    def _vector(self, record, terms):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for field in CATEGORICAL_FIELDS:
+            value = record.get(field)
+            if isinstance(value, str) and value:
+                index, sign = _feature(f'{field}={fold(value)}', self.dim)
+                vector[index] += sign
+        tags = record.get('tags')
+        if isinstance(tags, (list, tuple)):
+            for tag in tags:
+                if isinstance(tag, str) and tag:
+                    index, sign = _feature(f'tag={fold(tag)}', self.dim)
+                    vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector *= CATEGORICAL_WEIGHT / norm
+        text = np.zeros(self.dim, dtype=np.float32)
+        n_docs = len(self._terms) or 1
+        for term, tf in terms.items():
+            index, sign = _feature(term, self.dim)
+            text[index] += sign * (1 + math.log(tf)) * (math.log((1 + n_docs) / (1 + self._df[term])) + 1)
+        norm = np.linalg.norm(text)
+        if norm:
+            vector += text * (TEXT_WEIGHT / norm)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Mise à jour des voisins ---
+    def _grow(self):
+        capacity = len(self._active) * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._active)] = self._matrix
+        self._matrix = matrix
+        self._active = np.concatenate([self._active, np.zeros(capacity - len(self._active), dtype=bool)])
+        self._kth = np.concatenate([self._kth, np.zeros(capacity - len(self._kth), dtype=np.float32)])
+
+    def _allocate(self, doc):
+        if self._free:
+            row = self._free.pop()
+            self._docs[row] = doc
+        else:
+            row = len(self._docs)
+            if row >= len(self._active):
+                self._grow()
+            self._docs.append(doc)
+            self._neighbors.append({})
+            self._referrers.append(set())
+        self._rows[doc] = row
+        self._active[row] = True
+        return row
+
+    def _set_neighbors(self, row, neighbors):
+        for other in self._neighbors[row]:
+            self._referrers[other].discard(row)
+        self._neighbors[row] = neighbors
+        for other in neighbors:
+            self._referrers[other].add(row)
+        self._kth[row] = min(neighbors.values()) if len(neighbors) >= self.k else 0.0
+
+    def _drop_from_referrers(self, row, dirty):
+        # Les listes qui contenaient ``row`` ont perdu un voisin : elles seront recalculées
+        for other in list(self._referrers[row]):
+            self._neighbors[other].pop(row, None)
+            dirty.add(other)
+        self._referrers[row].clear()
+
+    def _insert(self, row, other, score):
+        neighbors = self._neighbors[row]
+        neighbors[other] = score
+        self._referrers[other].add(row)
+        if len(neighbors) > self.k:
+            weakest = min(neighbors, key=neighbors.get)
+            del neighbors[weakest]
+            self._referrers[weakest].discard(row)
+        self._kth[row] = min(neighbors.values()) if len(neighbors) >= self.k else 0.0
+
+    @property
+    def pending(self):
+        """Nombre d'écritures pas encore appliquées."""
+        return len(self._pending)
+
+    def wake(self):
+        """Applique les écritures en attente si elles sont peu nombreuses, sinon réveille le thread de fond."""
+        if not self._pending:
+            return
+        self._ensure_thread()
+        with self._lock:
+            if len(self._pending) <= INLINE_FLUSH:
+                self._flush_chunk(INLINE_FLUSH)
+            else:
+                self._wakeup.notify()
+
+    def _ensure_thread(self):
+        # Thread (re)démarré dans chaque processus, y compris après un fork de worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='suggestion-builder', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+            try:
+                # Verrou relâché entre deux blocs : les suggestions ne l'attendent qu'un bloc au plus
+                while self.pending:
+                    with self._lock:
+                        self._flush_chunk(FLUSH_CHUNK)
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        """Applique toutes les écritures en attente, dans le thread appelant."""
+        with self._lock:
+            while self._pending:
+                self._flush_chunk(FLUSH_CHUNK)
+
+    def _flush_chunk(self, size):
+        # Les ``size`` plus anciennes écritures en attente (verrou tenu par l'appelant)
+        pending = OrderedDict()
+        while self._pending and len(pending) < size:
+            doc, record = self._pending.popitem(last=False)
+            pending[doc] = record
+        dirty, changed = set(), []
+        for doc, record in pending.items():
+            row = self._rows.get(doc)
+            if row is not None:
+                self._drop_from_referrers(row, dirty)
+                self._set_neighbors(row, {})
+                for term in self._terms.pop(doc):
+                    self._df[term] -= 1
+                    if not self._df[term]:
+                        del self._df[term]
+            if record is None:
+                if row is not None:
+                    self._active[row] = False
+                    self._matrix[row] = 0
+                    del self._rows[doc]
+                    self._by_kind[doc[0]].pop(doc, None)
+                    self._free.append(row)
+                    dirty.discard(row)
+                continue
+            terms = Counter(term for text in record_text(record) for term in index_terms(text))
+            self._terms[doc] = terms
+            self._df.update(terms.keys())
+            if row is None:
+                row = self._allocate(doc)
+                self._by_kind[doc[0]][doc] = None
+            changed.append(row)
+            self._matrix[row] = self._vector(record, terms)
+        changed_set = set(changed)
+        fresh = list(changed_set | {row for row in dirty if self._active[row]})
+        self._recompute(fresh, changed_set)
+
+    def _recompute(self, fresh, changed):
+        size = len(self._docs)
+        if not fresh or not size:
+            return
+        matrix = self._matrix[:size]
+        inactive = ~self._active[:size]
+        stable = self._active[:size].copy()
+        stable[fresh] = False
+        for start in range(0, len(fresh), FLUSH_CHUNK):
+            rows = fresh[start:start + FLUSH_CHUNK]
+            scores = matrix @ matrix[rows].T
+            scores[inactive] = -np.inf
+            scores[rows, np.arange(len(rows))] = -np.inf
+            k = min(self.k, size - 1)
+            top = np.argpartition(-scores, k - 1, axis=0)[:k] if k > 0 else np.empty((0, len(rows)), dtype=int)
+            for column, row in enumerate(rows):
+                column_scores = scores[:, column]
+                self._set_neighbors(row, {int(other): float(column_scores[other])
+                                          for other in top[:, column] if column_scores[other] > 0})
+                if row not in changed:
+                    continue
+                # Un élément nouveau ou modifié entre dans les listes des autres où il se classe
+                for other in np.nonzero(stable & (column_scores > self._kth[:size]))[0]:
+                    self._insert(int(other), row, float(column_scores[other]))
+
+    # --- Lecture ---
+    def neighbors(self, doc):
+        """Voisins ``[(doc, score), ...]`` de ``doc``, du plus proche au plus lointain."""
+        self.wake()
+        with self._lock:
+            row = self._rows.get(doc)
+            if row is None:
+                return []
+            items = sorted(self._neighbors[row].items(), key=lambda item: -item[1])
+            return [(self._docs[other], score) for other, score in items]
+
+    def record_view(self, user, doc):
+        """Ajoute ``doc`` à l'historique récent (en mémoire, par processus) de ``user``."""
+        with self._lock:
+            views = self._views.get(user)
+            if views is None:
+                views = self._views[user] = deque(maxlen=self.history)
+                if len(self._views) > self.max_users:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(user)
+            if doc in views:
+                views.remove(doc)
+            views.append(doc)
+
+    def views(self, user):
+        with self._lock:
+            return list(self._views.get(user, ()))
+
+    def suggest(self, seeds, limit=10, kinds=None, fallback_kind=None):
+        """Éléments les plus proches du profil ``seeds`` (``{doc: poids}``).
+
+        Sans profil (ou pour compléter), les éléments les plus récents de ``fallback_kind``.
+        """
+        self.wake()
+        with self._lock:
+            scores = Counter()
+            for doc, weight in seeds.items():
+                row = self._rows.get(doc)
+                if row is None:
+                    continue
+                for other, score in self._neighbors[row].items():
+                    scores[other] += weight * score
+            candidates = ((self._docs[row], score) for row, score in scores.items())
+            candidates = [(doc, score) for doc, score in candidates
+                          if doc not in seeds and (not kinds or doc[0] in kinds)]
+            result = [doc for doc, _ in heapq.nlargest(limit, candidates, key=lambda item: item[1])]
+            if len(result) < limit and fallback_kind in self._by_kind:
+                chosen = set(result)
+                recent = (doc for doc in reversed(self._by_kind[fallback_kind]) if doc not in seeds and doc not in chosen)
+                result.extend(islice(recent, limit - len(result)))
+            return result
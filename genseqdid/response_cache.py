@@ -0,0 +1,95 @@
+"""Cache des réponses GET avec ETag et requêtes conditionnelles (If-None-Match → 304)."""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+from auth import optional_claims
+
+# En-têtes recalculés à chaque réponse servie depuis le cache
+_SKIPPED_HEADERS = frozenset(('content-length', 'content-type', 'etag'))
+
+
+class ResponseCache:
+    """LRU de corps de réponse indexé par endpoint, paramètres, rôles et version des données.
+
+    Chaque collection suivie (``track``) a, sous son nom, un compteur de version incrémenté
+    à chacune de ses écritures, y compris celles rejouées depuis les autres processus :
+    une entrée dont les collections ont changé n'est plus jamais atteinte et sort du LRU.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def track(self, name, collection):
+        self._versions.setdefault(name, 0)
+
+        def listener(event, key, record):
+            self._versions[name] += 1
+        collection.subscribe(listener)
+
+    def data_version(self, names):
+        return tuple(self._versions.get(name, 0) for name in names)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cached(self, *collections):
+        """Met en cache les réponses 200 d'une vue GET qui ne dépend que des collections nommées.
+
+        À placer sous ``jwt_required`` / ``role_required`` : l'authentification reste
+        vérifiée à chaque requête, seule la construction de la réponse est évitée.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (
+                    request.endpoint,
+                    tuple(sorted(kwargs.items())),
+                    tuple(sorted(request.args.items(multi=True))),
+                    tuple(sorted(optional_claims().get('roles', ()))),
+                    self.data_version(collections),
+                )
+                entry = self.get(key)
+                if entry is None:
+                    response = current_app.make_response(current_app.ensure_sync(fn)(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data()
+                    headers = [(k, v) for k, v in response.headers if k.lower() not in _SKIPPED_HEADERS]
+                    entry = (body, response.mimetype, headers, hashlib.sha1(body).hexdigest())
+                    self.put(key, entry)
+                body, mimetype, headers, etag = entry
+                response = current_app.response_class(body, mimetype=mimetype, headers=headers)
+                response.set_etag(etag)
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
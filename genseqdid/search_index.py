@@ -0,0 +1,145 @@
+"""Index inversé plein texte (BM25) sur les séquences et ressources.
+
+La tokenisation replie les accents et conserve les apostrophes du maya
+(glottalisation : k'aaba', t'aan), toutes variantes typographiques confondues.
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+# Variantes typographiques de l'apostrophe / du saltillo rencontrées dans les textes mayas
+_APOSTROPHES = str.maketrans({c: "'" for c in "’‘ʼʻ´`′"})
+_TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]*)*")
+# Élisions françaises : « l'école » est aussi indexé comme « ecole » (t' est une consonne maya, pas une élision)
+_ELISION_RE = re.compile(r"^(?:l|d|j|qu|n|s|c|m)'(.+)$")
+# Champs contenant des liens plutôt que du texte
+SKIPPED_FIELDS = frozenset(('id', 'url', 'support_audio', 'support_video'))
+
+
+def fold(text):
+    """Minuscules, accents supprimés et apostrophes normalisées."""
+    text = unicodedata.normalize('NFKD', text.translate(_APOSTROPHES).lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Tokens d'une requête ou d'un texte (apostrophes internes et finales conservées)."""
+    return _TOKEN_RE.findall(fold(text)) if text else []
+
+
+def index_terms(text):
+    """Tokens d'un document, plus leurs variantes sans apostrophe pour les saisies simplifiées."""
+    for token in tokenize(text):
+        yield token
+        if "'" in token:
+            elided = _ELISION_RE.match(token)
+            variant = elided.group(1) if elided else token.replace("'", '')
+            if variant and variant != token:
+                yield variant
+
+
+def record_text(value):
+    """Chaînes d'un enregistrement (tags et commentaires compris), hors champs de liens."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for field, item in value.items():
+            if field not in SKIPPED_FIELDS:
+                yield from record_text(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from record_text(item)
+
+
+class InvertedIndex:
+    """Index inversé incrémental partagé par plusieurs collections.
+
+    Les documents sont identifiés par ``(kind, id)`` ; ``attach`` abonne l'index aux
+    écritures d'une ``Collection`` pour qu'il reste à jour sans reconstruction.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._total_len = 0
+        self._by_kind = {}
+
+    def attach(self, collection, kind):
+        def listener(event, key, record):
+            if event == 'upsert':
+                self.add((kind, key), record)
+            elif event == 'delete':
+                self.remove((kind, key))
+            elif event == 'clear':
+                self.remove_kind(kind)
+        collection.subscribe(listener)
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, doc, record):
+        terms = Counter(term for text in record_text(record) for term in index_terms(text))
+        with self._lock:
+            self.remove(doc)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc] = tf
+            length = sum(terms.values())
+            self._doc_terms[doc] = terms
+            self._doc_len[doc] = length
+            self._total_len += length
+            self._by_kind.setdefault(doc[0], set()).add(doc)
+
+    def remove(self, doc):
+        with self._lock:
+            terms = self._doc_terms.pop(doc, None)
+            if terms is None:
+                return
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(doc, None)
+                    if not posting:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc)
+            self._by_kind.get(doc[0], set()).discard(doc)
+
+    def remove_kind(self, kind):
+        with self._lock:
+            for doc in list(self._by_kind.get(kind, ())):
+                self.remove(doc)
+
+    def search(self, query, kinds=None):
+        """Documents contenant tous les termes de ``query``, avec leur score BM25.
+
+        Renvoie une liste ``[(score, (kind, id)), ...]`` non triée ; une requête vide
+        renvoie tous les documents des ``kinds`` demandés avec un score nul.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms:
+                docs = set().union(*(self._by_kind.get(k, ()) for k in (kinds or self._by_kind)))
+                return [(0.0, doc) for doc in docs]
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            smallest, rest = postings[0], postings[1:]
+            n_docs = len(self._doc_len)
+            avg_len = self._total_len / n_docs if n_docs else 0.0
+            idfs = [math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+            hits = []
+            for doc in smallest:
+                if kinds and doc[0] not in kinds:
+                    continue
+                if not all(doc in p for p in rest):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc] / avg_len) if avg_len else self.k1
+                score = sum(idf * p[doc] * (self.k1 + 1) / (p[doc] + norm) for idf, p in zip(idfs, postings))
+                hits.append((score, doc))
+            return hits
@@ -0,0 +1,76 @@
+"""Lancement de production de genseqdid avec plusieurs workers.
+
+    python serve.py                      # gunicorn, workers à threads (gthread)
+    python serve.py --mode gevent        # gunicorn, workers coopératifs (gevent)
+
+En mode ``gevent``, une requête qui attend un service lent (traduction, génération,
+flux SSE des sessions) ne bloque pas de thread système : le worker continue de servir
+les autres requêtes pendant l'attente. Les dépendances sont dans requirements-prod.txt.
+
+Il n'y a pas de mode ASGI : l'application est WSGI et un adaptateur (``asgiref``) ne
+ferait que rejouer chaque requête sur un thread, sans gain de concurrence d'E/S ; son
+exécuteur par défaut n'a même qu'un thread, si bien qu'un flux SSE ou une attente
+longue de notifications bloquerait tout le worker. Pour les connexions longues,
+utiliser ``--mode gevent``.
+
+Variables d'environnement : ``WEB_CONCURRENCY`` (processus, 2 × CPU + 1 par défaut),
+``GENSEQDID_THREADS`` (threads par processus en mode gthread, 8 par défaut),
+``GENSEQDID_CONNECTIONS`` (connexions simultanées par processus en mode gevent, 1000).
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _prepare_database():
+    # Tables et comptes de démonstration créés une seule fois, avant le démarrage des workers
+    from app import app, db, init_db
+    with app.app_context():
+        init_db()
+        db.engine.dispose()
+
+
+def _run_gunicorn(bind, workers, worker_class, threads, connections, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class GenseqdidApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', worker_class)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_connections', connections)
+            self.cfg.set('timeout', timeout)
+
+        def load(self):
+            from app import app
+            return app
+
+    GenseqdidApplication().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur de production genseqdid")
+    parser.add_argument('--mode', choices=('threads', 'gevent'), default='threads')
+    parser.add_argument('--bind', default=os.environ.get('GENSEQDID_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GENSEQDID_THREADS', 8)))
+    parser.add_argument('--connections', type=int, default=int(os.environ.get('GENSEQDID_CONNECTIONS', 1000)))
+    parser.add_argument('--timeout', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'gevent':
+        # Doit précéder tout import de l'application (threads, sockets, verrous)
+        from gevent import monkey
+        monkey.patch_all()
+    _prepare_database()
+    worker_class = 'gevent' if args.mode == 'gevent' else 'gthread'
+    _run_gunicorn(args.bind, args.workers, worker_class, args.threads, args.connections, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
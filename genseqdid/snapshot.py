@@ -0,0 +1,240 @@
+"""Instantanés binaires des collections (export/import en flux, lecture paresseuse, diff).
+
+Format (entiers en little-endian) :
+
+    MAGIC                         8 octets
+    longueur + en-tête JSON       uint32 + {"format", "compression", "created"}
+    sections                      une par collection, compressée (gzip, ou zstd si
+                                  ``zstandard`` est installé) : suite de trames
+                                  uint32 longueur + enregistrement JSON (clés triées)
+    index JSON                    {"collections": {nom: {offset, length, count, sha256}}}
+    pied                          uint64 position de l'index + uint32 sa longueur + END
+
+L'index est écrit après les sections pour que l'export parte en flux sans connaître
+leur taille ; un lecteur commence par le pied (taille fixe) et n'ouvre ensuite que
+les sections demandées. Le ``sha256`` porte sur les trames non compressées : deux
+instantanés d'une collection identique ont la même empreinte.
+
+    python snapshot.py info prod.snap
+    python snapshot.py diff hier.snap aujourdhui.snap
+"""
+import argparse
+import hashlib
+import json
+import struct
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'GSQSNAP\x01'
+END = b'GSQSEND\x01'
+FORMAT = 1
+_FRAME = struct.Struct('<I')
+_FOOTER = struct.Struct('<QI8s')
+# Taille des blocs compressés envoyés par l'export et lus par l'import
+CHUNK_SIZE = 64 * 1024
+COMPRESSIONS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+class SnapshotError(ValueError):
+    """Fichier qui n'est pas un instantané valide (ou compression non disponible)."""
+
+
+def encode_record(record):
+    """Trame d'un enregistrement : JSON compact aux clés triées, précédé de sa longueur."""
+    data = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return _FRAME.pack(len(data)) + data
+
+
+def _compressor(compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise SnapshotError("Compression zstd indisponible (paquet zstandard absent)")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    raise SnapshotError(f"Compression inconnue : {compression}")
+
+
+def _decompressor(compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise SnapshotError("Compression zstd indisponible (paquet zstandard absent)")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if compression == 'gzip':
+        return zlib.decompressobj(31)
+    raise SnapshotError(f"Compression inconnue : {compression}")
+
+
+def write_snapshot(collections, compression=None):
+    """Générateur des octets d'un instantané de ``{nom: enregistrements}``.
+
+    Les enregistrements ne sont encodés et compressés qu'au fil de l'envoi ; passer des
+    listes déjà figées (``Collection.all()``) donne un état cohérent à l'instant de l'appel.
+    """
+    compression = compression or COMPRESSIONS[0]
+    _compressor(compression)
+    header = json.dumps({"format": FORMAT, "compression": compression,
+                         "created": datetime.now(timezone.utc).isoformat()}).encode('utf-8')
+    head = MAGIC + _FRAME.pack(len(header)) + header
+    position = len(head)
+    yield head
+    index = {}
+    for name, records in collections.items():
+        compressor = _compressor(compression)
+        digest = hashlib.sha256()
+        offset, count, pending, pending_size = position, 0, [], 0
+        for record in records:
+            frame = encode_record(record)
+            digest.update(frame)
+            count += 1
+            data = compressor.compress(frame)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+                if pending_size >= CHUNK_SIZE:
+                    block = b''.join(pending)
+                    pending, pending_size = [], 0
+                    position += len(block)
+                    yield block
+        pending.append(compressor.flush())
+        block = b''.join(pending)
+        position += len(block)
+        yield block
+        index[name] = {"offset": offset, "length": position - offset, "count": count, "sha256": digest.hexdigest()}
+    data = json.dumps({"collections": index}).encode('utf-8')
+    yield data + _FOOTER.pack(position, len(data), END)
+
+
+class SnapshotReader:
+    """Lecture paresseuse d'un instantané depuis un fichier ouvert en binaire (avec ``seek``)."""
+
+    def __init__(self, file):
+        self.file = file
+        file.seek(0)
+        if file.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError("Fichier d'instantané invalide (signature)")
+        try:
+            (size,) = _FRAME.unpack(file.read(_FRAME.size))
+            self.header = json.loads(file.read(size))
+            file.seek(-_FOOTER.size, 2)
+            offset, size, end = _FOOTER.unpack(file.read(_FOOTER.size))
+            if end != END:
+                raise SnapshotError("Instantané tronqué (pied absent)")
+            file.seek(offset)
+            self.index = json.loads(file.read(size))['collections']
+        except (struct.error, ValueError, KeyError, OSError) as e:
+            if isinstance(e, SnapshotError):
+                raise
+            raise SnapshotError(f"Instantané illisible ({e})") from e
+        if self.header.get('format') != FORMAT:
+            raise SnapshotError(f"Version d'instantané non prise en charge : {self.header.get('format')}")
+        self.compression = self.header.get('compression')
+        _decompressor(self.compression)
+
+    @property
+    def collections(self):
+        """``{nom: nombre d'enregistrements}``."""
+        return {name: entry['count'] for name, entry in self.index.items()}
+
+    def _frames(self, name):
+        entry = self.index.get(name)
+        if entry is None:
+            return
+        decompressor = _decompressor(self.compression)
+        digest = hashlib.sha256()
+        self.file.seek(entry['offset'])
+        remaining, buffer, count = entry['length'], b'', 0
+        while remaining:
+            block = self.file.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                raise SnapshotError(f"Section {name} tronquée")
+            remaining -= len(block)
+            try:
+                buffer += decompressor.decompress(block)
+            except Exception as e:
+                raise SnapshotError(f"Section {name} corrompue ({e})") from e
+            start = 0
+            while len(buffer) - start >= _FRAME.size:
+                (size,) = _FRAME.unpack_from(buffer, start)
+                if len(buffer) - start - _FRAME.size < size:
+                    break
+                frame = buffer[start:start + _FRAME.size + size]
+                digest.update(frame)
+                count += 1
+                yield frame[_FRAME.size:]
+                start += _FRAME.size + size
+            buffer = buffer[start:]
+        if buffer or count != entry['count'] or digest.hexdigest() != entry['sha256']:
+            raise SnapshotError(f"Section {name} corrompue")
+
+    def records(self, name):
+        """Enregistrements de la collection ``name``, décodés un à un (rien si elle est absente)."""
+        for data in self._frames(name):
+            yield json.loads(data)
+
+    def verify(self):
+        """Vérifie toutes les sections (décompression et empreintes) sans décoder le JSON."""
+        for name in self.index:
+            for _ in self._frames(name):
+                pass
+
+
+def diff_records(records, current, key=lambda record: record.get('id')):
+    """Compare un flux d'enregistrements à ``current`` (``{clé: enregistrement}``).
+
+    Génère ``('upsert', enregistrement)`` pour chaque ajout ou modification, puis
+    ``('delete', clé)`` pour chaque clé de ``current`` absente du flux.
+    """
+    seen = set()
+    for record in records:
+        k = key(record)
+        seen.add(k)
+        if current.get(k) != record:
+            yield 'upsert', record
+    for k in current:
+        if k not in seen:
+            yield 'delete', k
+
+
+def _digests(reader, name):
+    return {json.loads(data).get('id'): hashlib.sha1(data).digest() for data in reader._frames(name)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Instantanés genseqdid")
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help="collections, tailles et empreintes")
+    info.add_argument('path')
+    diff = commands.add_parser('diff', help="enregistrements ajoutés, modifiés et supprimés entre deux instantanés")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        with open(args.path, 'rb') as f:
+            reader = SnapshotReader(f)
+            print(f"créé le {reader.header.get('created')}, compression {reader.compression}")
+            for name, entry in reader.index.items():
+                print(f"{name:<20}{entry['count']:>10} enregistrements{entry['length']:>12} octets  {entry['sha256'][:16]}")
+        return
+    with open(args.old, 'rb') as f_old, open(args.new, 'rb') as f_new:
+        old, new = SnapshotReader(f_old), SnapshotReader(f_new)
+        print(f"{'collection':<20}{'ajoutés':>10}{'modifiés':>10}{'supprimés':>10}")
+        for name in dict.fromkeys(list(old.index) + list(new.index)):
+            if old.index.get(name, {}).get('sha256') == new.index.get(name, {}).get('sha256'):
+                print(f"{name:<20}{0:>10}{0:>10}{0:>10}")
+                continue
+            before, after = _digests(old, name), _digests(new, name)
+            added = sum(1 for k in after if k not in before)
+            changed = sum(1 for k in after if k in before and before[k] != after[k])
+            removed = sum(1 for k in before if k not in after)
+            print(f"{name:<20}{added:>10}{changed:>10}{removed:>10}")
+
+
+if __name__ == '__main__':
+    main()
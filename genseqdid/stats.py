@@ -0,0 +1,193 @@
+"""Statistiques de corpus maintenues au fil des écritures (fréquences de mots, histogrammes)."""
+import heapq
+import threading
+from collections import Counter
+
+# Champs des séquences dont la répartition est exposée par /api/stats
+HISTOGRAM_FIELDS = ('niveau', 'theme', 'modalidad')
+
+
+def _words(record, text_field):
+    text = record.get(text_field)
+    return text.lower().split() if isinstance(text, str) else []
+
+
+def _bucket(value):
+    # Les valeurs non hachables (listes importées d'un CSV, ...) sont comptées sous leur forme texte
+    try:
+        hash(value)
+    except TypeError:
+        return str(value)
+    return value
+
+
+def _rank_key(item):
+    # Fréquence décroissante, puis ordre alphabétique : classement identique qu'il soit incrémental ou recalculé
+    return -item[1], item[0]
+
+
+class CorpusStats:
+    """Agrégats de plusieurs collections, mis à jour de façon incrémentale.
+
+    Comme ``InvertedIndex``, chaque document est identifié par ``(kind, id)`` et sa
+    contribution est mémorisée pour pouvoir être retirée lors d'une mise à jour ou
+    d'une suppression : les lectures ne parcourent jamais le corpus.
+
+    Les ``top`` mots les plus fréquents sont tenus à jour à l'écriture : un mot qui
+    monte est comparé au dernier du classement, et ``_outside_max`` borne la fréquence
+    des mots hors classement. Le vocabulaire n'est reparcouru que lorsqu'un membre
+    descend jusqu'à cette borne (il pourrait sortir du classement).
+    """
+
+    def __init__(self, histogram_fields=HISTOGRAM_FIELDS, top=10):
+        self.histogram_fields = tuple(histogram_fields)
+        self.top = top
+        self._lock = threading.RLock()
+        self._sources = []
+        self._reset()
+
+    def _reset(self):
+        self.word_counts = Counter()
+        self.total_words = 0
+        self.histograms = {field: Counter() for field in self.histogram_fields}
+        self._totals = Counter()
+        self._docs = {}
+        # Classement des ``top`` premiers {mot: fréquence} ; None : à recalculer à la prochaine lecture
+        self._top = None
+        self._outside_max = 0
+        self._most_common = None
+
+    def attach(self, collection, kind, text_field, histograms=False):
+        """Abonne les statistiques aux écritures de ``collection``.
+
+        Les mots du champ ``text_field`` sont comptés ; ``histograms`` ajoute la
+        répartition des champs ``histogram_fields`` de cette collection.
+        """
+        self._sources.append((collection, kind, text_field, histograms))
+
+        def listener(event, key, record):
+            if event == 'upsert':
+                self.add((kind, key), record, text_field, histograms)
+            elif event == 'delete':
+                self.remove((kind, key))
+            elif event == 'clear':
+                self.remove_kind(kind)
+        collection.subscribe(listener)
+
+    def add(self, doc, record, text_field, histograms=False):
+        words = Counter(_words(record, text_field))
+        fields = tuple((f, _bucket(record.get(f))) for f in self.histogram_fields if f in record) if histograms else ()
+        with self._lock:
+            # Seule la variation des mots par rapport à la version précédente touche le classement
+            delta = Counter(words)
+            previous = self._docs.get(doc)
+            if previous is not None:
+                delta.subtract(previous[0])
+                self._drop(doc)
+            self._docs[doc] = (words, fields)
+            self._count(delta)
+            self.total_words += sum(words.values())
+            for field, value in fields:
+                self.histograms[field][value] += 1
+            self._totals[doc[0]] += 1
+
+    def remove(self, doc):
+        with self._lock:
+            entry = self._docs.get(doc)
+            if entry is not None:
+                self._count({word: -count for word, count in entry[0].items()})
+                self._drop(doc)
+
+    def _drop(self, doc):
+        # Retire tout sauf les mots, déjà décomptés par l'appelant
+        words, fields = self._docs.pop(doc)
+        self.total_words -= sum(words.values())
+        for field, value in fields:
+            histogram = self.histograms[field]
+            histogram[value] -= 1
+            if histogram[value] <= 0:
+                del histogram[value]
+        self._totals[doc[0]] -= 1
+
+    def _count(self, delta):
+        """Applique ``{mot: variation}`` aux fréquences et au classement."""
+        for word, change in delta.items():
+            if not change:
+                continue
+            count = self.word_counts[word] + change
+            if count > 0:
+                self.word_counts[word] = count
+            else:
+                self.word_counts.pop(word, None)
+                count = 0
+            if self._top is not None:
+                self._rank(word, count, change)
+
+    def _rank(self, word, count, change):
+        top = self._top
+        if word in top:
+            if count > self._outside_max:
+                top[word] = count
+            elif count == 0 and not self._outside_max:
+                del top[word]
+            else:
+                # Un mot hors classement pourrait le dépasser : recalcul à la prochaine lecture
+                self._top = None
+        elif count and change > 0:
+            if len(top) < self.top:
+                top[word] = count
+            else:
+                last = max(top.items(), key=_rank_key)
+                if _rank_key((word, count)) > _rank_key(last):
+                    self._outside_max = max(self._outside_max, count)
+                    return
+                # Le dernier du classement en sort
+                del top[last[0]]
+                top[word] = count
+                self._outside_max = max(self._outside_max, last[1])
+        else:
+            return
+        self._most_common = None
+
+    def remove_kind(self, kind):
+        with self._lock:
+            for doc in [doc for doc in self._docs if doc[0] == kind]:
+                self.remove(doc)
+
+    def corpus(self):
+        """Nombre total de mots, mots distincts et mots les plus fréquents."""
+        with self._lock:
+            if self._top is None:
+                ranked = heapq.nsmallest(self.top + 1, self.word_counts.items(), key=_rank_key)
+                self._top = dict(ranked[:self.top])
+                self._outside_max = ranked[self.top][1] if len(ranked) > self.top else 0
+                self._most_common = None
+            if self._most_common is None:
+                self._most_common = sorted(self._top.items(), key=_rank_key)
+            return {
+                "total_words": self.total_words,
+                "unique_words": len(self.word_counts),
+                "most_common": self._most_common
+            }
+
+    def distribution(self, kind):
+        """Histogrammes des champs pédagogiques et nombre de documents de ``kind``."""
+        with self._lock:
+            return {field: dict(counts) for field, counts in self.histograms.items()}, self._totals[kind]
+
+    def _state(self):
+        return (self.word_counts, self.total_words, self.histograms, self._totals)
+
+    def rebuild(self):
+        """Recalcule tout depuis les collections et indique si l'état incrémental était cohérent."""
+        fresh = CorpusStats(self.histogram_fields, self.top)
+        with self._lock:
+            for collection, kind, text_field, histograms in self._sources:
+                for record in collection:
+                    fresh.add((kind, collection.key(record['id'])), record, text_field, histograms)
+            names = ('word_counts', 'total_words', 'histograms', 'totals')
+            differences = [name for name, old, new in zip(names, self._state(), fresh._state()) if old != new]
+            self.word_counts, self.total_words = fresh.word_counts, fresh.total_words
+            self.histograms, self._totals, self._docs = fresh.histograms, fresh._totals, fresh._docs
+            self._top = self._most_common = None
+            return {"consistent": not differences, "differences": differences, "documents": len(self._docs)}
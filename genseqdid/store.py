@@ -0,0 +1,546 @@
+"""Dépôt indexé pour les séquences, ressources et documents.
+
+Chaque processus garde une copie en mémoire (``Collection``) indexée par id et par
+champs pédagogiques ; la persistance et la diffusion des écritures entre processus
+passent par un ``SqlBackend`` et son journal de modifications.
+
+Le curseur de rejeu est l'id du journal. Sur PostgreSQL, un id est attribué à
+l'insertion, pas à la validation : une transaction d'id plus petit peut être validée
+après une autre d'id plus grand. Chaque id manquant sous le curseur est donc gardé
+comme « trou » et relu à chaque synchronisation. Il est rejoué s'il apparaît, et
+oublié après ``Collection.GAP_TIMEOUT`` secondes (transaction annulée).
+"""
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+# Champs pédagogiques sur lesquels les listes sont filtrées
+INDEXED_FIELDS = ('niveau', 'theme', 'modalidad', 'langue', 'dialecte')
+
+
+def _indexable(value):
+    return isinstance(value, (str, int, float, bool)) or value is None
+
+
+def _numeric(key):
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return None
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Collection:
+    """Collection d'enregistrements (dicts) indexée par id et par champs secondaires.
+
+    Les lectures et suppressions par id sont en O(1) ; un filtre sur les champs
+    indexés ne parcourt que le plus petit des index concernés. Les enregistrements
+    doivent être modifiés via ``update`` pour que les index restent cohérents.
+
+    Des abonnés (``subscribe``) sont notifiés de chaque écriture par
+    ``listener(event, key, record)`` avec ``event`` parmi 'upsert', 'delete', 'clear'.
+
+    Une fois attachée à un stockage (``bind``), chaque écriture y est d'abord
+    persistée ; ``sync`` rejoue ensuite les écritures des autres processus.
+    ``replaying`` est vrai pendant ce rejeu (et le chargement initial) : un abonné
+    peut ainsi ne réagir qu'aux écritures faites par ce processus. Les fonctions
+    enregistrées par ``before_commit`` sont appelées dans la transaction même d'une
+    écriture locale, juste avant sa validation (ex. boîte d'envoi transactionnelle).
+    """
+
+    # Délai au-delà duquel un id manquant du journal est tenu pour une transaction annulée
+    GAP_TIMEOUT = 60
+
+    def __init__(self, id_type=int, indexed_fields=INDEXED_FIELDS, records=None):
+        self.id_type = id_type
+        self.indexed_fields = tuple(indexed_fields)
+        self.backend = None
+        self.version = 0
+        # Ids du journal inférieurs à ``version`` pas encore vus : {id: échéance (time.monotonic)}
+        self._gaps = {}
+        self.replaying = False
+        self._lock = threading.RLock()
+        self._records = {}
+        self._rank = {}
+        self._next_rank = 0
+        self._max_id = 0
+        self._indexes = {field: defaultdict(dict) for field in self.indexed_fields}
+        self._listeners = []
+        self._commit_hooks = []
+        if records:
+            self.extend(records)
+
+    def subscribe(self, listener):
+        """Enregistre un abonné et lui rejoue les enregistrements existants."""
+        with self._lock:
+            self._listeners.append(listener)
+            for key, record in self._records.items():
+                listener('upsert', key, record)
+
+    def _notify(self, event, key=None, record=None):
+        for listener in self._listeners:
+            listener(event, key, record)
+
+    def before_commit(self, hook):
+        """Enregistre ``hook(event, items)``, appelé dans la transaction de chaque écriture persistée.
+
+        ``event`` vaut 'upsert' (``items`` : enregistrements), 'delete' (clés) ou 'clear'
+        (``items`` : None, suivi d'un 'upsert' des nouveaux enregistrements). Une exception
+        annule l'écriture.
+        """
+        self._commit_hooks.append(hook)
+
+    def _hooks(self, *calls):
+        if not self._commit_hooks:
+            return None
+
+        def run():
+            for event, items in calls:
+                for hook in self._commit_hooks:
+                    hook(event, items)
+        return run
+
+    # --- Persistance ---
+    def bind(self, backend):
+        """Attache la collection à un stockage et charge son contenu.
+
+        Un stockage vide est initialisé avec les enregistrements déjà en mémoire
+        (données de démonstration).
+        """
+        with self._lock:
+            self.backend = backend
+            if self._records and not backend.count():
+                try:
+                    backend.save(self.all())
+                except IntegrityError:
+                    # Un autre processus a initialisé le stockage en même temps
+                    backend.rollback()
+            self._reload()
+
+    def _reload(self):
+        version = self.backend.latest_version()
+        # Transactions encore en cours sous la version chargée : rejouées quand elles seront validées
+        self._gaps = {}
+        start, logged = self.backend.logged_ids(version)
+        self._track_gaps(logged, version, start)
+        self.replaying = True
+        try:
+            self._apply_clear()
+            for record in self.backend.load_all():
+                self._apply_upsert(self.key(record['id']), record)
+        finally:
+            self.replaying = False
+        self.backend.ensure_ids_above(self._max_id)
+        self.version = version
+
+    def behind(self, latest):
+        """Vrai si le journal (de version ``latest``) a des écritures à rejouer."""
+        return latest > self.version or bool(self._gaps)
+
+    def _track_gaps(self, seen, upto, start):
+        """Note les ids de ``]start, upto]`` absents de ``seen`` et retire ceux qui y sont."""
+        now = time.monotonic()
+        for change_id in seen:
+            self._gaps.pop(change_id, None)
+        for change_id in range(start + 1, upto + 1):
+            if change_id not in seen:
+                self._gaps.setdefault(change_id, now + self.GAP_TIMEOUT)
+        for change_id in [i for i, deadline in self._gaps.items() if deadline <= now]:
+            del self._gaps[change_id]
+
+    def sync(self, latest=None):
+        """Applique les écritures des autres processus survenues depuis ``self.version``."""
+        if self.backend is None:
+            return
+        with self._lock:
+            latest = self.backend.latest_version() if latest is None else latest
+            if not self.behind(latest):
+                return
+            changes = self.backend.changes_since(self.version, self._gaps)
+            if changes is None or any(op == 'clear' for _, op, _ in changes):
+                self._reload()
+                return
+            # Entrées des autres collections comprises (op None) : elles comblent aussi des trous
+            upto = max([latest] + [change_id for change_id, _, _ in changes])
+            self._track_gaps({change_id for change_id, _, _ in changes}, upto, self.version)
+            keys = list(dict.fromkeys(self.key(item_id) for _, op, item_id in changes if op is not None))
+            records = self.backend.load(keys)
+            self.replaying = True
+            try:
+                for key in keys:
+                    if key in records:
+                        self._apply_upsert(key, records[key])
+                    else:
+                        self._apply_delete(key)
+            finally:
+                self.replaying = False
+            self.version = max(self.version, upto)
+
+    def _persisted(self, versions):
+        # Avance la version locale si aucune écriture concurrente ne s'est intercalée
+        if versions and versions[0] == self.version + 1:
+            self.version = versions[1]
+
+    def new_ids(self, count):
+        """Réserve ``count`` nouveaux identifiants (uniques entre processus une fois la collection attachée)."""
+        with self._lock:
+            if self.backend is not None:
+                start = self.backend.allocate_ids(count)
+            else:
+                start = self._max_id + 1
+            self._max_id = max(self._max_id, start + count - 1)
+            return [self.id_type(start + i) for i in range(count)]
+
+    def new_id(self):
+        return self.new_ids(1)[0]
+
+    # --- Accès ---
+    def key(self, id):
+        """Normalise un id (int pour les séquences, str pour les ressources), None si invalide."""
+        try:
+            return self.id_type(id)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, id):
+        return self._records.get(self.key(id))
+
+    def __contains__(self, id):
+        return self.key(id) in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def all(self):
+        return list(self._records.values())
+
+    def ids(self):
+        return list(self._records)
+
+    # --- Écritures ---
+    def _prepare(self, records):
+        missing = [record for record in records if record.get('id') in (None, '')]
+        for record, new_id in zip(missing, self.new_ids(len(missing)) if missing else ()):
+            record['id'] = new_id
+        for record in records:
+            key = self.key(record.get('id'))
+            if key is None:
+                raise ValueError(f"Identifiant invalide : {record.get('id')!r}")
+            record['id'] = key
+        return records
+
+    def add(self, record):
+        """Ajoute (ou remplace) un enregistrement ; un id est attribué s'il est absent."""
+        self.extend([record])
+        return record
+
+    def extend(self, records):
+        """Ajoute un lot d'enregistrements, persisté en une seule transaction."""
+        with self._lock:
+            records = self._prepare(list(records))
+            if self.backend is not None:
+                self._persisted(self.backend.save(records, self._hooks(('upsert', records))))
+            for record in records:
+                self._apply_upsert(record['id'], record)
+            return records
+
+    def update(self, id, changes):
+        """Applique ``changes`` à l'enregistrement (l'id reste inchangé). None si absent."""
+        with self._lock:
+            key = self.key(id)
+            record = self._records.get(key)
+            if record is None:
+                return None
+            updated = dict(record)
+            updated.update(changes)
+            updated['id'] = key
+            if self.backend is not None:
+                self._persisted(self.backend.save([updated], self._hooks(('upsert', [updated]))))
+            self._apply_upsert(key, updated)
+            return updated
+
+    def delete(self, id):
+        deleted = self.delete_many([id])
+        return deleted[0] if deleted else None
+
+    def delete_many(self, ids):
+        """Supprime un lot d'enregistrements en une seule transaction ; renvoie ceux qui existaient."""
+        with self._lock:
+            keys = [k for k in dict.fromkeys(self.key(id) for id in ids) if k in self._records]
+            if not keys:
+                return []
+            if self.backend is not None:
+                self._persisted(self.backend.delete(keys, self._hooks(('delete', keys))))
+            return [self._apply_delete(key) for key in keys]
+
+    def clear(self):
+        self.replace_all([])
+
+    def replace_all(self, records):
+        """Remplace tout le contenu (import/réinitialisation) en une seule transaction."""
+        with self._lock:
+            records = self._prepare(list(records))
+            if self.backend is not None:
+                self._persisted(self.backend.replace_all(records, self._hooks(('clear', None), ('upsert', records))))
+            self._apply_clear()
+            self._max_id = 0
+            for record in records:
+                self._apply_upsert(record['id'], record)
+
+    # --- Application locale (écritures locales et synchronisation) ---
+    def _apply_upsert(self, key, record):
+        previous = self._records.get(key)
+        if previous is not None:
+            self._unindex(key, previous)
+        else:
+            self._rank[key] = self._next_rank
+            self._next_rank += 1
+        self._records[key] = record
+        self._index(key, record)
+        numeric = _numeric(key)
+        if numeric is not None and numeric > self._max_id:
+            self._max_id = numeric
+        self._notify('upsert', key, record)
+
+    def _apply_delete(self, key):
+        record = self._records.pop(key, None)
+        if record is not None:
+            self._unindex(key, record)
+            del self._rank[key]
+            self._notify('delete', key, record)
+        return record
+
+    def _apply_clear(self):
+        self._records.clear()
+        self._rank.clear()
+        for index in self._indexes.values():
+            index.clear()
+        self._notify('clear')
+
+    # --- Filtres ---
+    def filter(self, **criteria):
+        """Enregistrements dont les champs valent exactement ``criteria`` (valeurs None ignorées)."""
+        criteria = {f: v for f, v in criteria.items() if v is not None}
+        if not criteria:
+            return self.all()
+        indexed = {f: v for f, v in criteria.items() if f in self._indexes and _indexable(v)}
+        others = {f: v for f, v in criteria.items() if f not in indexed}
+        if indexed:
+            buckets = sorted((self._indexes[f].get(v, {}) for f, v in indexed.items()), key=len)
+            smallest, rest = buckets[0], buckets[1:]
+            keys = [k for k in list(smallest) if all(k in b for b in rest)]
+            keys.sort(key=lambda k: self._rank.get(k, 0))
+            candidates = (self._records[k] for k in keys if k in self._records)
+        else:
+            candidates = iter(self.all())
+        return [r for r in candidates if all(r.get(f) == v for f, v in others.items())]
+
+    def _index(self, key, record):
+        for field in self.indexed_fields:
+            value = record.get(field)
+            if field in record and _indexable(value):
+                self._indexes[field][value][key] = None
+
+    def _unindex(self, key, record):
+        for field in self.indexed_fields:
+            value = record.get(field)
+            if field in record and _indexable(value):
+                bucket = self._indexes[field].get(value)
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del self._indexes[field][value]
+
+
+def sync_collections(*collections):
+    """Synchronise plusieurs collections avec une seule lecture de la version globale."""
+    bound = [c for c in collections if c.backend is not None]
+    if not bound:
+        return
+    latest = bound[0].backend.latest_version()
+    for collection in bound:
+        if collection.behind(latest):
+            collection.sync(latest)
+
+
+class SqlBackend:
+    """Stockage SQLAlchemy d'une collection : une ligne par enregistrement (JSON complet
+    plus colonnes indexées), un compteur d'identifiants et un journal des modifications
+    partagé par toutes les collections.
+    """
+
+    BATCH_SIZE = 500
+    # Nombre d'entrées conservées dans le journal ; un processus plus en retard recharge tout
+    LOG_RETENTION = 10000
+
+    def __init__(self, db, model, name, change_model, counter_model, indexed_fields=INDEXED_FIELDS):
+        self.db = db
+        self.model = model
+        self.name = name
+        self.change_model = change_model
+        self.counter_model = counter_model
+        self.indexed_fields = tuple(f for f in indexed_fields if hasattr(model, f))
+
+    @property
+    def session(self):
+        return self.db.session
+
+    def rollback(self):
+        self.session.rollback()
+
+    # --- Lecture ---
+    def count(self):
+        return self.session.scalar(select(func.count()).select_from(self.model))
+
+    def load_all(self):
+        rows = self.session.execute(select(self.model.data).order_by(self.model.row_id))
+        return [dict(data) for (data,) in rows]
+
+    def load(self, keys):
+        records = {}
+        for chunk in _chunks([str(k) for k in keys], self.BATCH_SIZE):
+            for (data,) in self.session.execute(select(self.model.data).where(self.model.id.in_(self._db_ids(chunk)))):
+                records[data['id']] = dict(data)
+        return records
+
+    def latest_version(self):
+        return self.session.scalar(select(func.max(self.change_model.id))) or 0
+
+    def changes_since(self, version, pending=()):
+        """Entrées ``(id, op, item_id)`` postérieures à ``version`` ou d'id dans ``pending``.
+
+        Les entrées des autres collections sont renvoyées avec ``op`` et ``item_id`` à None
+        (leur id n'est pas un trou). None si le journal a été purgé entre-temps.
+        """
+        table = self.change_model
+        oldest, newest = self.session.execute(select(func.min(table.id), func.max(table.id))).one()
+        # Ids absents en tête du journal : purgés s'ils sont assez anciens, sinon simples trous
+        if oldest is not None and oldest > version + 1 and version < newest - self.LOG_RETENTION:
+            return None
+        condition = table.id > version
+        if pending:
+            condition = condition | table.id.in_(list(pending))
+        rows = self.session.execute(select(table.id, table.collection, table.op, table.item_id)
+                                    .where(condition).order_by(table.id))
+        return [(change_id, op, item_id) if collection == self.name else (change_id, None, None)
+                for change_id, collection, op, item_id in rows]
+
+    def logged_ids(self, version):
+        """``(début, ids)`` : ids du journal dans ``]début, version]``, intervalle jamais purgé."""
+        table = self.change_model
+        start = max(0, version - self.LOG_RETENTION)
+        return start, set(self.session.scalars(select(table.id).where(table.id > start, table.id <= version)))
+
+    # --- Écriture ---
+    def _db_ids(self, keys):
+        column_type = self.model.id.type.python_type
+        return [column_type(k) for k in keys]
+
+    def _fill(self, row, record):
+        row.data = dict(record)
+        for field in self.indexed_fields:
+            value = record.get(field)
+            setattr(row, field, str(value) if _indexable(value) and value is not None else None)
+
+    def _log(self, op, item_ids):
+        """Journalise les opérations et renvoie l'intervalle ``(premier, dernier)`` de versions."""
+        changes = [self.change_model(collection=self.name, op=op, item_id=None if i is None else str(i))
+                   for i in item_ids]
+        self.session.add_all(changes)
+        self.session.flush()
+        first, last = changes[0].id, changes[-1].id
+        if last // 1000 != (first - 1) // 1000:
+            self.session.execute(self.change_model.__table__.delete()
+                                 .where(self.change_model.id <= last - self.LOG_RETENTION))
+        return first, last
+
+    def _commit(self, versions, before_commit=None):
+        try:
+            if before_commit is not None:
+                before_commit()
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return versions
+
+    def save(self, records, before_commit=None):
+        by_id = {record['id']: record for record in records}
+        if not by_id:
+            return None
+        existing = {}
+        for chunk in _chunks(self._db_ids(list(by_id)), self.BATCH_SIZE):
+            for row in self.session.scalars(select(self.model).where(self.model.id.in_(chunk))):
+                existing[row.id] = row
+        for key, record in by_id.items():
+            db_id = self._db_ids([key])[0]
+            row = existing.get(db_id)
+            if row is None:
+                row = self.model(id=db_id)
+                self.session.add(row)
+            self._fill(row, record)
+        self._bump(max((_numeric(k) or 0) for k in by_id))
+        return self._commit(self._log('upsert', list(by_id)), before_commit)
+
+    def delete(self, keys, before_commit=None):
+        for chunk in _chunks(self._db_ids(keys), self.BATCH_SIZE):
+            self.session.execute(self.model.__table__.delete().where(self.model.id.in_(chunk)))
+        return self._commit(self._log('delete', keys), before_commit)
+
+    def replace_all(self, records, before_commit=None):
+        self.session.execute(self.model.__table__.delete())
+        for chunk in _chunks(records, self.BATCH_SIZE):
+            rows = []
+            for record in chunk:
+                row = self.model(id=self._db_ids([record['id']])[0])
+                self._fill(row, record)
+                rows.append(row)
+            self.session.add_all(rows)
+            self.session.flush()
+        self._set_counter(max([_numeric(r['id']) or 0 for r in records], default=0))
+        return self._commit(self._log('clear', [None]), before_commit)
+
+    # --- Identifiants ---
+    def _counter_row(self):
+        counter = self.session.get(self.counter_model, self.name)
+        if counter is None:
+            self.session.add(self.counter_model(name=self.name, value=0))
+            try:
+                self.session.commit()
+            except IntegrityError:
+                self.session.rollback()
+
+    def allocate_ids(self, count):
+        """Premier identifiant d'un bloc de ``count`` (incrément atomique du compteur)."""
+        self._counter_row()
+        table = self.counter_model
+        self.session.execute(update(table).where(table.name == self.name).values(value=table.value + count))
+        value = self.session.scalar(select(table.value).where(table.name == self.name))
+        self._commit(None)
+        return value - count + 1
+
+    def _bump(self, at_least):
+        table = self.counter_model
+        self.session.execute(update(table).where(table.name == self.name, table.value < at_least).values(value=at_least))
+
+    def _set_counter(self, value):
+        table = self.counter_model
+        self.session.execute(update(table).where(table.name == self.name).values(value=value))
+
+    def ensure_ids_above(self, value):
+        self._counter_row()
+        self._bump(value)
+        self._commit(None)
@@ -0,0 +1,138 @@
+"""Résumés extractifs des documents et ressources (TextRank sur TF-IDF, NumPy).
+
+Les phrases d'un texte sont comparées deux à deux (cosinus TF-IDF, ``TermMatrix``) ;
+le graphe pondéré obtenu est classé par TextRank (itération de la puissance), et un
+résumé de ``n`` phrases reprend les ``n`` premières du classement dans l'ordre du texte.
+
+Le classement est calculé à l'écriture (abonnement aux collections), une fois par
+contenu : il est gardé sous l'empreinte du texte, si bien qu'une écriture qui ne touche
+pas au texte (tags, rejeu d'un autre worker, réimport) ne le recalcule pas. Un résumé
+demandé, de n'importe quelle longueur, n'est plus qu'une sélection de phrases.
+"""
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from search_index import tokenize
+from similarity import TermMatrix
+from translation import segment
+
+# Champs résumés, dans cet ordre
+TEXT_FIELDS = ('description', 'content')
+DEFAULT_SENTENCES = 3
+MAX_SENTENCES = 10
+# Au-delà, seules les premières phrases d'un document sont classées (graphe en O(n²))
+MAX_RANKED_SENTENCES = 400
+DAMPING = 0.85
+
+
+def record_text(record):
+    """Texte résumé d'un enregistrement : ses champs ``TEXT_FIELDS`` non vides."""
+    return '\n'.join(value.strip() for value in (record.get(field) for field in TEXT_FIELDS)
+                     if isinstance(value, str) and value.strip())
+
+
+def sentence_spans(text):
+    """Positions ``(début, fin)`` des phrases non vides de ``text``."""
+    spans, position = [], 0
+    for part, separator in segment(text):
+        core = part.strip()
+        if core:
+            start = position + len(part) - len(part.lstrip())
+            spans.append((start, start + len(core)))
+        position += len(part) + len(separator)
+    return spans
+
+
+def textrank(token_lists, damping=DAMPING, tolerance=1e-6, max_iterations=100):
+    """Score TextRank de chaque phrase (graphe des similarités cosinus TF-IDF)."""
+    n = len(token_lists)
+    if n <= 2:
+        return np.ones(n)
+    weights = np.zeros((n, n))
+    for i, j, score in TermMatrix(token_lists, metric='cosine').pairs():
+        weights[i, j] = weights[j, i] = score
+    totals = weights.sum(axis=1)
+    # Phrase isolée : elle redistribue son score uniformément
+    transition = np.where(totals[:, None] > 0, weights / np.where(totals > 0, totals, 1)[:, None], 1 / n)
+    scores = np.full(n, 1 / n)
+    for _ in range(max_iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+def rank_sentences(text):
+    """Phrases de ``text`` ``[(début, fin), ...]`` par importance décroissante."""
+    spans = sentence_spans(text)[:MAX_RANKED_SENTENCES]
+    scores = textrank([tokenize(text[start:end]) for start, end in spans])
+    # À score égal, la phrase la plus proche du début l'emporte
+    order = np.lexsort((np.arange(len(spans)), -np.round(scores, 9)))
+    return [spans[i] for i in order]
+
+
+class Summarizer:
+    """Classement des phrases de chaque enregistrement, tenu à jour à l'écriture (voir le module)."""
+
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self.counts = Counter()
+        self._docs = {}
+        self._rankings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def attach(self, collection, kind):
+        def listener(event, key, record):
+            if event == 'upsert':
+                self.add((kind, key), record)
+            elif event == 'delete':
+                with self._lock:
+                    self._docs.pop((kind, key), None)
+            elif event == 'clear':
+                with self._lock:
+                    for doc in [doc for doc in self._docs if doc[0] == kind]:
+                        del self._docs[doc]
+        collection.subscribe(listener)
+
+    def _ranking(self, digest, text):
+        # Classements gardés par contenu : un texte supprimé puis réimporté n'est pas reclassé
+        with self._lock:
+            ranking = self._rankings.get(digest)
+            if ranking is not None:
+                self._rankings.move_to_end(digest)
+                self.counts['reused'] += 1
+                return ranking
+        ranking = rank_sentences(text)
+        with self._lock:
+            self._rankings[digest] = ranking
+            while len(self._rankings) > self.cache_size:
+                self._rankings.popitem(last=False)
+            self.counts['computed'] += 1
+        return ranking
+
+    def add(self, doc, record):
+        text = record_text(record)
+        digest = hashlib.sha1(text.encode('utf-8')).digest()
+        with self._lock:
+            current = self._docs.get(doc)
+            if current is not None and current[0] == digest:
+                self.counts['unchanged'] += 1
+                return
+        ranking = self._ranking(digest, text)
+        with self._lock:
+            self._docs[doc] = (digest, text, ranking)
+
+    def summary(self, doc, sentences=DEFAULT_SENTENCES):
+        """Résumé de ``sentences`` phrases (dans l'ordre du texte) ; None pour un enregistrement inconnu."""
+        entry = self._docs.get(doc)
+        if entry is None:
+            return None
+        _, text, ranking = entry
+        return ' '.join(text[start:end] for start, end in sorted(ranking[:sentences]))
+
+    def __len__(self):
+        return len(self._docs)
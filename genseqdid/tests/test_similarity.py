@@ -0,0 +1,57 @@
+"""Quasi-doublons MinHash/LSH : paires tenues à jour à l'écriture, travail borné."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from similarity import MinHashIndex
+from store import Collection
+
+
+def _generated(count):
+    # Forme des séquences de _generate_sequences_job : corpus quasi uniforme
+    return [{"id": i, "titulo": f"Séquence auto {i}", "modalidad": "présentiel" if i % 2 == 0 else "en ligne"}
+            for i in range(1, count + 1)]
+
+
+def test_uniform_corpus_work_is_bounded():
+    sequences = Collection(id_type=int)
+    index = MinHashIndex()
+    index.attach(sequences, 'sequence')
+    sequences.extend(_generated(3000))
+    # Au plus max_candidates comparaisons par élément, quelle que soit la taille des seaux
+    assert index.comparisons <= 3000 * index.max_candidates
+    assert len(index._pairs) <= 3000 * index.max_candidates
+    started = time.perf_counter()
+    pairs = index.near_duplicates(0.5, limit=100)
+    assert time.perf_counter() - started < 1
+    assert len(pairs) == 100
+    assert all(score >= 0.5 for _, _, score in pairs)
+    # Une écriture de plus ne coûte pas davantage
+    before = index.comparisons
+    sequences.add({"id": 5000, "titulo": "Séquence auto 5000", "modalidad": "en ligne"})
+    assert index.comparisons - before <= index.max_candidates
+
+
+def test_pairs_follow_writes():
+    sequences = Collection(id_type=int)
+    resources = Collection(id_type=str)
+    index = MinHashIndex()
+    index.attach(sequences, 'sequence')
+    index.attach(resources, 'resource')
+    text = "Les enfants apprennent les couleurs et les nombres en langue maya avec des chansons"
+    sequences.extend([{"id": 1, "description": text},
+                      {"id": 2, "description": "Atelier de cuisine traditionnelle du Yucatán"}])
+    resources.add({"id": "r1", "content": text + " illustrées"})
+    pairs = index.near_duplicates(0.5)
+    assert [(a, b) for a, b, _ in pairs] == [(('resource', 'r1'), ('sequence', 1))]
+    assert index.near_duplicates(0.5, kinds={'sequence'}) == []
+    # Une modification qui éloigne les textes retire la paire
+    resources.update('r1', {"content": "Calendrier des fêtes de fin d'année"})
+    assert index.near_duplicates(0.5) == []
+    sequences.add({"id": 3, "description": text})
+    assert [(a, b, score) for a, b, score in index.near_duplicates(0.5)] == [
+        (('sequence', 1), ('sequence', 3), 1.0)]
+    sequences.delete(1)
+    assert index.near_duplicates(0.5) == []
+    assert index._partners[('sequence', 3)] == set()
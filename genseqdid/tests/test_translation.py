@@ -0,0 +1,78 @@
+"""Mémoire de traduction : une correspondance approchée n'est jamais servie comme traduction."""
+import os
+import sys
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from translation import Translator
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+db = SQLAlchemy(app)
+
+
+class TranslationUnit(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source_lang = db.Column(db.String(16), nullable=False)
+    target_lang = db.Column(db.String(16), nullable=False)
+    key_hash = db.Column(db.String(40), nullable=False)
+    source_text = db.Column(db.Text, nullable=False)
+    target_text = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.UniqueConstraint('source_lang', 'target_lang', 'key_hash'),)
+
+
+def _backend(segments, source, target):
+    return [f'<{segment}>' for segment in segments]
+
+
+@pytest.fixture
+def translator():
+    with app.app_context():
+        db.create_all()
+        translator = Translator(backend=_backend, fuzzy_threshold=0.9)
+        translator.init_app(db, TranslationUnit)
+        translator.store('fr', 'es', [
+            ("La classe commence à 8 heures et finit à midi.", "La clase empieza a las 8 y termina al mediodía."),
+            ("Les élèves ne doivent pas parler pendant la lecture.", "Los alumnos no deben hablar durante la lectura."),
+            ("Les enfants chantent une chanson en langue maya.", "Los niños cantan una canción en lengua maya."),
+        ])
+        yield translator
+        db.session.remove()
+        db.drop_all()
+
+
+def test_different_number_goes_to_backend(translator):
+    text = "La classe commence à 9 heures et finit à midi."
+    translation, details = translator.translate(text, 'fr', 'es')
+    assert translation == f'<{text}>'
+    # Nombres différents : la phrase stockée n'est même pas proposée
+    assert details == [(text, f'<{text}>', 'backend', None)]
+
+
+def test_dropped_negation_goes_to_backend(translator):
+    text = "Les élèves doivent parler pendant la lecture."
+    translation, details = translator.translate(text, 'fr', 'es')
+    assert translation == f'<{text}>'
+    assert details[0][2:] == ('backend', None)
+
+
+def test_close_match_is_only_a_suggestion(translator):
+    text = "Les enfants chantent une chanson en langue maya !"
+    translation, details = translator.translate(text, 'fr', 'es')
+    assert translation == f'<{text}>'
+    (_, _, origin, suggestion), = details
+    assert origin == 'backend'
+    assert suggestion['source'] == "Les enfants chantent une chanson en langue maya."
+    assert suggestion['translation'] == "Los niños cantan una canción en lengua maya."
+    assert 0.9 <= suggestion['score'] < 1
+    assert translator.stats()['fuzzy_suggestions'] == 1
+
+
+def test_exact_match_is_served(translator):
+    translation, details = translator.translate("Les  enfants chantent une chanson en langue maya.", 'fr', 'es')
+    assert translation == "Los niños cantan una canción en lengua maya."
+    assert details[0][2] in ('lru', 'memory')
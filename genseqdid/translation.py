@@ -0,0 +1,339 @@
+"""Couche de traduction : mémoire de traduction persistante, LRU et appel groupé au moteur.
+
+Un texte est découpé en phrases ; chaque phrase, normalisée (casse, espaces,
+apostrophes), est cherchée dans l'ordre :
+
+1. le LRU du processus (phrases récentes) ;
+2. la mémoire de traduction en base (correspondance exacte, partagée entre workers) ;
+
+et seules les phrases restantes sont envoyées au moteur, en un seul appel. Ses
+traductions sont ensuite enregistrées en base pour tous les workers.
+
+Une phrase proche mais différente (trigrammes de caractères, similarité de Dice ≥
+``fuzzy_threshold``) n'est jamais servie comme traduction : « 8 heures » et « 9 heures »,
+ou une phrase et sa négation, sont très proches. La traduction stockée est seulement
+proposée comme suggestion, avec son score, et seulement si les nombres et les mots de
+négation des deux phrases sont identiques.
+
+Chaque entrée porte sa date de dernière écriture (``updated_at``) : au plus une fois par
+``refresh_interval`` secondes, un worker relit les entrées ajoutées ou corrigées depuis
+son dernier passage et les reporte dans son LRU et sa mémoire approchée. Une correction
+faite sur un worker est ainsi visible partout sans recharger la mémoire approchée.
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+import urllib.request
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+_APOSTROPHES = str.maketrans({c: "'" for c in "’‘ʼʻ´`′"})
+# Fin de phrase suivie d'espaces, ou saut de ligne : séparateurs conservés tels quels
+_SEGMENT_RE = re.compile(r'((?<=[.!?…;])\s+|\s*\n\s*)')
+SOURCES = ('lru', 'memory', 'backend')
+_DIGITS_RE = re.compile(r'\d+')
+_WORD_RE = re.compile(r"[^\W\d_]+'?")
+# Négations (français, espagnol, anglais, maya) : une suggestion doit porter les mêmes
+_NEGATIONS = frozenset("""
+    ne n' pas jamais rien aucun aucune nul nulle ni sans
+    no nunca nada ningún ninguno ninguna jamás tampoco sin
+    not never none nothing nor don't doesn't didn't isn't aren't can't won't
+    ma ma' mix mixba' mixmáak
+""".split())
+# Relecture des dernières secondes déjà vues : écritures validées dans le désordre, horloges décalées
+CATCH_UP_OVERLAP = timedelta(seconds=5)
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def segment(text):
+    """Découpe ``text`` en ``[(phrase, séparateur), ...]`` ; leur concaténation redonne le texte."""
+    parts = _SEGMENT_RE.split(text)
+    parts.append('')
+    return [(parts[i], parts[i + 1]) for i in range(0, len(parts) - 1, 2)]
+
+
+def normalize(text):
+    """Clé de la mémoire : Unicode composé, apostrophes unifiées, minuscules, espaces réduits."""
+    text = unicodedata.normalize('NFC', text.translate(_APOSTROPHES))
+    return ' '.join(text.casefold().split())
+
+
+def _invariants(key):
+    """Nombres et négations d'une phrase normalisée : ils doivent coïncider pour une suggestion."""
+    return _DIGITS_RE.findall(key), {word for word in _WORD_RE.findall(key) if word in _NEGATIONS}
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _restore_case(source, translation):
+    # La mémoire ignore la casse : une phrase en majuscule initiale garde sa majuscule
+    if source[:1].isupper() and translation[:1].islower():
+        return translation[:1].upper() + translation[1:]
+    return translation
+
+
+def mock_backend(segments, source, target):
+    """Moteur de démonstration (texte inversé)."""
+    return [f"[{source}->{target}] {text[::-1]}" for text in segments]
+
+
+def http_backend(url, timeout=30):
+    """Moteur HTTP : POST ``{"segments", "source", "target"}`` → ``{"translations": [...]}``."""
+    def backend(segments, source, target):
+        body = json.dumps({"segments": segments, "source": source, "target": target}).encode('utf-8')
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            translations = json.load(response)['translations']
+        if len(translations) != len(segments):
+            raise ValueError("Réponse du moteur de traduction incomplète")
+        return translations
+    return backend
+
+
+class _FuzzyIndex:
+    """Trigrammes des phrases en mémoire d'une paire de langues ; une phrase déjà présente est corrigée."""
+
+    def __init__(self):
+        self.entries = []
+        self.positions = {}
+        self.postings = {}
+
+    def add(self, key, source, translation):
+        position = self.positions.get(key)
+        if position is not None:
+            self.entries[position] = self.entries[position][:2] + (translation,)
+            return
+        grams = _trigrams(key)
+        position = self.positions[key] = len(self.entries)
+        self.entries.append((grams, source, translation))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(position)
+
+    def best(self, key, threshold):
+        """``(source, traduction, score)`` de l'entrée la plus proche aux mêmes nombres et négations, ou None."""
+        grams = _trigrams(key)
+        if not grams:
+            return None
+        # Dice ≥ t impose au moins ceil(n·t/(2-t)) trigrammes communs : il suffit de chercher
+        # les candidats parmi les n - min + 1 trigrammes les plus rares (filtrage par préfixe)
+        required = math.ceil(len(grams) * threshold / (2 - threshold))
+        rare = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))[:len(grams) - required + 1]
+        candidates = {position for gram in rare for position in self.postings.get(gram, ())}
+        scored = []
+        for position in candidates:
+            other = self.entries[position][0]
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= threshold:
+                scored.append((score, position))
+        invariants = _invariants(key)
+        for score, position in sorted(scored, reverse=True):
+            _, source, translation = self.entries[position]
+            if _invariants(normalize(source)) == invariants:
+                return source, translation, score
+        return None
+
+
+class Translator:
+    """Traduction avec mémoire : voir le module. ``backend(segments, source, target)`` traduit un lot."""
+
+    def __init__(self, backend=mock_backend, lru_size=10000, lru_ttl=300, fuzzy_threshold=0.9,
+                 refresh_interval=1):
+        self.backend = backend
+        self.lru_size = lru_size
+        self.lru_ttl = lru_ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        # Délai maximal de propagation d'une correction faite sur un autre worker
+        self.refresh_interval = refresh_interval
+        self.db = self.model = None
+        self.counts = Counter()
+        self._lru = OrderedDict()
+        self._fuzzy = {}
+        # Par paire de langues : (dernière date d'écriture vue, prochaine relecture)
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, db, model):
+        self.db, self.model = db, model
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _remember(self, pair, key, translation):
+        with self._lock:
+            self._lru[pair + (key,)] = (translation, time.monotonic() + self.lru_ttl)
+            self._lru.move_to_end(pair + (key,))
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _rows(self, pair, since=None):
+        query = (self.db.select(self.model.source_text, self.model.target_text, self.model.updated_at)
+                 .filter_by(source_lang=pair[0], target_lang=pair[1]))
+        if since is not None:
+            query = query.where(self.model.updated_at >= since - CATCH_UP_OVERLAP)
+        return self.db.session.execute(query).all()
+
+    def _catch_up(self, pair):
+        """Reporte dans le LRU et la mémoire approchée les entrées écrites depuis le dernier passage."""
+        now = time.monotonic()
+        with self._lock:
+            seen, due = self._seen.get(pair, (None, 0))
+            if now < due:
+                return
+            # Premier passage : seules les écritures à venir comptent, la mémoire approchée se charge à part
+            self._seen[pair] = (seen or _now(), now + self.refresh_interval)
+        if seen is None:
+            return
+        rows = self._rows(pair, seen)
+        with self._lock:
+            index = self._fuzzy.get(pair)
+            for source_text, target_text, updated_at in rows:
+                key = pair + (normalize(source_text),)
+                entry = self._lru.get(key)
+                if entry is not None and entry[0] != target_text:
+                    self._lru[key] = (target_text, entry[1])
+                if index is not None:
+                    index.add(key[2], source_text, target_text)
+                seen = max(seen, updated_at)
+            self._seen[pair] = (seen, self._seen[pair][1])
+
+    def _fuzzy_index(self, pair):
+        # Chargée une fois par processus, puis tenue à jour par ``_catch_up``
+        with self._lock:
+            index = self._fuzzy.get(pair)
+        if index is not None:
+            return index
+        started = _now()
+        rows = self._rows(pair)
+        with self._lock:
+            if pair in self._fuzzy:
+                return self._fuzzy[pair]
+            index = self._fuzzy[pair] = _FuzzyIndex()
+            for source_text, target_text, _ in rows:
+                index.add(normalize(source_text), source_text, target_text)
+            # Écritures faites pendant le chargement : reprises au prochain rattrapage
+            seen, due = self._seen.get(pair, (started, 0))
+            self._seen[pair] = (min(seen, started), due)
+        return index
+
+    def store(self, source, target, pairs, replace=False):
+        """Enregistre ``[(texte source, traduction), ...]`` ; ``replace`` corrige les entrées existantes."""
+        by_hash = {}
+        for text, translation in pairs:
+            key = normalize(text)
+            if key:
+                by_hash[self._hash(key)] = (key, text, translation)
+        if not by_hash:
+            return 0
+        existing = {row.key_hash: row for row in self.model.query.filter(
+            self.model.source_lang == source, self.model.target_lang == target,
+            self.model.key_hash.in_(list(by_hash)))}
+        for key_hash, (key, text, translation) in by_hash.items():
+            row = existing.get(key_hash)
+            if row is None:
+                self.db.session.add(self.model(source_lang=source, target_lang=target, key_hash=key_hash,
+                                               source_text=text, target_text=translation, updated_at=_now()))
+            elif replace and row.target_text != translation:
+                row.target_text, row.updated_at = translation, _now()
+                with self._lock:
+                    index = self._fuzzy.get((source, target))
+                    if index is not None:
+                        index.add(key, text, translation)
+            else:
+                translation = row.target_text
+            self._remember((source, target), key, translation)
+        try:
+            self.db.session.commit()
+        except IntegrityError:
+            # Même phrase enregistrée au même moment par un autre worker
+            self.db.session.rollback()
+        return len(by_hash)
+
+    def translate(self, text, source, target):
+        """Renvoie ``(traduction, [(phrase, traduction, origine, suggestion), ...])``.
+
+        ``suggestion`` vaut ``{"source", "translation", "score"}`` (entrée approchée de la
+        mémoire) pour une phrase traduite par le moteur, sinon None.
+        """
+        pair = (source, target)
+        self._catch_up(pair)
+        parts = segment(text)
+        keys = {}
+        for part, _ in parts:
+            core = part.strip()
+            if core:
+                keys.setdefault(normalize(core), core)
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._lru.get(pair + (key,))
+                if entry is not None and entry[1] > now:
+                    self._lru.move_to_end(pair + (key,))
+                    found[key] = (entry[0], 'lru')
+        missing = [key for key in keys if key not in found]
+        if missing:
+            hashes = {self._hash(key): key for key in missing}
+            rows = self.model.query.filter(self.model.source_lang == source, self.model.target_lang == target,
+                                           self.model.key_hash.in_(list(hashes)))
+            for row in rows:
+                found[hashes[row.key_hash]] = (row.target_text, 'memory')
+                self._remember(pair, hashes[row.key_hash], row.target_text)
+            missing = [key for key in missing if key not in found]
+        suggestions = {}
+        if missing and self.fuzzy_threshold < 1:
+            # Proposées à côté de la traduction du moteur, jamais à sa place (voir le module)
+            index = self._fuzzy_index(pair)
+            for key in missing:
+                match = index.best(key, self.fuzzy_threshold)
+                if match is not None:
+                    suggestions[key] = {"source": match[0], "translation": match[1], "score": round(match[2], 4)}
+        if missing:
+            translations = self.backend([keys[key] for key in missing], source, target)
+            for key, translation in zip(missing, translations):
+                found[key] = (translation, 'backend')
+            self.store(source, target, [(keys[key], translation) for key, translation in zip(missing, translations)])
+
+        output, details = [], []
+        counts = Counter(backend_calls=1 if missing else 0, fuzzy_suggestions=len(suggestions))
+        for part, separator in parts:
+            core = part.strip()
+            if not core:
+                output.append(part + separator)
+                continue
+            key = normalize(core)
+            translation, origin = found[key]
+            translation = _restore_case(core, translation)
+            counts[origin] += 1
+            lead = part[:len(part) - len(part.lstrip())]
+            trail = part[len(part.rstrip()):]
+            output.append(lead + translation + trail + separator)
+            details.append((core, translation, origin, suggestions.get(key)))
+        with self._lock:
+            self.counts.update(counts)
+        return ''.join(output), details
+
+    def stats(self):
+        with self._lock:
+            counts = Counter(self.counts)
+        total = sum(counts[source] for source in SOURCES)
+        return {
+            "segments": total,
+            **{source: counts[source] for source in SOURCES},
+            "backend_calls": counts['backend_calls'],
+            "fuzzy_suggestions": counts['fuzzy_suggestions'],
+            "hit_rate": round(1 - counts['backend'] / total, 4) if total else None,
+            "lru_size": len(self._lru),
+        }
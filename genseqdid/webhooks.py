@@ -0,0 +1,349 @@
+"""Webhooks sortants : file d'envoi en base, envoi groupé en arrière-plan, reprises et lettres mortes.
+
+Les écritures sur les collections attachées (``attach``) inscrivent leurs événements
+dans la table des envois (une ligne par événement et par destination) dans la
+transaction même de l'écriture : un événement existe si et seulement si l'écriture a
+été validée, même si le worker s'arrête juste après. Aucun envoi HTTP n'a lieu pendant
+la requête : un thread par processus réclame les lignes dues — de n'importe quel
+worker — et les envoie par lots de ``batch_size`` événements par destination, sur des
+connexions HTTP keep-alive réutilisées. Le thread passe toutes les ``interval``
+secondes, ou plus tôt dès qu'un lot complet a été inscrit : les écritures rapprochées
+partent ensemble.
+
+Un lot refusé (statut non 2xx, erreur réseau) est retenté après un délai qui double à
+chaque tentative (``backoff`` × 2^n, plafonné à ``max_backoff``, avec une part
+aléatoire) ; après ``max_attempts`` tentatives ses événements passent au statut
+``dead`` (lettres mortes), d'où ``retry_dead`` peut les remettre en file. La livraison
+est « au moins une fois » : chaque événement porte un ``id`` unique pour dédoublonner.
+
+Récepteur de test local, qui affiche les lots reçus (``--fail-rate`` : part de refus) :
+
+    python webhooks.py receive --port 8765 --fail-rate 0.3
+"""
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import random
+import secrets
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from sqlalchemy import delete, insert, select, update
+
+PENDING, DEAD = 'pending', 'dead'
+OUTCOMES = ('delivered', 'failed', 'dead')
+SIGNATURE_HEADER = 'X-Genseqdid-Signature'
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def sign(secret, body):
+    """Signature HMAC-SHA256 d'un corps de requête, au format ``sha256=<hex>``."""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class HttpPool:
+    """Connexions keep-alive réutilisables, par (schéma, hôte, port)."""
+
+    def __init__(self, timeout=10, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, host, port):
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout)
+
+    def post(self, url, body, headers):
+        """Envoie ``body`` ; renvoie le statut HTTP (lève ``OSError``/``HTTPException`` en cas d'échec réseau)."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(*key)
+            try:
+                conn.request('POST', path, body, headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if reused:
+                    # Connexion inactive fermée par le serveur entre-temps : un seul nouvel essai
+                    conn, reused = None, False
+                    continue
+                raise
+            break
+        if response.will_close:
+            conn.close()
+        else:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+        return response.status
+
+
+class WebhookDispatcher:
+    """Envoi des événements aux abonnements enregistrés (voir le module)."""
+
+    def __init__(self, batch_size=50, max_attempts=10, backoff=2.0, max_backoff=3600.0, senders=4,
+                 timeout=10, interval=1.0, lease=60.0, claim_size=500):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.senders = senders
+        self.interval = interval
+        # Une ligne réclamée par un worker arrêté en cours d'envoi redevient due après ``lease`` secondes
+        self.lease = lease
+        self.claim_size = claim_size
+        self.pool = HttpPool(timeout=timeout)
+        self.app = self.db = self.subscription_model = self.delivery_model = None
+        self.counts = Counter()
+        # Événements inscrits par ce processus depuis le dernier tour d'envoi
+        self._emitted = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pid = None
+        self._executor = None
+
+    def init_app(self, app, db, subscription_model, delivery_model):
+        self.app, self.db = app, db
+        self.subscription_model, self.delivery_model = subscription_model, delivery_model
+
+    def attach(self, collection, kind):
+        """Émet ``<kind>.upserted`` / ``.deleted`` / ``.cleared`` pour les écritures locales de ``collection``.
+
+        Les événements sont inscrits dans la transaction de l'écriture : les écritures des
+        autres workers, rejouées par ``sync``, ne passent pas par ici.
+        """
+        def hook(event, items):
+            if event == 'upsert':
+                self.emit_many(f'{kind}.upserted', [{"id": record['id'], "record": record} for record in items])
+            elif event == 'delete':
+                self.emit_many(f'{kind}.deleted', [{"id": key} for key in items])
+            elif event == 'clear':
+                self.emit_many(f'{kind}.cleared', [{}])
+        collection.before_commit(hook)
+
+    def emit(self, event, data):
+        """Inscrit un événement dans la session courante ; il part quand l'appelant valide la transaction."""
+        self.emit_many(event, [data])
+
+    def emit_many(self, event, items):
+        model = self.subscription_model
+        subscriptions = [subscription_id for subscription_id, events in self.db.session.execute(
+            select(model.id, model.events).where(model.active.is_(True)))
+            if not events or event in events or event.split('.', 1)[0] in events]
+        if not subscriptions or not items:
+            return
+        now = _now()
+        rows = []
+        for data in items:
+            event_id = secrets.token_hex(12)
+            rows.extend({"subscription_id": subscription_id, "event_id": event_id, "event": event, "payload": data,
+                         "status": PENDING, "attempts": 0, "next_attempt_at": now, "created_at": now}
+                        for subscription_id in subscriptions)
+        self.db.session.execute(insert(self.delivery_model), rows)
+        with self._lock:
+            self._emitted += len(items)
+
+    def wake(self):
+        """Démarre le thread d'envoi du processus si besoin ; le réveille si un lot complet a été inscrit."""
+        self._ensure_thread()
+        if self._emitted >= self.batch_size:
+            with self._lock:
+                self._wakeup.notify()
+
+    def _ensure_thread(self):
+        # Thread (re)démarré dans chaque processus, y compris après un fork de worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix='webhook-sender')
+                threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._emitted < self.batch_size:
+                    self._wakeup.wait(self.interval)
+                self._emitted = 0
+            with self.app.app_context():
+                try:
+                    # Tant qu'il reste des lignes dues, les tours s'enchaînent sans attente
+                    while self.run_once() >= self.claim_size:
+                        pass
+                except Exception:
+                    traceback.print_exc()
+                    self.db.session.rollback()
+                finally:
+                    self.db.session.remove()
+
+    # --- Un tour d'envoi (appelable directement, dans un contexte d'application) ---
+    def run_once(self):
+        """Envoie les lignes dues ; renvoie le nombre de lignes traitées."""
+        rows = self._claim()
+        if not rows:
+            return 0
+        subscriptions = {s.id: s for s in self.db.session.scalars(
+            select(self.subscription_model).where(self.subscription_model.id.in_({r.subscription_id for r in rows})))}
+        batches, orphans = [], []
+        by_subscription = {}
+        for row in rows:
+            if row.subscription_id in subscriptions:
+                by_subscription.setdefault(row.subscription_id, []).append(row)
+            else:
+                orphans.append(row.id)
+        for subscription_id, items in by_subscription.items():
+            for start in range(0, len(items), self.batch_size):
+                batches.append((subscriptions[subscription_id], items[start:start + self.batch_size]))
+        executor = self._executor or ThreadPoolExecutor(max_workers=self.senders)
+        try:
+            results = list(executor.map(lambda batch: self._send(*batch), batches))
+        finally:
+            if executor is not self._executor:
+                executor.shutdown()
+        delivered, failed = [], []
+        for (_, items), error in zip(batches, results):
+            (failed if error else delivered).append((items, error))
+        self._record(delivered, failed, orphans)
+        return len(rows)
+
+    def _claim(self):
+        model = self.delivery_model
+        now = _now()
+        due = [row_id for (row_id,) in self.db.session.execute(
+            select(model.id).where(model.status == PENDING, model.next_attempt_at <= now)
+            .order_by(model.id).limit(self.claim_size))]
+        if not due:
+            return []
+        # Réclamation conditionnelle : une ligne prise entre-temps par un autre worker n'est pas reprise
+        token = secrets.token_hex(8)
+        self.db.session.execute(
+            update(model).where(model.id.in_(due), model.status == PENDING, model.next_attempt_at <= now)
+            .values(claim=token, next_attempt_at=now + timedelta(seconds=self.lease)))
+        self.db.session.commit()
+        return list(self.db.session.scalars(select(model).where(model.claim == token).order_by(model.id)))
+
+    def _send(self, subscription, items):
+        body = json.dumps({"events": [{"id": row.event_id, "type": row.event, "created": row.created_at.isoformat() + 'Z',
+                                       "data": row.payload} for row in items]},
+                          ensure_ascii=False, default=str).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'User-Agent': 'genseqdid-webhooks'}
+        if subscription.secret:
+            headers[SIGNATURE_HEADER] = sign(subscription.secret, body)
+        try:
+            status = self.pool.post(subscription.url, body, headers)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            return f"{e.__class__.__name__}: {e}"
+        return None if 200 <= status < 300 else f"HTTP {status}"
+
+    def _delay(self, attempts):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * (0.5 + random.random() / 2)
+
+    def _record(self, delivered, failed, orphans):
+        model = self.delivery_model
+        done = [row.id for items, _ in delivered for row in items] + orphans
+        if done:
+            # La table ne garde que les envois en attente et les lettres mortes
+            self.db.session.execute(delete(model).where(model.id.in_(done)))
+        now = _now()
+        dead = 0
+        for items, error in failed:
+            for row in items:
+                row.attempts += 1
+                row.claim = None
+                row.last_error = error[:500]
+                if row.attempts >= self.max_attempts:
+                    row.status = DEAD
+                    dead += 1
+                else:
+                    row.next_attempt_at = now + timedelta(seconds=self._delay(row.attempts))
+        self.db.session.commit()
+        with self._lock:
+            self.counts['delivered'] += len(done) - len(orphans)
+            self.counts['failed'] += sum(len(items) for items, _ in failed) - dead
+            self.counts['dead'] += dead
+
+    # --- Lettres mortes ---
+    def retry_dead(self, ids=None):
+        """Remet en file les lettres mortes (toutes, ou celles de ``ids``) ; renvoie leur nombre."""
+        model = self.delivery_model
+        query = update(model).where(model.status == DEAD)
+        if ids is not None:
+            query = query.where(model.id.in_(ids))
+        result = self.db.session.execute(query.values(status=PENDING, attempts=0, claim=None, next_attempt_at=_now()))
+        self.db.session.commit()
+        if result.rowcount:
+            self._ensure_thread()
+            with self._lock:
+                self._wakeup.notify()
+        return result.rowcount
+
+
+# --- Récepteur de test ---
+def _receiver(fail_rate, secret):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if secret and not hmac.compare_digest(self.headers.get(SIGNATURE_HEADER, ''), sign(secret, body)):
+                status = 401
+            else:
+                status = 503 if random.random() < fail_rate else 200
+            events = json.loads(body or b'{}').get('events', [])
+            summary = ', '.join(f"{event['id']}:{event['type']}" for event in events[:10])
+            print(f"{status} {len(events)} événement(s) : {summary}" + (' ...' if len(events) > 10 else ''), flush=True)
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhooks genseqdid")
+    commands = parser.add_subparsers(dest='command', required=True)
+    receive = commands.add_parser('receive', help="récepteur de test qui affiche les lots reçus")
+    receive.add_argument('--host', default='127.0.0.1')
+    receive.add_argument('--port', type=int, default=8765)
+    receive.add_argument('--fail-rate', type=float, default=0.0, help="part des lots refusés (503)")
+    receive.add_argument('--secret', help="vérifie la signature des lots avec ce secret")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), _receiver(args.fail_rate, args.secret))
+    print(f"Récepteur de webhooks sur http://{args.host}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()